@@ -0,0 +1,147 @@
+"""Statistiques sur les evaluations a partir de colonnes NumPy en memoire
+
+Les evaluations sont lues une fois (au demarrage de l'API) dans des colonnes typees
+(int32 userId/movieId/timestamp, float32 rating), depuis SQLite ou, avec MOVIELENS_BACKEND=snapshot,
+directement (sans copie) depuis l'instantane Arrow mappe en memoire; les agregations sont
+calculees avec bincount au lieu de parcourir la table avec l'ORM.
+"""
+import numpy as np
+
+import database
+import http_cache
+from arrays import read_columns
+
+RATING_STEPS = 10 # notes de 0.5 a 5.0
+
+
+class RatingColumns:
+    """Colonnes de la table ratings et pont film -> genre, avec les resultats d'agregation mis en cache"""
+
+    def __init__(self, user_ids, movie_ids, ratings, timestamps, genres, genre_movie_ids):
+        self.user_ids, self.movie_ids, self.ratings, self.timestamps = user_ids, movie_ids, ratings, timestamps
+        self.genre_movie_ids = genre_movie_ids
+        self.genre_names, self.genre_codes = np.unique(genres.astype(str), return_inverse=True)
+        # films et utilisateurs distincts, et position de chaque evaluation dans ces listes (pour bincount)
+        self.movies, self.movie_index = np.unique(self.movie_ids, return_inverse=True)
+        self.users, self.user_index = np.unique(self.user_ids, return_inverse=True)
+        self._cache = {}
+
+    @classmethod
+    def from_database(cls, engine):
+        ratings = read_columns(
+            engine,
+            "SELECT userId, movieId, rating, timestamp FROM ratings",
+            [np.int32, np.int32, np.float32, np.int32],
+        )
+        genres = read_columns(engine, "SELECT genre, movieId FROM movie_genres", [object, np.int32])
+        return cls(*ratings, *genres)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # colonnes numeriques de l'instantane: memes dtypes, donc lues sans copie (une copie par table si plusieurs batches)
+        ratings = snapshot.tables["ratings"]
+        genres = snapshot.tables["movie_genres"]
+        return cls(
+            *(ratings.column(name).to_numpy() for name in ("userId", "movieId", "rating", "timestamp")),
+            genres.column("genre").to_numpy(zero_copy_only=False),
+            genres.column("movieId").to_numpy(),
+        )
+
+    def _cached(self, name, compute):
+        # les donnees ne changent pas entre deux chargements: chaque agregat est calcule une seule fois
+        if name not in self._cache:
+            self._cache[name] = compute()
+        return self._cache[name]
+
+    def summary(self):
+        return self._cached("summary", lambda: {
+            "rating_count": int(len(self.ratings)),
+            "user_count": int(len(self.users)),
+            "rated_movie_count": int(len(self.movies)),
+            "rating_mean": float(self.ratings.mean()) if len(self.ratings) else None,
+            "first_timestamp": int(self.timestamps.min()) if len(self.timestamps) else None,
+            "last_timestamp": int(self.timestamps.max()) if len(self.timestamps) else None,
+        })
+
+    def histogram(self):
+        def compute():
+            steps = np.rint(self.ratings * 2).astype(np.int64).clip(1, RATING_STEPS) - 1
+            counts = np.bincount(steps, minlength=RATING_STEPS)
+            return [{"rating": (step + 1) / 2, "count": int(count)} for step, count in enumerate(counts)]
+        return self._cached("histogram", compute)
+
+    def per_movie(self):
+        # nombre et somme des notes de chaque film (l'ordre des colonnes n'a pas d'importance)
+        return self._cached("per_movie", lambda: (
+            np.bincount(self.movie_index, minlength=len(self.movies)),
+            np.bincount(self.movie_index, weights=self.ratings, minlength=len(self.movies)),
+        ))
+
+    def by_genre(self):
+        def compute():
+            counts, sums = self.per_movie()
+            if not len(self.movies):
+                return []
+            # associer chaque ligne du pont film -> genre a l'agregat du film (s'il a des evaluations)
+            positions = np.searchsorted(self.movies, self.genre_movie_ids).clip(max=len(self.movies) - 1)
+            rated = self.movies[positions] == self.genre_movie_ids
+            n_genres = len(self.genre_names)
+            genre_counts = np.bincount(self.genre_codes[rated], weights=counts[positions[rated]], minlength=n_genres)
+            genre_sums = np.bincount(self.genre_codes[rated], weights=sums[positions[rated]], minlength=n_genres)
+            return sorted(
+                (
+                    {"genre": str(genre), "rating_count": int(count), "rating_mean": float(total / count)}
+                    for genre, count, total in zip(self.genre_names, genre_counts, genre_sums)
+                    if count
+                ),
+                key=lambda row: -row["rating_count"],
+            )
+        return self._cached("by_genre", compute)
+
+    def by_year(self):
+        def compute():
+            if not len(self.timestamps):
+                return []
+            years = self.timestamps.astype("datetime64[s]").astype("datetime64[Y]").astype(np.int64) + 1970
+            first = years.min()
+            counts = np.bincount(years - first)
+            sums = np.bincount(years - first, weights=self.ratings)
+            return [
+                {"year": int(first + offset), "rating_count": int(count), "rating_mean": float(sums[offset] / count)}
+                for offset, count in enumerate(counts)
+                if count
+            ]
+        return self._cached("by_year", compute)
+
+    def per_user(self):
+        return self._cached("per_user", lambda: (
+            np.bincount(self.user_index, minlength=len(self.users)),
+            np.bincount(self.user_index, weights=self.ratings, minlength=len(self.users)),
+        ))
+
+    def top_users(self, limit: int = 10):
+        counts, sums = self.per_user()
+        limit = min(limit, len(counts))
+        if not limit:
+            return []
+        top = np.argpartition(-counts, limit - 1)[:limit]
+        top = top[np.lexsort((self.users[top], -counts[top]))]
+        return [
+            {"userId": int(self.users[i]), "rating_count": int(counts[i]), "rating_mean": float(sums[i] / counts[i])}
+            for i in top
+        ]
+
+
+_columns = {"version": None, "data": None}
+
+def get_analytics() -> RatingColumns:
+    # colonnes rechargees seulement si la version du jeu de donnees a change (nouveau chargement de movies.db)
+    version, _ = http_cache.dataset_version()
+    if _columns["data"] is None or version != _columns["version"]:
+        if database.BACKEND == "snapshot":
+            import snapshot
+            data = RatingColumns.from_snapshot(snapshot.get_snapshot())
+        else:
+            data = RatingColumns.from_database(database.engine)
+        _columns.update(version=version, data=data)
+    return _columns["data"]
@@ -0,0 +1,18 @@
+"""Lecture de tables SQLite dans des colonnes NumPy typees"""
+import numpy as np
+
+READ_CHUNK_SIZE = 1_000_000
+
+
+def read_columns(engine, sql: str, dtypes, chunk_size: int = READ_CHUNK_SIZE):
+    # lire le resultat de `sql` par paquets de lignes et retourner un tableau numpy par colonne (un dtype par colonne)
+    chunks = [[] for _ in dtypes]
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(sql)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            for chunk, values, dtype in zip(chunks, zip(*rows), dtypes):
+                chunk.append(np.array(values, dtype=dtype))
+    return [np.concatenate(chunk) if chunk else np.empty(0, dtype=dtype) for chunk, dtype in zip(chunks, dtypes)]
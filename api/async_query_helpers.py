@@ -0,0 +1,57 @@
+"""Async versions of the query functions for MovieLens API """
+# chaque fonction execute la fonction synchrone de query_helpers avec AsyncSession.run_sync:
+# la logique des requetes reste a un seul endroit et les acces a la base sont attendus sur la boucle d'evenements (aiosqlite)
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import query_helpers as helpers
+
+
+def run_sync(helper):
+    # transformer une fonction helper(db, ...) en coroutine helper(async_db, ...)
+    @functools.wraps(helper)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(helper, *args, **kwargs)
+    return wrapper
+
+
+# --- Films ---
+get_movie = run_sync(helpers.get_movie)
+get_movies = run_sync(helpers.get_movies)
+get_movies_page = run_sync(helpers.get_movies_page)
+search_movies = run_sync(helpers.search_movies)
+get_movies_batch = run_sync(helpers.get_movies_batch)
+get_movie_view = run_sync(helpers.get_movie_view)
+
+# --- Statistiques par film ---
+get_movie_stats = run_sync(helpers.get_movie_stats)
+get_top_movies = run_sync(helpers.get_top_movies)
+
+# --- Evaluations (Ratings) ---
+get_rating = run_sync(helpers.get_rating)
+get_ratings = run_sync(helpers.get_ratings)
+get_user_rated_movie_ids = run_sync(helpers.get_user_rated_movie_ids)
+get_ratings_page = run_sync(helpers.get_ratings_page)
+
+# --- Tags ---
+get_tag = run_sync(helpers.get_tag)
+get_tags = run_sync(helpers.get_tags)
+get_tags_page = run_sync(helpers.get_tags_page)
+autocomplete_tags = run_sync(helpers.autocomplete_tags)
+get_movies_with_tag = run_sync(helpers.get_movies_with_tag)
+get_movie_top_tags = run_sync(helpers.get_movie_top_tags)
+
+# --- Links ---
+get_link = run_sync(helpers.get_link)
+get_links = run_sync(helpers.get_links)
+get_links_page = run_sync(helpers.get_links_page)
+
+# ---Requetes analytiques ---
+get_movie_count = run_sync(helpers.get_movie_count)
+get_rating_count = run_sync(helpers.get_rating_count)
+get_tag_count = run_sync(helpers.get_tag_count)
+get_link_count = run_sync(helpers.get_link_count)
+
+# --- Series temporelles ---
+get_activity = run_sync(helpers.get_activity)
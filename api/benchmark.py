@@ -0,0 +1,336 @@
+"""Banc de performance reproductible: fonctions de query_helpers et endpoints de l'API
+
+Mesure et comparaison a la reference:   python benchmark.py
+Enregistrer une nouvelle reference:     python benchmark.py --save-baseline
+
+Chaque execution construit une base neuve a partir de data/ (et l'index des films similaires, le modele de
+recommandation et, avec MOVIELENS_BACKEND=snapshot, l'instantane Arrow) dans un dossier de travail, puis:
+- appelle chaque fonction de query_helpers en boucle (une session, appels sequentiels);
+- envoie des requetes a chaque endpoint, dans le meme processus (httpx + ASGI), a plusieurs niveaux de concurrence.
+Les latences p50/p95/p99 et le debit sont compares a benchmark_baseline.json: le code de sortie vaut 1 si la mediane
+ou le debit d'une mesure s'est degrade de plus de --tolerance. La reference depend de la machine: la regenerer avant de comparer ailleurs.
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database
+import models
+import query_helpers as helpers
+import recommender
+import similarity
+from load_data import DATA_DIR, load_all
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_ITERATIONS = 200
+DEFAULT_MAX_SECONDS = 2.0 # par fonction ou par endpoint et niveau de concurrence
+DEFAULT_CONCURRENCY = (1, 8, 32)
+DEFAULT_REQUESTS = 200
+DEFAULT_TOLERANCE = 0.3
+MIN_DELTA_MS = 0.05 # ecart absolu en dessous duquel une hausse de latence est du bruit
+
+# requetes envoyees a l'API (les exports sont filtres pour garder des reponses de taille comparable)
+ENDPOINTS = [
+    "/",
+    "/movies?limit=100",
+    "/movies?limit=100&genre=Comedy&genre=Romance",
+    "/movies/search?q=star&limit=20",
+    "/movies/batch?" + "&".join(f"ids={movie_id}" for movie_id in range(1, 11)) + "&include=link,stats,top_tags",
+    "/movies/top?limit=20&order_by=weighted",
+    "/movies/1/stats",
+    "/movies/1/similar?limit=10",
+    "/movies/1",
+    "/ratings?limit=100",
+    "/tags?limit=100",
+    "/tags/autocomplete?prefix=fu",
+    "/tags/funny/movies",
+    "/movies/1/tags/top",
+    "/links?limit=100",
+    "/export/ratings?movie_id=1",
+    "/export/tags?movie_id=1",
+    "/users/1/recommendations?limit=10",
+    "/stats/summary",
+    "/stats/histogram",
+    "/stats/genres",
+    "/stats/years",
+    "/stats/users/top?limit=10",
+    "/timeseries?granularity=month",
+]
+
+
+# --- Base de travail ---
+def build_workspace(directory: str, data_dir: str = DATA_DIR) -> dict:
+    # base neuve et artefacts derives dans `directory`, qui devient le dossier courant
+    # (les chemins de database, similarity, recommender et snapshot sont relatifs au dossier courant)
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    if os.path.exists(database.DATABASE_PATH):
+        os.remove(database.DATABASE_PATH)
+    engine = create_engine(database.SQLALCHEMY_DATABASE_URL)
+    timings = {}
+    start = time.perf_counter()
+    counts = load_all(engine, data_dir)
+    timings["load"] = time.perf_counter() - start
+    start = time.perf_counter()
+    columns = similarity.read_ratings(engine)
+    similarity.save(similarity.build_similarity(*columns), similarity.SIMILARITY_PATH)
+    timings["similarity"] = time.perf_counter() - start
+    start = time.perf_counter()
+    recommender.save(recommender.train(*columns), recommender.MODEL_DIR)
+    timings["recommender"] = time.perf_counter() - start
+    if database.BACKEND == "snapshot":
+        import snapshot
+        start = time.perf_counter()
+        snapshot.export_snapshot(engine)
+        timings["snapshot"] = time.perf_counter() - start
+    engine.dispose()
+    bind_database(os.path.abspath(database.DATABASE_PATH))
+    return {"counts": counts, "build_seconds": {name: round(value, 3) for name, value in timings.items()}}
+
+
+def bind_database(path: str):
+    # le pilote SQLite rend ./movies.db absolu a la creation du moteur, donc a l'import de database (dossier de l'API):
+    # relier les moteurs et les sessions de l'API a la base de travail. En lecture seule, l'URI reste relative
+    # et se resout a l'ouverture de chaque connexion, dans le dossier courant
+    if database.READ_ONLY:
+        return
+    database.engine.dispose()
+    database.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    database.SessionLocal.configure(bind=database.engine)
+    if database.async_engine is not None:
+        database.async_engine.sync_engine.dispose()
+        database.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
+
+
+# --- Statistiques ---
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "samples": int(len(latencies)),
+        "errors": errors,
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "throughput": round(len(latencies) / elapsed, 1),
+    }
+
+
+# --- Fonctions de query_helpers ---
+def uncached(name: str):
+    # fonction sans la memoisation de helper_cache: mesurer la requete, pas la lecture du cache
+    function = getattr(helpers, name)
+    return getattr(function, "__wrapped__", function)
+
+def helper_cases(db) -> dict:
+    # un appel representatif par fonction; les identifiants sont lus dans la base pour exister a coup sur
+    user_id, movie_id, tag_text = db.execute(select(models.Tag.userId, models.Tag.movieId, models.Tag.tag).limit(1)).one()
+    consume = lambda batches: sum(len(batch) for batch in batches)
+    return {
+        "get_movie": lambda: uncached("get_movie")(db, 1),
+        "get_movies": lambda: helpers.get_movies(db, skip=1000, limit=100, genre="Comedy"),
+        "get_movies_page": lambda: helpers.get_movies_page(db, limit=100, genre=["Comedy", "Romance"], as_dicts=True),
+        "search_movies": lambda: helpers.search_movies(db, "star", limit=20),
+        "capped_children": lambda: helpers.capped_children(db, models.Rating, list(range(1, 51)), 20),
+        "top_tags": lambda: helpers.top_tags(db, list(range(1, 51)), 10),
+        "get_movies_batch": lambda: helpers.get_movies_batch(db, list(range(1, 51)), include="link,stats,ratings,tags,top_tags"),
+        "get_movie_view": lambda: uncached("get_movie_view")(db, 1),
+        "get_movie_stats": lambda: helpers.get_movie_stats(db, 1),
+        "get_top_movies": lambda: helpers.get_top_movies(db, limit=20, genre="Drama", min_count=10),
+        "get_rating": lambda: helpers.get_rating(db, 1, 1),
+        "get_user_rated_movie_ids": lambda: helpers.get_user_rated_movie_ids(db, 414),
+        "get_ratings": lambda: helpers.get_ratings(db, skip=5000, limit=100, min_rating=4.0),
+        "get_ratings_page": lambda: helpers.get_ratings_page(db, limit=100, min_rating=4.0, as_dicts=True),
+        "get_tag": lambda: helpers.get_tag(db, user_id, movie_id, tag_text),
+        "get_tags": lambda: helpers.get_tags(db, limit=100, movie_id=296),
+        "get_tags_page": lambda: helpers.get_tags_page(db, limit=100, as_dicts=True),
+        "autocomplete_tags": lambda: helpers.autocomplete_tags(db, "fu"),
+        "get_movies_with_tag": lambda: helpers.get_movies_with_tag(db, "funny"),
+        "get_movie_top_tags": lambda: helpers.get_movie_top_tags(db, 296),
+        "get_link": lambda: uncached("get_link")(db, 1),
+        "get_links": lambda: helpers.get_links(db, skip=1000, limit=100),
+        "get_links_page": lambda: helpers.get_links_page(db, limit=100, as_dicts=True),
+        "get_movie_count": lambda: uncached("get_movie_count")(db),
+        "get_rating_count": lambda: uncached("get_rating_count")(db),
+        "get_tag_count": lambda: uncached("get_tag_count")(db),
+        "get_link_count": lambda: uncached("get_link_count")(db),
+        "stream_rows": lambda: consume(helpers.stream_rows(db, select(*models.Link.__table__.columns))),
+        "iter_ratings": lambda: consume(helpers.iter_ratings(db, min_rating=4.5)),
+        "iter_tags": lambda: consume(helpers.iter_tags(db)),
+        "get_activity": lambda: helpers.get_activity(db, granularity="month", genre="Comedy"),
+    }
+
+def helper_names() -> list:
+    # fonctions publiques de query_helpers qui prennent une session en premier argument
+    return sorted(
+        name for name, function in vars(helpers).items()
+        if inspect.isfunction(function) and not name.startswith("_")
+        and list(inspect.signature(function).parameters)[:1] == ["db"]
+    )
+
+def time_calls(function, iterations: int, max_seconds: float):
+    # appels sequentiels jusqu'a `iterations` ou `max_seconds` (au moins 5), apres un appel de chauffe;
+    # ramasse-miettes desactive pendant la mesure, comme timeit
+    function()
+    latencies = []
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        while len(latencies) < iterations and (len(latencies) < 5 or time.perf_counter() - start < max_seconds):
+            call_start = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - call_start)
+    finally:
+        gc.enable()
+    return summarize(latencies, time.perf_counter() - start)
+
+def bench_helpers(iterations: int = DEFAULT_ITERATIONS, max_seconds: float = DEFAULT_MAX_SECONDS) -> dict:
+    db = database.SessionLocal()
+    try:
+        cases = helper_cases(db)
+        missing = [name for name in helper_names() if name not in cases]
+        if missing:
+            print(f"fonctions sans mesure: {', '.join(missing)}")
+        results = {}
+        for name, function in cases.items():
+            results[name] = time_calls(function, iterations, max_seconds)
+            db.expunge_all() # ne pas mesurer le cache de l'identity map
+        return results
+    finally:
+        db.close()
+
+
+# --- Endpoints (dans le processus, httpx + ASGI) ---
+async def load_endpoint(client, path: str, concurrency: int, requests: int, max_seconds: float) -> dict:
+    # `concurrency` clients envoient `requests` requetes au total (ou s'arretent apres max_seconds)
+    latencies, errors = [], 0
+    remaining = requests
+    deadline = time.perf_counter() + max_seconds
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0 and time.perf_counter() < deadline:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    await client.get(path) # chauffe
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+async def bench_endpoints(concurrency_levels=DEFAULT_CONCURRENCY, requests: int = DEFAULT_REQUESTS,
+                          max_seconds: float = DEFAULT_MAX_SECONDS) -> dict:
+    import httpx
+    from main import app, lifespan
+
+    results = {}
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for path in ENDPOINTS:
+                for concurrency in concurrency_levels:
+                    results[f"{path} @{concurrency}"] = await load_endpoint(client, path, concurrency, requests, max_seconds)
+    return results
+
+
+# --- Rapport et comparaison ---
+def print_results(title: str, results: dict, baseline: dict, tolerance: float, check_throughput: bool = True) -> list:
+    # tableau des mesures, avec la variation par rapport a la reference; renvoie les regressions.
+    # seules la mediane et le debit font echouer la comparaison: p95/p99 varient trop d'une execution a l'autre
+    # (pour des appels sequentiels, le debit n'est que l'inverse de la latence moyenne: check_throughput=False)
+    print(f"\n{title}")
+    print(f"{'':<62} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>10} {'p50':>7} {'p95':>7} {'debit':>7}")
+    regressions = []
+    for name, stats in results.items():
+        line = f"{name[:62]:<62} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f} {stats['throughput']:>10.1f}"
+        reference = baseline.get(name)
+        if reference:
+            change = {key: stats[key] / reference[key] - 1 if reference[key] else 0 for key in ("p50_ms", "p95_ms", "throughput")}
+            line += f" {change['p50_ms']:>+7.0%} {change['p95_ms']:>+7.0%} {change['throughput']:>+7.0%}"
+            slower = change["p50_ms"] > tolerance and stats["p50_ms"] - reference["p50_ms"] > MIN_DELTA_MS
+            if slower or (check_throughput and change["throughput"] < -tolerance) or stats["errors"] > reference.get("errors", 0):
+                regressions.append(name)
+                line += "  REGRESSION"
+        elif stats["errors"]:
+            line += f"  {stats['errors']} erreurs"
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de performance de l'API MovieLens")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--workdir", help="dossier de la base construite (par defaut un dossier temporaire supprime a la fin)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="appels par fonction de query_helpers")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="requetes par endpoint et niveau de concurrence")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)), help="niveaux de concurrence, ex. 1,8,32")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS, help="duree maximale par mesure")
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="degradation toleree de la mediane et du debit (0.3 = 30%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="enregistrer les mesures comme nouvelle reference")
+    parser.add_argument("--output", help="ecrire les mesures dans ce fichier json")
+    args = parser.parse_args()
+
+    baseline_path, output = os.path.abspath(args.baseline), args.output and os.path.abspath(args.output)
+    data_dir = os.path.abspath(args.data_dir)
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="movielens-bench-")
+    cwd = os.getcwd()
+    try:
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "backend": database.BACKEND,
+            },
+            **build_workspace(workdir, data_dir),
+        }
+        results["helpers"] = bench_helpers(args.iterations, args.max_seconds)
+        if not args.skip_endpoints:
+            levels = [int(level) for level in args.concurrency.split(",")]
+            results["endpoints"] = asyncio.run(bench_endpoints(levels, args.requests, args.max_seconds))
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    print(f"\nconstruction: {results['build_seconds']}")
+    regressions = print_results("query_helpers (appels sequentiels)", results["helpers"], baseline.get("helpers", {}), args.tolerance,
+                                check_throughput=False)
+    if "endpoints" in results:
+        regressions += print_results("endpoints (chemin @concurrence)", results["endpoints"], baseline.get("endpoints", {}), args.tolerance)
+
+    for path in filter(None, [output, args.save_baseline and baseline_path]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"mesures ecrites dans {path}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) par rapport a {baseline_path}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
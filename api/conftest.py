@@ -0,0 +1,91 @@
+"""Fixtures partagees des tests de l'API
+
+Lancer depuis api/:  python -m pytest
+"""
+import csv
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from load_data import load_all
+
+CSV_COLUMNS = {
+    "movies": ["movieId", "title", "genres"],
+    "links": ["movieId", "imdbId", "tmdbId"],
+    "ratings": ["userId", "movieId", "rating", "timestamp"],
+    "tags": ["userId", "movieId", "tag", "timestamp"],
+}
+
+
+@pytest.fixture(scope="session")
+def engine(tmp_path_factory):
+    # base neuve construite depuis data/, partagee par les tests qui ne l'ecrivent pas
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('api') / 'movies.db'}",
+                           connect_args={"check_same_thread": False})
+    load_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client(engine, tmp_path_factory):
+    # API servie sur la base de test, avec son index des films similaires et son modele de recommandation
+    import analytics
+    import database
+    import http_cache
+    import metrics
+    import recommender
+    import similarity
+    from main import app
+
+    directory = tmp_path_factory.mktemp("artifacts")
+    columns = similarity.read_ratings(engine)
+    similarity.save(similarity.build_similarity(*columns), str(directory / "similar_movies.npy"))
+    recommender.save(recommender.train(*columns), str(directory / "recommender_model"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}")
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(database, "DATABASE_PATH", engine.url.database)
+        patch.setattr(database, "engine", engine)
+        patch.setattr(similarity, "SIMILARITY_PATH", str(directory / "similar_movies.npy"))
+        patch.setattr(recommender, "MODEL_DIR", str(directory / "recommender_model"))
+        for module, name in ((http_cache, "_version"), (analytics, "_columns")):
+            patch.setattr(module, name, {key: None for key in getattr(module, name)})
+        for module, name in ((similarity, "_index"), (recommender, "_recommender")):
+            patch.setattr(module, name, None)
+        database.SessionLocal.configure(bind=engine)
+        database.AsyncSessionLocal.configure(bind=async_engine)
+        try:
+            with TestClient(app) as client:
+                yield client
+        finally:
+            database.SessionLocal.configure(bind=database.engine)
+            database.AsyncSessionLocal.configure(bind=database.async_engine)
+    async_engine.sync_engine.dispose()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # petit jeu MovieLens ecrit dans un dossier: dataset("v1", movies=[(1, "Toy Story (1995)", "Comedy")], ...)
+    def write(name: str = "data", **tables) -> str:
+        directory = tmp_path / name
+        directory.mkdir()
+        for table, columns in CSV_COLUMNS.items():
+            with open(directory / f"{table}.csv", "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(tables.get(table, []))
+        return str(directory)
+    return write
+
+
+@pytest.fixture
+def small_engine(tmp_path):
+    # base vide dans le dossier du test, a remplir avec load_all
+    engine = create_engine(f"sqlite:///{tmp_path / 'small.db'}")
+    yield engine
+    engine.dispose()
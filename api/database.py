@@ -1,16 +1,93 @@
 """ Database Conficuration"""
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+DATABASE_PATH = "./movies.db"
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# -- Backend des tables de base (MOVIELENS_BACKEND=sqlite|snapshot) --
+# snapshot: movies, ratings, tags et links sont lus dans l'instantane Arrow mappe en memoire (voir snapshot.py)
+BACKEND = os.getenv("MOVIELENS_BACKEND", "sqlite")
+if BACKEND not in ("sqlite", "snapshot"):
+    raise ValueError("MOVIELENS_BACKEND doit valoir 'sqlite' ou 'snapshot'")
+
+# -- Mode lecture seule (MOVIELENS_READ_ONLY=1) --
+# l'API ne fait que lire: la base est ouverte en mode=ro&immutable=1 (pas de verrous ni de verification de changement),
+# avec mmap et un grand cache de pages. Il faut redemarrer l'API apres un rechargement de movies.db
+READ_ONLY = os.getenv("MOVIELENS_READ_ONLY", "0") == "1"
+POOL_SIZE = int(os.getenv("MOVIELENS_POOL_SIZE", "8"))
+READ_ONLY_PRAGMAS = [
+    "PRAGMA query_only=ON",
+    "PRAGMA mmap_size=1073741824", # 1 Go: les pages sont lues via le cache du systeme, partage entre connexions
+    "PRAGMA cache_size=-65536", # 64 Mo de cache de pages par connexion
+    "PRAGMA temp_store=MEMORY",
+]
+
+def read_only_url(driver="sqlite"):
+    return f"{driver}:///file:{DATABASE_PATH}?mode=ro&immutable=1&uri=true"
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./movies.db"
+def apply_read_only_pragmas(engine):
+    # appliquer les PRAGMAs a chaque nouvelle connexion, une seule fois a l'ouverture
+    @event.listens_for(engine, "connect")
+    def set_read_only_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in READ_ONLY_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    return engine
 
 ## Creer le moteur de base de donnees (engine) qui etablit la connexion a la base de donnees sqlite (movie.db))
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} # cet argument  veut dire que plusieurs threads ()peuvent utiliser la meme connexion a la base de donnees
-)
+if READ_ONLY:
+    engine = apply_read_only_pragmas(create_engine(
+        read_only_url(), connect_args={"check_same_thread": False}, pool_size=POOL_SIZE, max_overflow=POOL_SIZE
+    ))
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} # cet argument  veut dire que plusieurs threads ()peuvent utiliser la meme connexion a la base de donnees
+    )
 # Definir SessionLocal, qui permet de creer des sessions pour interagir avec la base de donnees
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) # valider les modifications manuellement (autocommit=False) et empecher les modifications automatiques (autoflush=False), et lier les sessions au moteur de base de donnees (bind=engine)
 
+# Moteur asynchrone (aiosqlite) utilise par l'API: les requetes attendent sur la boucle d'evenements au lieu d'occuper un thread
+# le moteur synchrone reste disponible pour les scripts (test_models.py, load_data.py)
+try:
+    if READ_ONLY:
+        async_engine = create_async_engine(read_only_url("sqlite+aiosqlite"), pool_size=POOL_SIZE, max_overflow=POOL_SIZE)
+        apply_read_only_pragmas(async_engine.sync_engine)
+    else:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+except ImportError: # aiosqlite n'est pas installe
+    async_engine = None
+    AsyncSessionLocal = None
+
+# Pre-chauffer le pool: ouvrir toutes les connexions au demarrage (PRAGMAs appliques, schema lu)
+# et parcourir les tables une fois pour charger les pages, au lieu de le faire pendant les premieres requetes
+WARM_QUERIES = [
+    "SELECT count(*) FROM movies",
+    "SELECT count(*) FROM ratings",
+    "SELECT count(*) FROM tags",
+    "SELECT count(*) FROM links",
+]
+
+def warm_pool(size=POOL_SIZE):
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        for query in WARM_QUERIES:
+            connection.exec_driver_sql(query).scalar()
+        connection.close()
+
+async def warm_async_pool(size=POOL_SIZE):
+    connections = [await async_engine.connect() for _ in range(size)]
+    for connection in connections:
+        for query in WARM_QUERIES:
+            (await connection.exec_driver_sql(query)).scalar()
+        await connection.close()
+
 #definir  Base, qui servira de classe de base pour nos modele SQLAlchemy (ORM Object Relational Mapping)
 Base = declarative_base()
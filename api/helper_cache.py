@@ -0,0 +1,187 @@
+"""Cache en memoire des lectures ponctuelles de query_helpers (get_movie, get_link, get_movie_view, get_*_count)
+
+Les donnees ne changent qu'au rechargement de la base: un resultat est garde au plus `ttl` secondes, et les entrees
+d'une base sont videes des que la version de son jeu de donnees change (dataset_info, relue quand le fichier change;
+le fichier est examine au plus une fois par MOVIELENS_HELPER_CACHE_CHECK_SECONDS). Le cache est borne
+(MOVIELENS_HELPER_CACHE_SIZE entrees, 0 pour le desactiver) et evince les entrees les moins recemment lues; la cle
+comprend l'URL de la base de la session, pour ne pas melanger deux bases (tests, --database-url).
+Seules les valeurs des colonnes sont gardees. Un objet SQLAlchemy renvoye par la fonction est recree a chaque lecture
+et rattache a la session de l'appelant sans requete (Session.merge(load=False)): ses relations se chargent comme
+d'habitude et aucun objet n'est partage entre appels. Dans un dict (get_movie_view), les objets lies deviennent des
+dicts de colonnes, recopies a chaque lecture.
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+import http_cache
+import metrics
+
+MAX_ENTRIES = int(os.getenv("MOVIELENS_HELPER_CACHE_SIZE", "4096"))
+# intervalle minimal entre deux verifications de la version d'une base (os.stat du fichier)
+CHECK_SECONDS = float(os.getenv("MOVIELENS_HELPER_CACHE_CHECK_SECONDS", "1"))
+
+
+class HelperCache:
+    """Cache LRU borne, partage par toutes les fonctions memoisees, avec duree de vie par entree"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, check_seconds: float = CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self.entries = OrderedDict() # (fonction, url de la base, args) -> (expire_at, valeur)
+        self.databases = {} # url de la base -> (verifiee a, mtime du fichier, version)
+        self.versions = {} # url de la base -> version des entrees en cache
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def database_version(self, url, bind=None):
+        # version du jeu de donnees de la base `url` (moteur `bind`; sans moteur, la base par defaut de l'API).
+        # Hors du verrou: au plus un os.stat par base et par check_seconds, dataset_info relu si le fichier a change
+        checked = self.databases.get(url)
+        now = time.monotonic()
+        if checked is not None and now - checked[0] < self.check_seconds:
+            return checked[2]
+        if bind is None:
+            version, _ = http_cache.dataset_version()
+            self.databases[url] = (now, None, version)
+            return version
+        try:
+            mtime = os.stat(bind.url.database).st_mtime_ns if bind.url.database else None
+        except OSError:
+            mtime = None
+        if checked is not None and mtime == checked[1]:
+            version = checked[2]
+        else:
+            version = http_cache.read_dataset_info(bind, mtime or 0)[0]
+        self.databases[url] = (now, mtime, version)
+        return version
+
+    def get(self, key, bind=None):
+        # (True, valeur) si la cle est presente et pas expiree, sinon (False, None); key[1]: url de la base
+        url = key[1]
+        version = self.database_version(url, bind)
+        with self.lock:
+            if self.versions.get(url, version) != version:
+                # nouvelle version du jeu de donnees: les entrees de cette base seulement sont perimees
+                for stale in [entry for entry in self.entries if entry[1] == url]:
+                    del self.entries[stale]
+            self.versions[url] = version
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self._count(self.hits, key[0], "hit")
+                return True, entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self._count(self.misses, key[0], "miss")
+            return False, None
+
+    def put(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _count(self, counts: dict, name: str, result: str):
+        counts[name] = counts.get(name, 0) + 1
+        metrics.HELPER_CACHE_REQUESTS.labels(name, result).inc()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.databases.clear()
+            self.versions.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self) -> dict:
+        # {fonction: {"hits", "misses"}} et le nombre d'entrees
+        with self.lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "helpers": {name: {"hits": self.hits.get(name, 0), "misses": self.misses.get(name, 0)} for name in names},
+            }
+
+cache = HelperCache()
+
+
+class Instance:
+    """Objet SQLAlchemy en cache: sa classe et les valeurs de ses colonnes"""
+    __slots__ = ("model", "values")
+
+    def __init__(self, model, values: dict):
+        self.model = model
+        self.values = values
+
+    def attach(self, db):
+        # objet de la session de l'appelant (celui de sa table d'identite s'il y est deja), sans requete
+        instance = self.model(**self.values)
+        make_transient_to_detached(instance)
+        return db.merge(instance, load=False)
+
+
+def columns(value):
+    # valeurs des colonnes d'un objet SQLAlchemy, None si ce n'en est pas un
+    state = inspect(value, raiseerr=False)
+    if state is None or not hasattr(state, "mapper"):
+        return None
+    return {attr.key: getattr(value, attr.key) for attr in state.mapper.column_attrs}
+
+
+def plain(value):
+    # copie en valeurs simples: dicts et listes recopies, objets SQLAlchemy remplaces par le dict de leurs colonnes
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    values = columns(value)
+    return value if values is None else values
+
+
+def freeze(value):
+    # forme gardee en cache, independante de la session
+    values = columns(value)
+    return Instance(type(value), values) if values is not None else plain(value)
+
+
+def thaw(value, db):
+    # valeur renvoyee a l'appelant: objet de sa session, ou copie des dicts et listes
+    return value.attach(db) if isinstance(value, Instance) else plain(value)
+
+
+def session_bind(db):
+    # moteur de la session (None pour le backend snapshot appele sans session)
+    get_bind = getattr(db, "get_bind", None)
+    return get_bind() if get_bind is not None else None
+
+
+def memoize(helper, ttl: float):
+    """Memoiser helper(db, ...) sur ses autres arguments, pendant `ttl` secondes"""
+    if cache.max_entries <= 0:
+        return helper
+
+    @functools.wraps(helper)
+    def wrapper(db, *args, **kwargs):
+        bind = session_bind(db)
+        key = (helper.__name__, str(bind.url) if bind is not None else None, args, tuple(sorted(kwargs.items())))
+        try:
+            found, value = cache.get(key, bind)
+        except TypeError: # argument non hachable: pas de cache
+            return helper(db, *args, **kwargs)
+        if not found:
+            result = helper(db, *args, **kwargs)
+            value = freeze(result)
+            cache.put(key, value, ttl)
+            if isinstance(value, Instance): # deja un objet de la session de l'appelant
+                return result
+        return thaw(value, db)
+    return wrapper
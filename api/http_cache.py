@@ -0,0 +1,136 @@
+"""Cache HTTP de l'API: ETag / Last-Modified derives de la version du jeu de donnees"""
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import select
+from starlette.routing import Match
+
+import database
+import models
+import recommender
+import similarity
+
+# duree pendant laquelle un client ou un CDN peut reutiliser une reponse sans la revalider
+CACHE_MAX_AGE = int(os.getenv("MOVIELENS_CACHE_MAX_AGE", "300"))
+CACHE_CONTROL = f"public, max-age={CACHE_MAX_AGE}, stale-while-revalidate={CACHE_MAX_AGE}"
+# chemins jamais mis en cache (sante et metriques de l'API)
+UNCACHED_PATHS = {"/", "/metrics"}
+
+# routes servies par un fichier construit a part de la base (similarity.py build, recommender.py train):
+# leur ETag inclut aussi la date de ce fichier, charge au demarrage
+ARTIFACT_ROUTES = (
+    (re.compile(r"/movies/[^/]+/similar"), similarity.get_index),
+    (re.compile(r"/users/[^/]+/recommendations"), recommender.get_recommender),
+)
+
+_version = {"mtime": None, "version": None, "loaded_at": None}
+
+
+def read_dataset_info(engine, mtime: int):
+    """(version, loaded_at) lus dans dataset_info de la base du moteur; mtime: date du fichier en nanosecondes"""
+    with engine.connect() as conn:
+        info = dict(conn.execute(select(models.DatasetInfo.key, models.DatasetInfo.value)).all())
+    # base chargee avant l'ajout de dataset_info: la date du fichier sert de version
+    return info.get("version", str(mtime)), int(info.get("loaded_at", mtime // 10**9))
+
+
+def dataset_version():
+    """(version, loaded_at) du jeu de donnees, relus dans dataset_info seulement si le fichier movies.db a change"""
+    try:
+        mtime = os.stat(database.DATABASE_PATH).st_mtime_ns
+    except OSError:
+        return None, None
+    if mtime != _version["mtime"]:
+        version, loaded_at = read_dataset_info(database.engine, mtime)
+        _version.update(mtime=mtime, version=version, loaded_at=loaded_at)
+    return _version["version"], _version["loaded_at"]
+
+
+def artifact_built_at(path: str):
+    # date de construction du fichier qui sert la route, 0 s'il n'est pas encore construit, None pour les autres routes
+    for pattern, load in ARTIFACT_ROUTES:
+        if pattern.fullmatch(path):
+            return getattr(load(), "built_at", 0)
+    return None
+
+
+def _not_modified(request: Request, etag: str, loaded_at: int) -> bool:
+    # appele seulement pour une reponse 200: "*" veut dire "la ressource existe", donc toujours vrai ici
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= loaded_at
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def is_data_route(request: Request) -> bool:
+    # route de l'API resolue par le routeur (pas /docs, /openapi.json ni un chemin inconnu)
+    route = request.scope.get("route")
+    return isinstance(route, APIRoute) and route.path not in UNCACHED_PATHS
+
+
+def matches_data_route(request: Request) -> bool:
+    # meme test avant le routage: la route qui servira la requete, cherchee dans le routeur de l'application
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return isinstance(route, APIRoute) and route.path not in UNCACHED_PATHS
+    return False
+
+
+def validators(path: str):
+    """(ETag, loaded_at) de la reponse d'une route de donnees, None si la version du jeu de donnees est inconnue"""
+    version, loaded_at = dataset_version()
+    if version is None:
+        return None
+    # ETag faible: la meme version de donnees (et du fichier construit, s'il y en a un) donne la meme reponse
+    # pour une URL donnee
+    etag = version
+    built_at = artifact_built_at(path)
+    if built_at is not None:
+        etag = f"{version}-{int(built_at)}"
+        loaded_at = max(loaded_at, int(built_at))
+    return f'W/"{etag}"', loaded_at
+
+
+def _headers(etag: str, loaded_at: int) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(loaded_at, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+
+async def conditional_get(request: Request, call_next):
+    # middleware: validateurs poses sur les reponses 200 des routes de donnees seulement
+    if request.method not in ("GET", "HEAD") or request.url.path in UNCACHED_PATHS:
+        return await call_next(request)
+
+    # If-None-Match avec l'ETag courant: le client le tient d'une 200 sur la meme URL, 304 sans executer la route
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and if_none_match.strip() != "*" and matches_data_route(request):
+        current = validators(request.url.path)
+        if current is not None and current[0] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=_headers(*current))
+
+    # "*" et If-Modified-Since ne valent que pour une ressource qui existe: la route s'execute d'abord
+    response = await call_next(request)
+    if response.status_code != 200 or not is_data_route(request):
+        return response
+    current = validators(request.url.path)
+    if current is None:
+        return response
+    headers = _headers(*current)
+    if _not_modified(request, *current):
+        await response.body_iterator.aclose() # corps deja produit par l'endpoint, jamais envoye
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,385 @@
+"""Chargement des fichiers CSV MovieLens dans movies.db"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+import time
+from itertools import islice
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.schema import CreateTable
+
+from database import Base, SQLALCHEMY_DATABASE_URL
+import models
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+CHUNK_SIZE = 20000
+# table temporaire des timestamps des lignes remplacees pendant un chargement incremental
+REPLACED_TABLE = "temp.replaced_timestamps"
+# valeur de Movie.genres pour les films sans genre
+NO_GENRE = "(no genres listed)"
+# notes possibles de MovieLens: 0.5, 1.0, ..., 5.0 (une case d'histogramme par note)
+RATING_STEPS = 10
+YEAR_PATTERN = re.compile(r"\((\d{4})\)\s*$")
+
+
+def _int_or_none(value):
+    # certains liens n'ont pas de tmdbId
+    return int(value) if value else None
+
+
+def _str_or_none(value):
+    return value if value else None
+
+
+# fichier csv -> (table, conversion de chaque colonne)
+CSV_TABLES = [
+    ("movies.csv", models.Movie.__table__, {"movieId": int, "title": str, "genres": str}),
+    ("links.csv", models.Link.__table__, {"movieId": int, "imdbId": _str_or_none, "tmdbId": _int_or_none}),
+    ("ratings.csv", models.Rating.__table__, {"userId": int, "movieId": int, "rating": float, "timestamp": int}),
+    ("tags.csv", models.Tag.__table__, {"userId": int, "movieId": int, "tag": str, "timestamp": int}),
+]
+
+# PRAGMAs de chargement: pas de journal ni de fsync, la base est reconstruite si le chargement echoue
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-200000",
+    "PRAGMA locking_mode=EXCLUSIVE",
+]
+# PRAGMAs remis en place a la fin du chargement
+SERVE_PRAGMAS = [
+    "PRAGMA locking_mode=NORMAL",
+    "PRAGMA journal_mode=DELETE",
+    "PRAGMA synchronous=FULL",
+]
+
+
+def read_chunks(path, converters, chunk_size=CHUNK_SIZE):
+    # lire le fichier csv par paquets de chunk_size lignes (sans tout charger en memoire)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        columns = [(name, converters[name]) for name in next(reader)]
+        while True:
+            chunk = [
+                {name: convert(value) for (name, convert), value in zip(columns, row)}
+                for row in islice(reader, chunk_size)
+            ]
+            if not chunk:
+                return
+            yield chunk
+
+
+def _create_tables(conn, incremental):
+    # en mode complet, on repart d'une base vide et les index sont crees apres le chargement
+    if not incremental:
+        Base.metadata.drop_all(conn)
+    for table in Base.metadata.sorted_tables:
+        conn.execute(CreateTable(table, if_not_exists=True))
+
+
+def _create_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _max_timestamp(conn, table):
+    return conn.execute(select(func.max(table.c.timestamp))).scalar()
+
+
+def _record_replaced(conn, table, chunk):
+    # anciens timestamps des lignes que INSERT OR REPLACE va remplacer (un film note une nouvelle fois): la ligne
+    # quitte sa periode, qui doit etre recalculee dans activity_rollups (build_rollups)
+    keys = " AND ".join(f"t.{column.name} = :{column.name}" for column in table.primary_key.columns)
+    conn.execute(text(
+        f"INSERT INTO {REPLACED_TABLE} (source, timestamp) SELECT '{table.name}', t.timestamp FROM {table.name} t WHERE {keys}"
+    ), chunk)
+
+
+def load_table(conn, path, table, converters, incremental=False, chunk_size=CHUNK_SIZE):
+    # inserer un fichier csv dans une table avec des insertions groupees (executemany)
+    since = None
+    if incremental and "timestamp" in table.c:
+        since = _max_timestamp(conn, table)
+    if incremental:
+        # une ligne plus recente remplace l'ancienne (meme cle primaire), les films/liens deja connus sont ignores
+        stmt = insert(table).prefix_with("OR REPLACE" if since is not None else "OR IGNORE")
+    else:
+        stmt = insert(table)
+
+    count = 0
+    for chunk in read_chunks(path, converters, chunk_size):
+        if since is not None:
+            chunk = [row for row in chunk if row["timestamp"] > since]
+            if not chunk:
+                continue
+            _record_replaced(conn, table, chunk)
+        # lignes reellement ecrites: OR IGNORE saute les cles deja presentes
+        count += conn.execute(stmt, chunk).rowcount
+    return count, since
+
+
+def build_movie_genres(conn):
+    # decouper Movie.genres dans la table de liaison movie_genres
+    genre_table = models.MovieGenre.__table__
+    movie_table = models.Movie.__table__
+    conn.execute(genre_table.delete())
+    rows = [
+        {"genre": genre, "movieId": movie_id}
+        for movie_id, genres in conn.execute(select(movie_table.c.movieId, movie_table.c.genres))
+        for genre in set((genres or "").split("|"))
+        if genre and genre != NO_GENRE
+    ]
+    if rows:
+        conn.execute(insert(genre_table), rows)
+    return len(rows)
+
+
+def build_title_index(conn):
+    # index plein texte FTS5 sur Movie.title (contenu externe: la table movies, rowid = movieId)
+    conn.exec_driver_sql("DROP TABLE IF EXISTS movies_fts")
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE movies_fts USING fts5("
+        "title, content='movies', content_rowid='movieId', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    conn.exec_driver_sql("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')")
+
+
+def title_year(title):
+    # "Toy Story (1995)" -> 1995
+    match = YEAR_PATTERN.search(title or "")
+    return int(match.group(1)) if match else None
+
+
+def build_movie_stats(conn, since=None):
+    # agreger les evaluations par film dans movie_stats
+    # since=None: reconstruction complete, sinon seulement les films ayant des evaluations plus recentes que since
+    ratings = models.Rating.__table__
+    movies = models.Movie.__table__
+    stats = models.MovieStats.__table__
+
+    query = select(ratings.c.movieId, ratings.c.rating, func.count()).group_by(ratings.c.movieId, ratings.c.rating)
+    if since is not None and not conn.execute(select(func.count()).select_from(stats)).scalar():
+        since = None # base chargee avant l'ajout de movie_stats
+    if since is None:
+        conn.execute(stats.delete())
+    else:
+        changed = select(ratings.c.movieId).where(ratings.c.timestamp > since).distinct()
+        query = query.where(ratings.c.movieId.in_(changed))
+        conn.execute(stats.delete().where(stats.c.movieId.in_(changed)))
+
+    histograms = {}
+    for movie_id, rating, count in conn.execute(query):
+        step = min(max(int(round(rating * 2)) - 1, 0), RATING_STEPS - 1)
+        histograms.setdefault(movie_id, [0] * RATING_STEPS)[step] += count
+    if not histograms:
+        return 0
+
+    titles = dict(conn.execute(select(movies.c.movieId, movies.c.title)).all())
+    rows = []
+    for movie_id, histogram in histograms.items():
+        count = sum(histogram)
+        total = sum((step + 1) / 2 * n for step, n in enumerate(histogram))
+        rows.append({
+            "movieId": movie_id,
+            "year": title_year(titles.get(movie_id)),
+            "rating_count": count,
+            "rating_sum": total,
+            "rating_mean": total / count,
+            "histogram": histogram,
+        })
+    conn.execute(insert(stats), rows)
+    update_weighted_scores(conn)
+    return len(rows)
+
+
+def update_weighted_scores(conn):
+    # moyenne bayesienne: (C * m + somme) / (C + nombre), m = moyenne globale, C = nombre moyen d'evaluations par film
+    # m et C changent avec chaque nouvelle evaluation, donc tous les scores sont recalcules (une seule requete UPDATE)
+    stats = models.MovieStats.__table__
+    total, count, movies = conn.execute(
+        select(func.sum(stats.c.rating_sum), func.sum(stats.c.rating_count), func.count())
+    ).one()
+    if not count:
+        return
+    mean = total / count
+    prior = count / movies
+    conn.execute(stats.update().values(
+        weighted_score=(prior * mean + stats.c.rating_sum) / (prior + stats.c.rating_count)
+    ))
+
+
+def record_dataset_version(conn, counts):
+    # nouvelle version a chaque chargement: sert d'ETag a l'API (et invalide ses caches)
+    loaded_at = int(time.time())
+    version = hashlib.sha1(f"{loaded_at}:{time.perf_counter_ns()}:{sorted(counts.items())}".encode()).hexdigest()[:16]
+    info = models.DatasetInfo.__table__
+    conn.execute(info.delete())
+    conn.execute(insert(info), [
+        {"key": "version", "value": version},
+        {"key": "loaded_at", "value": str(loaded_at)},
+    ])
+    return version
+
+
+# debut de la periode contenant le timestamp {ts} (UTC)
+ROLLUP_GRANULARITIES = {
+    "day": "({ts} - {ts} % 86400)",
+    "month": "CAST(strftime('%s', {ts}, 'unixepoch', 'start of month') AS INTEGER)",
+    "year": "CAST(strftime('%s', {ts}, 'unixepoch', 'start of year') AS INTEGER)",
+}
+# debut de la periode suivant celle qui commence a {start}
+ROLLUP_PERIOD_ENDS = {
+    "day": "({start} + 86400)",
+    "month": "CAST(strftime('%s', {start}, 'unixepoch', '+1 month') AS INTEGER)",
+    "year": "CAST(strftime('%s', {start}, 'unixepoch', '+1 year') AS INTEGER)",
+}
+# scope -> (jointure, cle, granularites); le detail par film s'arrete au mois pour limiter la taille de la table
+ROLLUP_SCOPES = {
+    "all": ("", "''", ("day", "month", "year")),
+    "genre": ("JOIN movie_genres g ON g.movieId = t.movieId", "g.genre", ("day", "month", "year")),
+    "movie": ("", "CAST(t.movieId AS TEXT)", ("month", "year")),
+}
+ROLLUP_SOURCES = {"ratings": "t.rating", "tags": "NULL"}
+
+
+def changed_periods(conn, source, granularity, since):
+    # [(debut, fin)] des periodes a recalculer apres un chargement incremental: celles a partir de la periode de
+    # `since` (fin None), et celles, plus anciennes, des lignes remplacees (REPLACED_TABLE)
+    bucket = ROLLUP_GRANULARITIES[granularity]
+    start = conn.execute(text("SELECT " + bucket.format(ts=":since")), {"since": since}).scalar()
+    replaced = conn.execute(text(
+        f"SELECT DISTINCT {bucket.format(ts='timestamp')}, {ROLLUP_PERIOD_ENDS[granularity].format(start=bucket.format(ts='timestamp'))} "
+        f"FROM {REPLACED_TABLE} WHERE source = :source AND timestamp < :start"
+    ), {"source": source, "start": start}).all()
+    return [(start, None)] + [tuple(period) for period in replaced]
+
+
+def build_rollups(conn, since=None):
+    # agregats par periode des evaluations et des tags
+    # since[source]=None: reconstruction complete, sinon seules les periodes de changed_periods sont recalculees
+    since = since or {}
+    count = 0
+    for source, rating in ROLLUP_SOURCES.items():
+        for scope, (join, key, granularities) in ROLLUP_SCOPES.items():
+            for granularity in granularities:
+                bucket = ROLLUP_GRANULARITIES[granularity]
+                periods = [(None, None)] if since.get(source) is None else changed_periods(conn, source, granularity, since[source])
+                for start, end in periods:
+                    params = {"source": source, "granularity": granularity, "scope": scope, "start": start, "end": end}
+                    delete = "DELETE FROM activity_rollups WHERE source = :source AND granularity = :granularity AND scope = :scope"
+                    conditions = []
+                    if start is not None:
+                        delete += " AND bucket >= :start"
+                        conditions.append("t.timestamp >= :start")
+                    if end is not None:
+                        delete += " AND bucket < :end"
+                        conditions.append("t.timestamp < :end")
+                    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+                    conn.execute(text(delete), params)
+                    result = conn.execute(text(
+                        "INSERT INTO activity_rollups (source, granularity, scope, scope_key, bucket, count, rating_sum) "
+                        f"SELECT :source, :granularity, :scope, {key}, {bucket.format(ts='t.timestamp')}, count(*), sum({rating}) "
+                        f"FROM {source} t {join} {where} GROUP BY 4, 5"
+                    ), params)
+                    count += result.rowcount
+    return count
+
+
+def build_tag_index(conn):
+    # vocabulaire normalise et index inverse terme -> films, reconstruits a partir de la table tags
+    tags = models.Tag.__table__
+    postings = {}
+    for movie_id, tag in conn.execute(select(tags.c.movieId, tags.c.tag)):
+        key = (models.normalize_tag(tag), movie_id)
+        if key[0]:
+            postings[key] = postings.get(key, 0) + 1
+
+    terms = {}
+    for term, _ in postings:
+        terms.setdefault(term, len(terms) + 1)
+    usage, movies = {}, {}
+    for (term, _), count in postings.items():
+        usage[term] = usage.get(term, 0) + count
+        movies[term] = movies.get(term, 0) + 1
+
+    conn.execute(models.TagPosting.__table__.delete())
+    conn.execute(models.TagTerm.__table__.delete())
+    if terms:
+        conn.execute(insert(models.TagTerm.__table__), [
+            {"id": term_id, "term": term, "usage_count": usage[term], "movie_count": movies[term]}
+            for term, term_id in terms.items()
+        ])
+        conn.execute(insert(models.TagPosting.__table__), [
+            {"term_id": terms[term], "movieId": movie_id, "count": count}
+            for (term, movie_id), count in postings.items()
+        ])
+    return len(terms)
+
+
+def load_all(engine=None, data_dir=DATA_DIR, incremental=False, chunk_size=CHUNK_SIZE):
+    """Charge les quatre fichiers csv et retourne le nombre de lignes inserees par table"""
+    if engine is None:
+        # moteur en ecriture, meme si l'API est configuree en lecture seule
+        engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    counts = {}
+    since = {}
+    with engine.connect() as conn:
+        for pragma in LOAD_PRAGMAS:
+            conn.exec_driver_sql(pragma)
+        _create_tables(conn, incremental)
+        if incremental:
+            conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {REPLACED_TABLE} (source TEXT, timestamp INTEGER)")
+            conn.exec_driver_sql(f"DELETE FROM {REPLACED_TABLE}")
+        conn.commit()
+
+        # une grande transaction par table
+        for filename, table, converters in CSV_TABLES:
+            start = time.perf_counter()
+            count, since[table.name] = load_table(conn, os.path.join(data_dir, filename), table, converters, incremental, chunk_size)
+            conn.commit()
+            counts[table.name] = count
+            print(f"{table.name}: {count} lignes en {time.perf_counter() - start:.2f}s")
+
+        # tables derivees, reconstruites a chaque chargement
+        counts["movie_genres"] = build_movie_genres(conn)
+        build_title_index(conn)
+        counts["movie_stats"] = build_movie_stats(conn, since["ratings"])
+        counts["activity_rollups"] = build_rollups(conn, since)
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {REPLACED_TABLE}")
+        counts["tag_terms"] = build_tag_index(conn)
+        conn.commit()
+
+        _create_indexes(conn)
+        conn.exec_driver_sql("ANALYZE")
+        print(f"version du jeu de donnees: {record_dataset_version(conn, counts)}")
+        conn.commit()
+
+        for pragma in SERVE_PRAGMAS:
+            conn.exec_driver_sql(pragma)
+        # locking_mode=NORMAL ne rend le verrou exclusif qu'au prochain acces au fichier: sinon la connexion
+        # gardee dans le pool du moteur bloquerait les autres connexions
+        conn.exec_driver_sql("SELECT count(*) FROM sqlite_master").all()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charger les fichiers CSV MovieLens dans la base SQLite")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="dossier contenant movies.csv, ratings.csv, tags.csv et links.csv")
+    parser.add_argument("--database-url", default=None, help="URL SQLAlchemy (par defaut celle de database.py)")
+    parser.add_argument("--incremental", action="store_true", help="ajouter seulement les lignes plus recentes que le timestamp max deja stocke")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url) if args.database_url else None
+    start = time.perf_counter()
+    load_all(engine, args.data_dir, args.incremental, args.chunk_size)
+    print(f"Chargement termine en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
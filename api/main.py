@@ -1,27 +1,65 @@
-from fastapi import FastAPI, HTTPException,Query,Path
-from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException,Query,Path,Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from database import SessionLocal
+import database
+from database import SessionLocal, AsyncSessionLocal
 import query_helpers as helpers
+import async_query_helpers as async_helpers
 import schemas
+from responses import FastJSONResponse, export_response
+import models
+import http_cache
+import similarity
+import recommender
+import analytics
+import metrics
+import slow_queries
 
 # -- Initialisation de l'application FastAPI --
 
 api_description = """Bienvenue dans l'API MovieLens!"""
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # en lecture seule, ouvrir et pre-chauffer les connexions avant la premiere requete
+    if database.READ_ONLY:
+        await database.warm_async_pool()
+    if database.BACKEND == "snapshot":
+        import snapshot
+        snapshot.get_snapshot() # mapper les tables de l'instantane Arrow
+    similarity.get_index() # mapper l'index des films similaires s'il a ete construit
+    recommender.get_recommender() # et les facteurs du modele de recommandation
+    analytics.get_analytics() # charger les colonnes des evaluations pour /stats
+    yield
+
 app = FastAPI(
     title = "MovieLens API",
     description = api_description,
-    version = "0.1"
+    version = "0.1",
+    lifespan = lifespan
 )
 
-# -- Dépendance pour obtenir une session de base de données --
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db # gerer la session avec yield
-    finally:
-        db.close()
+# -- Cache HTTP: ETag / Last-Modified / Cache-Control, 304 si le client a deja la version courante --
+app.middleware("http")(http_cache.conditional_get)
+
+# -- Metriques Prometheus (/metrics): latence par route, requetes SQL et temps SQLite par requete --
+# ajoute en dernier: le middleware le plus externe mesure aussi les reponses 304
+app.middleware("http")(metrics.track_requests)
+metrics.instrument_engine(database.engine)
+if database.async_engine is not None:
+    metrics.instrument_engine(database.async_engine.sync_engine)
+
+# -- Mode diagnostic (MOVIELENS_SLOW_QUERY_MS): requetes de query_helpers plus lentes que le seuil, avec leur plan --
+if slow_queries.THRESHOLD_MS is not None:
+    slow_queries.log_slow_queries(database.engine)
+    if database.async_engine is not None:
+        slow_queries.log_slow_queries(database.async_engine.sync_engine)
+
+# -- Dépendance pour obtenir une session asynchrone (utilisee par les endpoints async) --
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
 
 # Endpoint pour la sante de l'Api
 @app.get(
@@ -36,3 +74,470 @@ def get_db():
 async def root():
     return {"message": "API MovieLens est opérationnelle!"}
 
+
+@app.get(
+    "/metrics",
+    summary="Metriques Prometheus",
+    description="latence par route, nombre de requetes SQL et temps passe dans SQLite par requete HTTP (format texte Prometheus)",
+    response_description="Metriques au format d'exposition Prometheus",
+    operation_id="get_metrics",
+    tags=["Monitoring"]
+)
+def get_metrics():
+    return metrics.metrics_response()
+
+
+# -- Listes paginees par curseur --
+# les listes sont construites a partir des tuples SQL et encodees avec FastJSONResponse (orjson):
+# response_model ne sert qu'a la documentation OpenAPI
+@app.get(
+    "/movies",
+    summary="Lister les films",
+    description="Lister les films tries par movieId, avec filtres optionnels sur le titre et les genres (plusieurs `genre` combines en ET ou en OU selon `genre_match`). Passer `next_cursor` dans `cursor` pour obtenir la page suivante",
+    response_description="Une page de films et le curseur de la page suivante",
+    operation_id="list_movies",
+    tags=["Films"],
+    response_model=schemas.MoviePage
+)
+async def list_movies(
+    cursor: Optional[str] = Query(None, description="curseur renvoye par la page precedente"),
+    limit: int = Query(100, ge=1, le=1000, description="nombre de films par page"),
+    title: Optional[str] = Query(None, description="filtre sur le titre"),
+    genre: Optional[List[str]] = Query(None, description="filtre sur un ou plusieurs genres"),
+    genre_match: str = Query("all", pattern="^(all|any)$", description="all: tous les genres, any: au moins un"),
+    fields: Optional[str] = Query(None, description="colonnes a renvoyer, ex: 'title' (movieId est toujours renvoye)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        items, next_cursor = await async_helpers.get_movies_page(db, cursor=cursor, limit=limit, title=title, genre=genre, genre_match=genre_match, as_dicts=True, fields=fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@app.get(
+    "/movies/search",
+    summary="Rechercher des films par titre",
+    description="Recherche plein texte sur le titre (index FTS5): chaque mot est cherche comme prefixe et les resultats sont tries par pertinence (BM25)",
+    response_description="Les films les plus pertinents",
+    operation_id="search_movies",
+    tags=["Films"],
+    response_model=List[schemas.MovieSimple]
+)
+async def search_movies(
+    q: str = Query(..., min_length=1, description="texte recherche, ex: 'toy sto'"),
+    limit: int = Query(20, ge=1, le=100, description="nombre maximal de films"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await async_helpers.search_movies(db, q, limit=limit)
+
+
+@app.get(
+    "/movies/batch",
+    summary="Recuperer plusieurs films",
+    description="Recuperer jusqu'a 500 films par leurs ids (parametre `ids` repete), par defaut avec lien, statistiques et les evaluations/tags les plus recents de chaque film. `fields` et `include` limitent la reponse. Le nombre de requetes SQL ne depend pas du nombre de films",
+    response_description="Les films trouves, dans l'ordre demande",
+    operation_id="get_movies_batch",
+    tags=["Films"],
+    response_model=List[schemas.MovieView],
+    response_model_exclude_unset=True
+)
+async def movies_batch(
+    ids: List[int] = Query(..., description="identifiants des films"),
+    fields: Optional[str] = Query(None, description="colonnes a renvoyer parmi movieId,title,genres"),
+    include: str = Query("link,stats,ratings,tags", description="objets lies parmi link,stats,ratings,tags,top_tags"),
+    max_ratings: int = Query(20, ge=0, le=1000, description="nombre maximal d'evaluations par film"),
+    max_tags: int = Query(20, ge=0, le=1000, description="nombre maximal de tags par film"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        return await async_helpers.get_movies_batch(db, ids, fields=fields, include=include, max_ratings=max_ratings, max_tags=max_tags)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get(
+    "/movies/top",
+    summary="Classement des films",
+    description="Meilleurs films selon le score bayesien (`weighted`), le nombre (`count`) ou la moyenne (`mean`) des notes, globalement ou filtres par genre et par annee. Lu dans la table pre-calculee movie_stats",
+    response_description="Les films les mieux classes",
+    operation_id="top_movies",
+    tags=["Films"],
+    response_model=List[schemas.MovieRanking]
+)
+async def top_movies(
+    order_by: str = Query("weighted", pattern="^(weighted|count|mean)$", description="critere de classement"),
+    genre: Optional[str] = Query(None, description="limiter a un genre"),
+    year: Optional[int] = Query(None, description="limiter a une annee de sortie"),
+    min_count: int = Query(0, ge=0, description="nombre minimal d'evaluations"),
+    limit: int = Query(10, ge=1, le=100, description="nombre de films"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows = await async_helpers.get_top_movies(db, limit=limit, order_by=order_by, genre=genre, year=year, min_count=min_count)
+    return [
+        {
+            "movieId": movie.movieId,
+            "title": movie.title,
+            "genres": movie.genres,
+            "year": stats.year,
+            "rating_count": stats.rating_count,
+            "rating_mean": stats.rating_mean,
+            "weighted_score": stats.weighted_score,
+        }
+        for movie, stats in rows
+    ]
+
+
+@app.get(
+    "/movies/{movie_id}/stats",
+    summary="Statistiques d'un film",
+    description="Nombre, moyenne, score bayesien et histogramme des notes d'un film",
+    response_description="Les statistiques du film",
+    operation_id="get_movie_stats",
+    tags=["Films"],
+    response_model=schemas.MovieStatsBase
+)
+async def movie_stats(
+    movie_id: int = Path(..., description="identifiant du film"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    stats = await async_helpers.get_movie_stats(db, movie_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Aucune evaluation pour le film {movie_id}")
+    return stats
+
+
+@app.get(
+    "/movies/{movie_id}/similar",
+    summary="Films similaires",
+    description="Les films les plus proches d'un film selon la similarite cosinus ajustee des evaluations (index pre-calcule par `python similarity.py build`)",
+    response_description="Les films similaires, du plus proche au moins proche",
+    operation_id="get_similar_movies",
+    tags=["Films"],
+    response_model=List[schemas.SimilarMovie]
+)
+async def similar_movies(
+    movie_id: int = Path(..., description="identifiant du film"),
+    limit: int = Query(10, ge=1, description="nombre de films similaires, au plus le nombre de voisins par film de l'index (--k)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    index = similarity.get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Index des films similaires non construit")
+    if limit > index.k:
+        raise HTTPException(status_code=400, detail=f"limit doit etre au plus {index.k} (voisins par film de l'index)")
+    neighbors = index.neighbors(movie_id, limit)
+    if neighbors is None:
+        raise HTTPException(status_code=404, detail=f"Aucune evaluation pour le film {movie_id}")
+    movies = await async_helpers.get_movies_batch(db, [neighbor for neighbor, _ in neighbors], include="")
+    scores = dict(neighbors)
+    return [{**movie, "score": scores[movie["movieId"]]} for movie in movies]
+
+
+@app.get(
+    "/movies/{movie_id}",
+    summary="Recuperer un film",
+    description="Recuperer un film. `fields` choisit les colonnes, `include` les objets lies: link, stats (nombre et moyenne des notes), top_tags (tags les plus frequents), ratings et tags (lignes brutes, tronquees). Par defaut: link et stats, sans les lignes d'evaluations",
+    response_description="Le film demande",
+    operation_id="get_movie",
+    tags=["Films"],
+    response_model=schemas.MovieView,
+    response_model_exclude_unset=True
+)
+async def get_movie(
+    movie_id: int = Path(..., description="identifiant du film"),
+    fields: Optional[str] = Query(None, description="colonnes a renvoyer parmi movieId,title,genres"),
+    include: str = Query("link,stats", description="objets lies parmi link,stats,ratings,tags,top_tags"),
+    max_ratings: int = Query(20, ge=0, le=1000, description="nombre maximal d'evaluations"),
+    max_tags: int = Query(20, ge=0, le=1000, description="nombre maximal de tags"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        movie = await async_helpers.get_movie_view(db, movie_id, fields=fields, include=include, max_ratings=max_ratings, max_tags=max_tags)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if movie is None:
+        raise HTTPException(status_code=404, detail=f"Film {movie_id} introuvable")
+    return movie
+
+
+@app.get(
+    "/ratings",
+    summary="Lister les evaluations",
+    description="Lister les evaluations triees par (userId, movieId), avec un filtre optionnel sur la note minimale",
+    response_description="Une page d'evaluations et le curseur de la page suivante",
+    operation_id="list_ratings",
+    tags=["Evaluations"],
+    response_model=schemas.RatingPage
+)
+async def list_ratings(
+    cursor: Optional[str] = Query(None, description="curseur renvoye par la page precedente"),
+    limit: int = Query(100, ge=1, le=1000, description="nombre d'evaluations par page"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5, description="note minimale"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        items, next_cursor = await async_helpers.get_ratings_page(db, cursor=cursor, limit=limit, min_rating=min_rating, as_dicts=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@app.get(
+    "/tags",
+    summary="Lister les tags",
+    description="Lister les tags tries par (userId, movieId, tag), avec un filtre optionnel sur le film",
+    response_description="Une page de tags et le curseur de la page suivante",
+    operation_id="list_tags",
+    tags=["Tags"],
+    response_model=schemas.TagPage
+)
+async def list_tags(
+    cursor: Optional[str] = Query(None, description="curseur renvoye par la page precedente"),
+    limit: int = Query(100, ge=1, le=1000, description="nombre de tags par page"),
+    movie_id: Optional[int] = Query(None, description="filtre sur le film"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        items, next_cursor = await async_helpers.get_tags_page(db, cursor=cursor, limit=limit, movie_id=movie_id, as_dicts=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@app.get(
+    "/tags/autocomplete",
+    summary="Autocompletion des tags",
+    description="Tags du vocabulaire normalise (minuscules) commencant par un prefixe, les plus utilises d'abord",
+    response_description="Les tags suggeres",
+    operation_id="autocomplete_tags",
+    tags=["Tags"],
+    response_model=List[schemas.TagSuggestion]
+)
+async def autocomplete_tags(
+    prefix: str = Query(..., min_length=1, description="debut du tag"),
+    limit: int = Query(10, ge=1, le=100, description="nombre de suggestions"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await async_helpers.autocomplete_tags(db, prefix, limit)
+
+
+@app.get(
+    "/tags/{tag}/movies",
+    summary="Films portant un tag",
+    description="Films portant un tag (toutes casses confondues), les plus tagues d'abord, via l'index inverse tag -> films",
+    response_description="Les films portant le tag",
+    operation_id="get_movies_with_tag",
+    tags=["Tags"],
+    response_model=List[schemas.TaggedMovie]
+)
+async def movies_with_tag(
+    tag: str = Path(..., description="tag recherche"),
+    limit: int = Query(20, ge=1, le=1000, description="nombre de films"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows = await async_helpers.get_movies_with_tag(db, tag, limit)
+    return [{"movieId": movie.movieId, "title": movie.title, "genres": movie.genres, "count": count} for movie, count in rows]
+
+
+@app.get(
+    "/movies/{movie_id}/tags/top",
+    summary="Tags les plus frequents d'un film",
+    description="Les tags normalises les plus souvent poses sur un film",
+    response_description="Les tags du film et leur nombre d'utilisations",
+    operation_id="get_movie_top_tags",
+    tags=["Tags"],
+    response_model=List[schemas.TagCount]
+)
+async def movie_top_tags(
+    movie_id: int = Path(..., description="identifiant du film"),
+    limit: int = Query(10, ge=1, le=100, description="nombre de tags"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await async_helpers.get_movie_top_tags(db, movie_id, limit)
+
+
+@app.get(
+    "/links",
+    summary="Lister les liens",
+    description="Lister les liens IMDB/TMDB tries par movieId",
+    response_description="Une page de liens et le curseur de la page suivante",
+    operation_id="list_links",
+    tags=["Liens"],
+    response_model=schemas.LinkPage
+)
+async def list_links(
+    cursor: Optional[str] = Query(None, description="curseur renvoye par la page precedente"),
+    limit: int = Query(100, ge=1, le=1000, description="nombre de liens par page"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        items, next_cursor = await async_helpers.get_links_page(db, cursor=cursor, limit=limit, as_dicts=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+# -- Export complet en flux --
+# endpoints synchrones: le generateur ouvre sa propre session, qui reste ouverte pendant tout l'envoi de la reponse
+@app.get(
+    "/export/ratings",
+    summary="Exporter les evaluations",
+    description="Exporter toutes les evaluations filtrees en NDJSON ou CSV, envoyees en flux (memoire constante cote serveur)",
+    response_description="Flux NDJSON ou CSV des evaluations",
+    operation_id="export_ratings",
+    tags=["Export"]
+)
+def export_ratings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="format du flux"),
+    movie_id: Optional[int] = Query(None, description="filtre sur le film"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5, description="note minimale"),
+    start: Optional[int] = Query(None, description="timestamp minimal (inclus)"),
+    end: Optional[int] = Query(None, description="timestamp maximal (exclu)")
+):
+    def batches():
+        with SessionLocal() as db:
+            yield from helpers.iter_ratings(db, movie_id=movie_id, min_rating=min_rating, start=start, end=end)
+    columns = [column.name for column in models.Rating.__table__.columns]
+    return export_response("ratings", columns, batches(), format)
+
+
+@app.get(
+    "/export/tags",
+    summary="Exporter les tags",
+    description="Exporter tous les tags filtres en NDJSON ou CSV, envoyes en flux (memoire constante cote serveur)",
+    response_description="Flux NDJSON ou CSV des tags",
+    operation_id="export_tags",
+    tags=["Export"]
+)
+def export_tags(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="format du flux"),
+    movie_id: Optional[int] = Query(None, description="filtre sur le film"),
+    start: Optional[int] = Query(None, description="timestamp minimal (inclus)"),
+    end: Optional[int] = Query(None, description="timestamp maximal (exclu)")
+):
+    def batches():
+        with SessionLocal() as db:
+            yield from helpers.iter_tags(db, movie_id=movie_id, start=start, end=end)
+    columns = [column.name for column in models.Tag.__table__.columns]
+    return export_response("tags", columns, batches(), format)
+
+
+# -- Recommandations --
+@app.get(
+    "/users/{user_id}/recommendations",
+    summary="Recommandations pour un utilisateur",
+    description="Films recommandes a un utilisateur par factorisation de matrice (modele entraine par `python recommender.py train`), sans les films qu'il a deja notes",
+    response_description="Les films recommandes, de la meilleure note predite a la moins bonne",
+    operation_id="get_user_recommendations",
+    tags=["Recommandations"],
+    response_model=List[schemas.RecommendedMovie]
+)
+async def user_recommendations(
+    user_id: int = Path(..., description="identifiant de l'utilisateur"),
+    limit: int = Query(10, ge=1, le=100, description="nombre de films recommandes"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    model = recommender.get_recommender()
+    if model is None:
+        raise HTTPException(status_code=503, detail="Modele de recommandation non entraine")
+    rated = await async_helpers.get_user_rated_movie_ids(db, user_id)
+    recommendations = model.recommend(user_id, rated, limit)
+    if recommendations is None:
+        raise HTTPException(status_code=404, detail=f"Utilisateur {user_id} inconnu du modele")
+    movies = await async_helpers.get_movies_batch(db, [movie_id for movie_id, _ in recommendations], include="")
+    scores = dict(recommendations)
+    return [{**movie, "predicted_rating": scores[movie["movieId"]]} for movie in movies]
+
+
+# -- Statistiques globales (colonnes NumPy en memoire) --
+# endpoints synchrones: un rechargement des colonnes apres un nouveau chargement ne bloque pas la boucle d'evenements
+@app.get(
+    "/stats/summary",
+    summary="Resume des evaluations",
+    description="Nombre d'evaluations, d'utilisateurs et de films notes, note moyenne et periode couverte",
+    response_description="Le resume des evaluations",
+    operation_id="stats_summary",
+    tags=["Statistiques"],
+    response_model=schemas.RatingSummary
+)
+def stats_summary():
+    return analytics.get_analytics().summary()
+
+
+@app.get(
+    "/stats/histogram",
+    summary="Histogramme des notes",
+    description="Nombre d'evaluations pour chaque note de 0.5 a 5.0",
+    response_description="L'histogramme des notes",
+    operation_id="stats_histogram",
+    tags=["Statistiques"],
+    response_model=List[schemas.HistogramBucket]
+)
+def stats_histogram():
+    return analytics.get_analytics().histogram()
+
+
+@app.get(
+    "/stats/genres",
+    summary="Notes par genre",
+    description="Nombre d'evaluations et note moyenne de chaque genre",
+    response_description="Les statistiques par genre, du plus note au moins note",
+    operation_id="stats_genres",
+    tags=["Statistiques"],
+    response_model=List[schemas.GenreStats]
+)
+def stats_genres():
+    return analytics.get_analytics().by_genre()
+
+
+@app.get(
+    "/stats/years",
+    summary="Evaluations par annee",
+    description="Nombre d'evaluations et note moyenne par annee de l'evaluation",
+    response_description="Les statistiques par annee",
+    operation_id="stats_years",
+    tags=["Statistiques"],
+    response_model=List[schemas.YearStats]
+)
+def stats_years():
+    return analytics.get_analytics().by_year()
+
+
+@app.get(
+    "/stats/users/top",
+    summary="Utilisateurs les plus actifs",
+    description="Les utilisateurs ayant le plus d'evaluations",
+    response_description="Les utilisateurs les plus actifs",
+    operation_id="stats_top_users",
+    tags=["Statistiques"],
+    response_model=List[schemas.UserActivity]
+)
+def stats_top_users(limit: int = Query(10, ge=1, le=1000, description="nombre d'utilisateurs")):
+    return analytics.get_analytics().top_users(limit)
+
+
+# -- Series temporelles --
+@app.get(
+    "/timeseries",
+    summary="Activite par periode",
+    description="Nombre d'evaluations (ou de tags) et note moyenne par jour, mois ou annee, pour tout le catalogue, un genre ou un film (mois/annee), lus dans des agregats pre-calcules par le chargeur",
+    response_description="Les points de la serie, par periode croissante",
+    operation_id="get_timeseries",
+    tags=["Statistiques"],
+    response_model=List[schemas.ActivityPoint]
+)
+async def timeseries(
+    source: str = Query("ratings", pattern="^(ratings|tags)$", description="evaluations ou tags"),
+    granularity: str = Query("month", pattern="^(day|month|year)$", description="taille des periodes"),
+    start: Optional[int] = Query(None, description="timestamp minimal (inclus)"),
+    end: Optional[int] = Query(None, description="timestamp maximal (exclu)"),
+    movie_id: Optional[int] = Query(None, description="serie d'un film"),
+    genre: Optional[str] = Query(None, description="serie d'un genre"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        points = await async_helpers.get_activity(db, source, granularity, start, end, movie_id, genre)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(points)
@@ -0,0 +1,101 @@
+"""Metriques Prometheus de l'API: latence par route, nombre de requetes SQL et temps passe dans SQLite par requete HTTP
+
+Un nombre de requetes SQL par appel qui grandit avec la taille de la reponse signale un N+1;
+les routes lentes se lisent dans movielens_http_request_duration_seconds.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REQUESTS = Counter("movielens_http_requests_total", "Requetes HTTP par route et code de statut", ["method", "route", "status"])
+REQUEST_DURATION = Histogram("movielens_http_request_duration_seconds", "Duree des requetes HTTP par route", ["method", "route"])
+QUERIES_PER_REQUEST = Histogram("movielens_db_queries_per_request", "Requetes SQL executees par requete HTTP", ["route"],
+                                buckets=QUERY_BUCKETS)
+DB_TIME_PER_REQUEST = Histogram("movielens_db_time_per_request_seconds", "Temps passe dans SQLite par requete HTTP", ["route"])
+QUERY_DURATION = Histogram("movielens_db_query_duration_seconds", "Duree de chaque requete SQL")
+HELPER_CACHE_REQUESTS = Counter("movielens_helper_cache_requests_total", "Lectures du cache de query_helpers par fonction",
+                                ["helper", "result"])
+
+
+class RequestStats:
+    """Compteurs SQL de la requete HTTP en cours"""
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+# un objet par requete HTTP, partage avec les threads (endpoints sync) et les greenlets (AsyncSession) qui la servent
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine):
+    # chronometrer chaque requete SQL du moteur (pour un moteur async: engine.sync_engine)
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        QUERY_DURATION.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+    return engine
+
+
+def route_name(request: Request) -> str:
+    # le chemin declare (/movies/{movie_id}) plutot que l'URL, pour garder un nombre borne de series
+    route = request.scope.get("route")
+    return getattr(route, "path", "inconnue")
+
+
+async def track_requests(request: Request, call_next):
+    # middleware: duree, code de statut et compteurs SQL de chaque requete. L'observation a lieu quand le corps de la
+    # reponse a ete envoye: une reponse en flux (/export) execute ses requetes SQL pendant l'envoi, avec le compteur
+    # de la requete toujours actif
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    start = time.perf_counter()
+
+    def observe(status: int):
+        elapsed = time.perf_counter() - start
+        _request_stats.reset(token)
+        route = route_name(request)
+        REQUESTS.labels(request.method, route, str(status)).inc()
+        REQUEST_DURATION.labels(request.method, route).observe(elapsed)
+        QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+        DB_TIME_PER_REQUEST.labels(route).observe(stats.db_time)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        observe(500)
+        raise
+    response.body_iterator = observed_body(response.body_iterator, lambda: observe(response.status_code))
+    return response
+
+async def observed_body(body, on_complete):
+    # corps de la reponse inchange, puis on_complete() une fois le dernier morceau envoye (ou l'envoi interrompu)
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        on_complete()
+
+
+def metrics_response() -> Response:
+    # plusieurs workers (serve.py): additionner les fichiers de metriques de tous les processus
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
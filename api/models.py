@@ -1,5 +1,6 @@
 """SQLAlchemy"""
-from sqlalchemy import Column, Integer, String, ForeignKey,Float
+import re
+from sqlalchemy import Column, Integer, String, ForeignKey,Float, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -13,6 +14,8 @@ class Movie(Base):
     ratings = relationship("Rating", back_populates="movie", cascade="all, delete")
     tags = relationship("Tag", back_populates="movie", cascade="all, delete")
     link = relationship("Link", back_populates="movie", cascade="all, delete", uselist=False)
+    genre_list = relationship("MovieGenre", back_populates="movie", cascade="all, delete")
+    stats = relationship("MovieStats", back_populates="movie", cascade="all, delete", uselist=False)
 
 
 class Rating(Base):
@@ -25,6 +28,14 @@ class Rating(Base):
 
     movie = relationship("Movie", back_populates="ratings")
 
+    # la cle primaire commence par userId: index pour les acces par film, par note et par periode
+    __table_args__ = (
+        Index("ix_ratings_movie_rating", "movieId", "rating"), # couvrant: notes d'un film (movie_stats, export par film)
+        Index("ix_ratings_user_timestamp", "userId", "timestamp"), # couvrant: historique d'un utilisateur
+        Index("ix_ratings_rating", "rating"), # filtre min_rating
+        Index("ix_ratings_timestamp", "timestamp"), # exports par periode, chargement incremental
+    )
+
 
 class Tag(Base):
     __tablename__ = "tags"
@@ -36,6 +47,11 @@ class Tag(Base):
 
     movie = relationship("Movie", back_populates="tags")
 
+    __table_args__ = (
+        Index("ix_tags_movie_timestamp", "movieId", "timestamp"), # tags d'un film, les plus recents d'abord
+        Index("ix_tags_timestamp", "timestamp"), # exports par periode, chargement incremental
+    )
+
 
 class Link(Base):
     __tablename__ = "links"
@@ -44,4 +60,91 @@ class Link(Base):
     imdbId = Column(String)
     tmdbId = Column(Integer)
 
-    movie = relationship("Movie", back_populates="link")
\ No newline at end of file
+    movie = relationship("Movie", back_populates="link")
+
+
+class MovieGenre(Base):
+    # table de liaison film <-> genre, construite au chargement a partir de Movie.genres ("Action|Comedy")
+    # la cle primaire commence par le genre: un filtre sur le genre est une recherche dans l'index
+    __tablename__ = "movie_genres"
+
+    genre = Column(String(collation="NOCASE"), primary_key=True)
+    movieId = Column(Integer, ForeignKey("movies.movieId"), primary_key=True)
+
+    movie = relationship("Movie", back_populates="genre_list")
+
+
+class MovieStats(Base):
+    # agregats des evaluations par film, recalcules par le chargeur (load_data.py) a partir de Rating
+    __tablename__ = "movie_stats"
+
+    movieId = Column(Integer, ForeignKey("movies.movieId"), primary_key=True)
+    year = Column(Integer) # annee extraite du titre, ex: "Toy Story (1995)"
+    rating_count = Column(Integer)
+    rating_sum = Column(Float)
+    rating_mean = Column(Float)
+    weighted_score = Column(Float) # moyenne bayesienne, tiree vers la moyenne globale pour les films peu notes
+    histogram = Column(JSON) # nombre d'evaluations pour chaque note de 0.5 a 5.0
+
+    movie = relationship("Movie", back_populates="stats")
+
+    __table_args__ = (
+        Index("ix_movie_stats_weighted_score", "weighted_score"),
+        Index("ix_movie_stats_rating_count", "rating_count"),
+        Index("ix_movie_stats_year_weighted_score", "year", "weighted_score"),
+    )
+
+
+class DatasetInfo(Base):
+    # metadonnees du chargement (cle/valeur): version du jeu de donnees et date du chargement
+    __tablename__ = "dataset_info"
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+class ActivityRollup(Base):
+    # nombre d'evaluations/tags et somme des notes par periode (jour, mois, annee), construits par le chargeur
+    # scope: "all" (tout le catalogue), "genre" (scope_key = genre) ou "movie" (scope_key = movieId, mois et annee seulement)
+    # la cle primaire se termine par bucket: une plage de dates est une recherche dans l'index
+    __tablename__ = "activity_rollups"
+
+    source = Column(String, primary_key=True) # "ratings" ou "tags"
+    granularity = Column(String, primary_key=True) # "day", "month" ou "year"
+    scope = Column(String, primary_key=True)
+    scope_key = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True) # debut de la periode (timestamp UTC)
+    count = Column(Integer)
+    rating_sum = Column(Float) # NULL pour les tags
+
+
+def normalize_tag(tag: str) -> str:
+    # forme normalisee d'un tag: "  Funny " et "funny" sont le meme terme du vocabulaire
+    return re.sub(r"\s+", " ", tag or "").strip().lower()
+
+
+class TagTerm(Base):
+    # vocabulaire des tags normalises (normalize_tag), construit par le chargeur
+    __tablename__ = "tag_terms"
+
+    id = Column(Integer, primary_key=True)
+    term = Column(String, unique=True, nullable=False) # index unique: autocompletion par plage (term >= prefixe)
+    usage_count = Column(Integer) # nombre de tags (utilisateur, film) utilisant ce terme
+    movie_count = Column(Integer) # nombre de films portant ce terme
+
+    postings = relationship("TagPosting", back_populates="term")
+
+
+class TagPosting(Base):
+    # index inverse terme -> films, avec le nombre d'utilisateurs ayant pose le terme sur le film
+    __tablename__ = "tag_postings"
+
+    term_id = Column(Integer, ForeignKey("tag_terms.id"), primary_key=True)
+    movieId = Column(Integer, ForeignKey("movies.movieId"), primary_key=True)
+    count = Column(Integer)
+
+    term = relationship("TagTerm", back_populates="postings")
+
+    __table_args__ = (
+        Index("ix_tag_postings_movie_count", "movieId", "count"), # tags les plus frequents d'un film
+    )
@@ -1,30 +1,207 @@
 """SQLAlchemy Query Functions for MovieLens API """
+import re
+
+from sqlalchemy import func, select, text, tuple_
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, aliased, load_only
 from typing import Optional
 
+import database
+import helper_cache
 import models
+from query_params import (EXPORT_BATCH_SIZE, MOVIE_FIELDS, decode_cursor, encode_cursor, genre_list, parse_fields,
+                          parse_list)
+
+
+# --- Pagination par curseur (keyset) ---
+def columns_or_model(model, as_dicts: bool = False, fields=None):
+    # as_dicts=True: selectionner seulement les colonnes (tuples SQL), sans objets ORM a hydrater
+    # fields: limiter aux colonnes demandees (la cle primaire est toujours gardee pour le curseur)
+    if not as_dicts:
+        return [model]
+    return [column for column in model.__table__.columns if not fields or column.primary_key or column.key in fields]
+
+def paginate(query, key_columns, cursor: Optional[str] = None, limit: int = 100, as_dicts: bool = False):
+    # seek pagination: WHERE (cle) > (curseur) ORDER BY cle LIMIT n, le cout ne depend pas de la profondeur
+    if cursor:
+        values = decode_cursor(cursor, [column.type.python_type for column in key_columns])
+        query = query.filter(tuple_(*key_columns) > tuple_(*values))
+    rows = query.order_by(*key_columns).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in key_columns])
+    if as_dicts:
+        rows = [row._asdict() for row in rows]
+    return rows, next_cursor
+
+# --- Genres ---
+def filter_genres(query, genre, genre_match: str = "all"):
+    # filtrer les films par genre via l'index de movie_genres (ET: tous les genres, OU: au moins un)
+    genres = genre_list(genre)
+    if not genres:
+        return query
+    movie_ids = select(models.MovieGenre.movieId).where(models.MovieGenre.genre.in_(genres))
+    if genre_match == "all" and len(genres) > 1:
+        movie_ids = movie_ids.group_by(models.MovieGenre.movieId).having(
+            func.count(models.MovieGenre.genre.distinct()) == len({g.lower() for g in genres})
+        )
+    elif genre_match not in ("all", "any"):
+        raise ValueError("genre_match doit valoir 'all' ou 'any'")
+    return query.filter(models.Movie.movieId.in_(movie_ids))
+
 
 # --- Films ---
 def get_movie(db: Session, movie_id: int) :
     # recuperer un film par son ID
     return db.query(models.Movie).filter(models.Movie.movieId == movie_id).first()
 
-def get_movies(db: Session, skip: int = 0, limit: int = 100, title: str = None, genre: str=None):
+def get_movies(db: Session, skip: int = 0, limit: int = 100, title: str = None, genre=None, genre_match: str = "all"):
     #recuperer une liste de films avec filtres optionnels
     query = db.query(models.Movie)
     if title:
         query = query.filter(models.Movie.title.ilike(f"%{title}%"))
-    if genre:
-        query = query.filter(models.Movie.genres.ilike(f"%{genre}%"))
+    query = filter_genres(query, genre, genre_match)
     return query.offset(skip).limit(limit).all()
 
+def get_movies_page(db: Session, cursor: Optional[str] = None, limit: int = 100, title: str = None, genre=None, genre_match: str = "all",
+                    as_dicts: bool = False, fields=None):
+    # recuperer une page de films triee par movieId, avec le curseur de la page suivante
+    query = db.query(*columns_or_model(models.Movie, as_dicts, parse_fields(fields)))
+    if title:
+        query = query.filter(models.Movie.title.ilike(f"%{title}%"))
+    query = filter_genres(query, genre, genre_match)
+    return paginate(query, [models.Movie.movieId], cursor, limit, as_dicts)
+
+
+def fts_query(search: str) -> str:
+    # transformer la saisie utilisateur en requete FTS5: chaque mot devient un prefixe ("toy"* "sto"*)
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", search))
+
+def search_movies(db: Session, search: str, limit: int = 20):
+    # recherche plein texte sur le titre via movies_fts, triee par pertinence (BM25)
+    match = fts_query(search)
+    if not match:
+        return []
+    stmt = text(
+        "SELECT movies.* FROM movies_fts JOIN movies ON movies.movieId = movies_fts.rowid "
+        "WHERE movies_fts MATCH :match ORDER BY bm25(movies_fts) LIMIT :limit"
+    )
+    return db.query(models.Movie).from_statement(stmt).params(match=match, limit=limit).all()
+
+
+# --- Projections des films (fields= / include=) ---
+# link, stats (nombre/moyenne des notes pre-calcules), ratings et tags (lignes brutes, tronquees), top_tags (tags les plus frequents)
+MOVIE_INCLUDES = ("link", "stats", "ratings", "tags", "top_tags")
+MAX_BATCH_SIZE = 500
+
+def capped_children(db: Session, model, movie_ids, limit: int):
+    # les `limit` lignes les plus recentes de chaque film, en une seule requete (ROW_NUMBER par movieId)
+    position = func.row_number().over(partition_by=model.movieId, order_by=model.timestamp.desc()).label("position")
+    ranked = select(model, position).where(model.movieId.in_(movie_ids)).subquery()
+    return db.query(aliased(model, ranked)).filter(ranked.c.position <= limit).all()
+
+def top_tags(db: Session, movie_ids, limit: int):
+    # les `limit` tags les plus frequents de chaque film, lus dans l'index inverse (tags normalises)
+    rows = (
+        db.query(models.TagPosting.movieId, models.TagTerm.term, models.TagPosting.count)
+        .join(models.TagTerm, models.TagTerm.id == models.TagPosting.term_id)
+        .filter(models.TagPosting.movieId.in_(movie_ids))
+        .order_by(models.TagPosting.movieId, models.TagPosting.count.desc(), models.TagTerm.term)
+        .all()
+    )
+    result = {}
+    for movie_id, tag_text, count in rows:
+        movie_tags = result.setdefault(movie_id, [])
+        if len(movie_tags) < limit:
+            movie_tags.append({"tag": tag_text, "count": count})
+    return result
+
+def get_movies_batch(db: Session, movie_ids: list, fields=None, include=("link", "stats", "ratings", "tags"),
+                     max_ratings: int = 20, max_tags: int = 20):
+    # recuperer plusieurs films sous forme de dicts ne contenant que les colonnes (fields) et les objets lies (include) demandes
+    # une requete pour les films (colonnes via load_only, lien/stats via joinedload) + une par inclusion ratings/tags/top_tags,
+    # quel que soit le nombre de films
+    fields = parse_fields(fields) or list(MOVIE_FIELDS)
+    include = parse_list(include, MOVIE_INCLUDES, "include") or []
+    movie_ids = list(dict.fromkeys(movie_ids))
+    if len(movie_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"au plus {MAX_BATCH_SIZE} films par lot")
+    if not movie_ids:
+        return []
+
+    options = [load_only(*[getattr(models.Movie, field) for field in fields])]
+    if "link" in include:
+        options.append(joinedload(models.Movie.link))
+    if "stats" in include:
+        options.append(joinedload(models.Movie.stats))
+    movies = db.query(models.Movie).options(*options).filter(models.Movie.movieId.in_(movie_ids)).all()
+
+    children = {}
+    if "ratings" in include:
+        for rating in capped_children(db, models.Rating, movie_ids, max_ratings):
+            children.setdefault(("ratings", rating.movieId), []).append(rating)
+    if "tags" in include:
+        for tag in capped_children(db, models.Tag, movie_ids, max_tags):
+            children.setdefault(("tags", tag.movieId), []).append(tag)
+    tag_counts = top_tags(db, movie_ids, max_tags) if "top_tags" in include else {}
+
+    by_id = {}
+    for movie in movies:
+        view = {field: getattr(movie, field) for field in fields}
+        view["movieId"] = movie.movieId
+        for name in include:
+            if name in ("ratings", "tags"):
+                view[name] = children.get((name, movie.movieId), [])
+            elif name == "top_tags":
+                view[name] = tag_counts.get(movie.movieId, [])
+            else:
+                view[name] = getattr(movie, name)
+        by_id[movie.movieId] = view
+    # garder l'ordre demande
+    return [by_id[movie_id] for movie_id in movie_ids if movie_id in by_id]
+
+def get_movie_view(db: Session, movie_id: int, fields=None, include=("link", "stats"), max_ratings: int = 20, max_tags: int = 20):
+    # un seul film, par defaut sans les lignes d'evaluations et de tags
+    movies = get_movies_batch(db, [movie_id], fields, include, max_ratings, max_tags)
+    return movies[0] if movies else None
+
+
+# --- Statistiques par film (table movie_stats) ---
+TOP_ORDERS = {
+    "weighted": models.MovieStats.weighted_score,
+    "count": models.MovieStats.rating_count,
+    "mean": models.MovieStats.rating_mean,
+}
+
+def get_movie_stats(db: Session, movie_id: int):
+    # recuperer les agregats d'evaluations d'un film
+    return db.query(models.MovieStats).filter(models.MovieStats.movieId == movie_id).first()
+
+def get_top_movies(db: Session, limit: int = 10, order_by: str = "weighted", genre: Optional[str] = None,
+                   year: Optional[int] = None, min_count: int = 0):
+    # meilleurs films (score bayesien, nombre ou moyenne des notes), globalement, par genre ou par annee
+    if order_by not in TOP_ORDERS:
+        raise ValueError(f"order_by doit valoir {', '.join(TOP_ORDERS)}")
+    query = db.query(models.Movie, models.MovieStats).join(models.MovieStats, models.MovieStats.movieId == models.Movie.movieId)
+    if genre:
+        query = query.join(models.MovieGenre, models.MovieGenre.movieId == models.Movie.movieId).filter(models.MovieGenre.genre == genre)
+    if year is not None:
+        query = query.filter(models.MovieStats.year == year)
+    if min_count:
+        query = query.filter(models.MovieStats.rating_count >= min_count)
+    return query.order_by(TOP_ORDERS[order_by].desc(), models.Movie.movieId).limit(limit).all()
+
 
 # --- Evaluations (Ratings) ---
 def get_rating(db: Session, user_id: int, movie_id: int):
     # recuperer une evaluation par user_id et movie_id
     return db.query(models.Rating).filter(models.Rating.userId == user_id, models.Rating.movieId == movie_id).first()
 
+def get_user_rated_movie_ids(db: Session, user_id: int) -> list:
+    # films deja notes par un utilisateur (prefixe userId de la cle primaire (userId, movieId): recherche dans l'index)
+    return [movie_id for (movie_id,) in db.query(models.Rating.movieId).filter(models.Rating.userId == user_id)]
+
 def get_ratings(db: Session, skip: int = 0, limit: int = 100, min_rating: Optional[float] = None):
     # recuperer une liste d'evaluations avec un filtre optionnel sur la note minimale
     query = db.query(models.Rating)
@@ -32,6 +209,14 @@ def get_ratings(db: Session, skip: int = 0, limit: int = 100, min_rating: Option
         query = query.filter(models.Rating.rating >= min_rating)
     return query.offset(skip).limit(limit).all()
 
+def get_ratings_page(db: Session, cursor: Optional[str] = None, limit: int = 100, min_rating: Optional[float] = None,
+                     as_dicts: bool = False):
+    # recuperer une page d'evaluations triee par (userId, movieId)
+    query = db.query(*columns_or_model(models.Rating, as_dicts))
+    if min_rating is not None:
+        query = query.filter(models.Rating.rating >= min_rating)
+    return paginate(query, [models.Rating.userId, models.Rating.movieId], cursor, limit, as_dicts)
+
 
 # --- Tags ---
 def get_tag(db: Session, user_id: int, movie_id: int, tag_text: str):
@@ -46,6 +231,41 @@ def get_tags(db: Session, skip: int = 0, limit: int = 100, movie_id: Optional[in
         query = query.filter(models.Tag.movieId == movie_id)
     return query.offset(skip).limit(limit).all()
 
+def get_tags_page(db: Session, cursor: Optional[str] = None, limit: int = 100, movie_id: Optional[int] = None,
+                  as_dicts: bool = False):
+    # recuperer une page de tags triee par (userId, movieId, tag)
+    query = db.query(*columns_or_model(models.Tag, as_dicts))
+    if movie_id is not None:
+        query = query.filter(models.Tag.movieId == movie_id)
+    return paginate(query, [models.Tag.userId, models.Tag.movieId, models.Tag.tag], cursor, limit, as_dicts)
+
+
+
+# --- Vocabulaire des tags et index inverse ---
+def autocomplete_tags(db: Session, prefix: str, limit: int = 10):
+    # termes commencant par `prefix` (plage sur l'index unique de term), les plus utilises d'abord
+    prefix = models.normalize_tag(prefix)
+    query = db.query(models.TagTerm)
+    if prefix:
+        query = query.filter(models.TagTerm.term >= prefix, models.TagTerm.term < prefix + "\uffff")
+    return query.order_by(models.TagTerm.usage_count.desc(), models.TagTerm.term).limit(limit).all()
+
+def get_movies_with_tag(db: Session, tag: str, limit: int = 20):
+    # films portant un tag (toutes casses confondues), les plus tagues d'abord
+    return (
+        db.query(models.Movie, models.TagPosting.count)
+        .join(models.TagPosting, models.TagPosting.movieId == models.Movie.movieId)
+        .join(models.TagTerm, models.TagTerm.id == models.TagPosting.term_id)
+        .filter(models.TagTerm.term == models.normalize_tag(tag))
+        .order_by(models.TagPosting.count.desc(), models.Movie.movieId)
+        .limit(limit)
+        .all()
+    )
+
+def get_movie_top_tags(db: Session, movie_id: int, limit: int = 10):
+    # tags les plus frequents d'un film
+    return top_tags(db, [movie_id], limit).get(movie_id, [])
+
 
 
 # --- Links ---
@@ -58,6 +278,10 @@ def get_links(db: Session, skip: int = 0, limit: int = 100):
     # recuperer une liste de liens
     return db.query(models.Link).offset(skip).limit(limit).all()
 
+def get_links_page(db: Session, cursor: Optional[str] = None, limit: int = 100, as_dicts: bool = False):
+    # recuperer une page de liens triee par movieId
+    return paginate(db.query(*columns_or_model(models.Link, as_dicts)), [models.Link.movieId], cursor, limit, as_dicts)
+
 
 # ---Requetes analytiques ---
 def get_movie_count(db:Session):
@@ -78,3 +302,109 @@ def get_link_count(db:Session):
     return db.query(models.Link).count()
 
 # c'est optionnele mais on peut passer directemment a l'api c'est une bonne pratique
+
+
+# --- Export en flux ---
+def stream_rows(db: Session, stmt, batch_size: int = EXPORT_BATCH_SIZE):
+    # lire le resultat par paquets de batch_size tuples (yield_per: curseur cote serveur, memoire constante)
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield batch
+
+def iter_ratings(db: Session, movie_id: Optional[int] = None, min_rating: Optional[float] = None,
+                 start: Optional[int] = None, end: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    # parcourir les evaluations filtrees, par paquets de tuples (userId, movieId, rating, timestamp)
+    ratings = models.Rating.__table__
+    stmt = select(*ratings.columns)
+    if movie_id is not None:
+        stmt = stmt.where(ratings.c.movieId == movie_id)
+    if min_rating is not None:
+        stmt = stmt.where(ratings.c.rating >= min_rating)
+    if start is not None:
+        stmt = stmt.where(ratings.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(ratings.c.timestamp < end)
+    return stream_rows(db, stmt, batch_size)
+
+def iter_tags(db: Session, movie_id: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None,
+              batch_size: int = EXPORT_BATCH_SIZE):
+    # parcourir les tags filtres, par paquets de tuples (userId, movieId, tag, timestamp)
+    tags = models.Tag.__table__
+    stmt = select(*tags.columns)
+    if movie_id is not None:
+        stmt = stmt.where(tags.c.movieId == movie_id)
+    if start is not None:
+        stmt = stmt.where(tags.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(tags.c.timestamp < end)
+    return stream_rows(db, stmt, batch_size)
+
+
+# --- Series temporelles (table activity_rollups) ---
+ROLLUP_GRANULARITIES = ("day", "month", "year")
+ROLLUP_SOURCES = ("ratings", "tags")
+
+def get_activity(db: Session, source: str = "ratings", granularity: str = "month", start: Optional[int] = None,
+                 end: Optional[int] = None, movie_id: Optional[int] = None, genre: Optional[str] = None):
+    # nombre d'evaluations (ou de tags) et note moyenne par periode, lus dans les agregats pre-calcules
+    if source not in ROLLUP_SOURCES or granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError("source ou granularite invalide")
+    if movie_id is not None and genre:
+        raise ValueError("filtrer par film ou par genre, pas les deux")
+    if movie_id is not None and granularity == "day":
+        raise ValueError("la serie par film existe seulement par mois ou par annee")
+    scope, scope_key = "all", ""
+    if movie_id is not None:
+        scope, scope_key = "movie", str(movie_id)
+    elif genre:
+        # scope_key garde la casse du genre: nom canonique lu dans movie_genres (NOCASE), comme les autres filtres,
+        # par une sous-requete dans la meme requete
+        scope = "genre"
+        scope_key = select(models.MovieGenre.genre).where(models.MovieGenre.genre == genre).limit(1).scalar_subquery()
+    rollup = models.ActivityRollup
+    query = db.query(rollup.bucket, rollup.count, rollup.rating_sum).filter(
+        rollup.source == source, rollup.granularity == granularity, rollup.scope == scope, rollup.scope_key == scope_key
+    )
+    if start is not None:
+        query = query.filter(rollup.bucket >= start)
+    if end is not None:
+        query = query.filter(rollup.bucket < end)
+    return [
+        {"bucket": bucket, "count": count, "rating_mean": rating_sum / count if rating_sum is not None else None}
+        for bucket, count, rating_sum in query.order_by(rollup.bucket)
+    ]
+
+
+# --- Backend colonne (MOVIELENS_BACKEND=snapshot) ---
+# ces fonctions sont remplacees par leurs equivalents de snapshot.py, qui lisent les tables de base dans l'instantane
+# Arrow mappe en memoire; les lignes sont des tuples nommes avec les memes attributs que les objets ORM (sans relations),
+# des dicts si as_dicts=True. Les autres (statistiques, recherche, index des tags...) restent sur SQLite.
+# Dependance dans un seul sens: snapshot.py n'importe pas ce module (parametres communs dans query_params.py)
+SNAPSHOT_HELPERS = (
+    "get_movie", "get_movies", "get_movies_page",
+    "get_rating", "get_user_rated_movie_ids", "get_ratings", "get_ratings_page",
+    "get_tag", "get_tags", "get_tags_page",
+    "get_link", "get_links", "get_links_page",
+    "get_movie_count", "get_rating_count", "get_tag_count", "get_link_count",
+    "iter_ratings", "iter_tags",
+)
+
+if database.BACKEND == "snapshot":
+    import snapshot
+    globals().update({name: getattr(snapshot, name) for name in SNAPSHOT_HELPERS})
+
+
+# --- Cache des lectures ponctuelles (helper_cache.py) ---
+# duree de vie en secondes par fonction; le cache est aussi vide a chaque changement de version du jeu de donnees.
+# Applique apres le choix du backend: les fonctions de snapshot.py sont memoisees de la meme facon
+CACHED_HELPERS = {
+    "get_movie": 300,
+    "get_link": 300,
+    "get_movie_view": 300, # GET /movies/{movie_id}
+    "get_movie_count": 60,
+    "get_rating_count": 60,
+    "get_tag_count": 60,
+    "get_link_count": 60,
+}
+
+globals().update({name: helper_cache.memoize(globals()[name], ttl) for name, ttl in CACHED_HELPERS.items()})
@@ -0,0 +1,55 @@
+"""Parametres de requete communs aux deux backends (query_helpers.py sur SQLite, snapshot.py sur l'instantane Arrow)
+
+Curseurs de pagination, listes de genres et de champs: fonctions pures, sans acces a la base.
+"""
+import base64
+import json
+
+MOVIE_FIELDS = ("movieId", "title", "genres")
+EXPORT_BATCH_SIZE = 5000
+
+
+# --- Pagination par curseur (keyset) ---
+def encode_cursor(values: list) -> str:
+    # curseur opaque: les valeurs de la cle primaire de la derniere ligne renvoyee
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, key_types: list) -> list:
+    # key_types: type python de chaque colonne de la cle (int, str); un curseur forge ne doit pas atteindre SQLite
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("curseur invalide")
+    if not isinstance(values, list) or len(values) != len(key_types):
+        raise ValueError("curseur invalide")
+    for value, key_type in zip(values, key_types):
+        if type(value) is not key_type: # bool est un int pour isinstance
+            raise ValueError("curseur invalide")
+    return values
+
+
+# --- Genres ---
+def genre_list(genre) -> list:
+    # accepter un genre, "Action|Comedy" ou une liste de genres
+    if not genre:
+        return []
+    if isinstance(genre, str):
+        genre = genre.split("|")
+    return [g.strip() for g in genre if g and g.strip()]
+
+
+# --- Projections ---
+def parse_list(value, allowed, name: str) -> list:
+    # "title,genres" ou ["title", "genres"] -> liste validee
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    items = [item.strip() for item in value if item and item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise ValueError(f"{name} inconnu(s): {', '.join(unknown)} (valeurs possibles: {', '.join(allowed)})")
+    return items
+
+def parse_fields(fields) -> list:
+    return parse_list(fields, MOVIE_FIELDS, "fields")
@@ -0,0 +1,162 @@
+"""Recommandations par utilisateur: factorisation de la matrice des evaluations (ALS) entrainee hors ligne
+
+Entrainement:  python recommender.py train --factors 32 --iterations 10
+Les facteurs sont ecrits en float32 dans des fichiers .npy mappes en memoire par l'API:
+plusieurs workers uvicorn partagent ainsi une seule copie (cache du systeme).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+
+from arrays import read_columns
+from database import SQLALCHEMY_DATABASE_URL
+
+MODEL_DIR = os.getenv("MOVIELENS_RECOMMENDER_DIR", "./recommender_model")
+MODEL_FILES = ("user_ids", "movie_ids", "user_factors", "item_factors", "user_biases", "item_biases", "item_counts", "global_mean")
+DEFAULT_FACTORS = 32
+DEFAULT_ITERATIONS = 10
+DEFAULT_REGULARIZATION = 0.1
+MIN_RATING, MAX_RATING = 0.5, 5.0
+# nombre minimal d'evaluations d'un film recommande: en dessous, son biais repose sur trop peu de notes
+MIN_SUPPORT = int(os.getenv("MOVIELENS_RECOMMENDER_MIN_SUPPORT", "10"))
+
+
+def _solve_rows(matrix, fixed, fixed_biases, regularization):
+    # une etape ALS: pour chaque ligne de `matrix` (CSR), moindres carres regularises sur [facteurs, biais] de la ligne,
+    # avec les facteurs et les biais `fixed` des colonnes notees (note - biais de la colonne ~ facteurs . fixed + biais)
+    n_factors = fixed.shape[1]
+    identity = np.eye(n_factors + 1, dtype=np.float64)
+    result = np.zeros((matrix.shape[0], n_factors), dtype=np.float32)
+    biases = np.zeros(matrix.shape[0], dtype=np.float32)
+    for row in range(matrix.shape[0]):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == stop:
+            continue
+        columns = matrix.indices[start:stop]
+        design = np.hstack([fixed[columns].astype(np.float64), np.ones((stop - start, 1))])
+        values = matrix.data[start:stop] - fixed_biases[columns]
+        # lambda pondere par le nombre d'evaluations (weighted-lambda ALS)
+        solution = np.linalg.solve(design.T @ design + regularization * (stop - start) * identity, design.T @ values)
+        result[row], biases[row] = solution[:-1], solution[-1]
+    return result, biases
+
+
+def train(users, movies, ratings, factors: int = DEFAULT_FACTORS, iterations: int = DEFAULT_ITERATIONS,
+          regularization: float = DEFAULT_REGULARIZATION, seed: int = 42):
+    """Factorise les notes avec biais: note(u, i) ~ moyenne + bu[u] + bi[i] + U[u] . V[i]"""
+    from scipy import sparse
+
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    movie_ids, item_index = np.unique(movies, return_inverse=True)
+    global_mean = float(ratings.mean())
+    centered = (ratings - global_mean).astype(np.float64)
+    by_user = sparse.csr_matrix((centered, (user_index, item_index)), shape=(len(user_ids), len(movie_ids)))
+    by_item = by_user.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    item_factors = (rng.standard_normal((len(movie_ids), factors)) * 0.1).astype(np.float32)
+    item_biases = np.zeros(len(movie_ids), dtype=np.float32)
+    for iteration in range(iterations):
+        user_factors, user_biases = _solve_rows(by_user, item_factors, item_biases, regularization)
+        item_factors, item_biases = _solve_rows(by_item, user_factors, user_biases, regularization)
+        predictions = global_mean + user_biases[user_index] + item_biases[item_index] + np.einsum(
+            "ij,ij->i", user_factors[user_index], item_factors[item_index])
+        rmse = float(np.sqrt(np.mean((predictions - ratings) ** 2)))
+        print(f"iteration {iteration + 1}/{iterations}: rmse (entrainement) {rmse:.4f}")
+    return {
+        "user_ids": user_ids.astype(np.int32),
+        "movie_ids": movie_ids.astype(np.int32),
+        "user_factors": user_factors,
+        "item_factors": item_factors,
+        "user_biases": user_biases,
+        "item_biases": item_biases,
+        "item_counts": np.bincount(item_index, minlength=len(movie_ids)).astype(np.int32),
+        "global_mean": np.float32(global_mean),
+    }
+
+
+def save(model, directory: str = MODEL_DIR):
+    # chaque tableau dans son fichier .npy, remplace de facon atomique
+    os.makedirs(directory, exist_ok=True)
+    for name in MODEL_FILES:
+        path = os.path.join(directory, name + ".npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, model[name])
+        os.replace(path + ".tmp", path)
+
+
+class Recommender:
+    """Facteurs et biais mappes en memoire, score par produit scalaire vectorise"""
+
+    def __init__(self, directory: str = MODEL_DIR, min_support: int = MIN_SUPPORT):
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in MODEL_FILES}
+        self.user_ids = arrays["user_ids"]
+        self.movie_ids = arrays["movie_ids"]
+        self.user_factors = arrays["user_factors"]
+        self.item_factors = arrays["item_factors"]
+        self.user_biases = arrays["user_biases"]
+        self.item_biases = arrays["item_biases"]
+        self.item_counts = arrays["item_counts"]
+        self.global_mean = float(arrays["global_mean"])
+        self.min_support = min_support
+        # date du modele charge: entre dans l'ETag de /users/{id}/recommendations (modele reentraine a part)
+        self.built_at = os.stat(os.path.join(directory, "item_factors.npy")).st_mtime
+
+    def predict(self, row: int):
+        # note predite de chaque film pour l'utilisateur `row`, non bornee (sert au classement)
+        return self.item_factors @ self.user_factors[row] + self.item_biases + (self.user_biases[row] + self.global_mean)
+
+    def recommend(self, user_id: int, exclude_movie_ids=(), limit: int = 10):
+        """[(movieId, note predite)] des `limit` meilleurs films, sans ceux de exclude_movie_ids; None si utilisateur inconnu"""
+        row = np.searchsorted(self.user_ids, user_id)
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return None
+        scores = self.predict(row)
+        scores[self.item_counts < self.min_support] = -np.inf
+        exclude = np.asarray(exclude_movie_ids, dtype=np.int32)
+        positions = np.searchsorted(self.movie_ids, exclude).clip(max=len(self.movie_ids) - 1)
+        scores[positions[self.movie_ids[positions] == exclude]] = -np.inf
+        limit = min(limit, len(scores))
+        # argpartition: les meilleurs sans trier tous les films, puis tri des `limit` retenus
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        # classement sur la prediction non bornee, note renvoyee ramenee a l'echelle de MovieLens
+        ratings = np.clip(scores[top], MIN_RATING, MAX_RATING)
+        return [(int(self.movie_ids[i]), float(rating)) for i, rating in zip(top, ratings)]
+
+
+_recommender = None
+
+def get_recommender():
+    # modele charge au premier appel (ou au demarrage de l'API), None s'il n'a pas encore ete entraine
+    # (ou s'il l'a ete avant l'ajout des biais: le reentrainer)
+    global _recommender
+    if _recommender is None and all(os.path.exists(os.path.join(MODEL_DIR, name + ".npy")) for name in MODEL_FILES):
+        _recommender = Recommender(MODEL_DIR)
+    return _recommender
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrainer le modele de recommandation (ALS)")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--factors", type=int, default=DEFAULT_FACTORS)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--regularization", type=float, default=DEFAULT_REGULARIZATION)
+    parser.add_argument("--output", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    start = time.perf_counter()
+    users, movies, ratings = read_columns(engine, "SELECT userId, movieId, rating FROM ratings", [np.int32, np.int32, np.float32])
+    model = train(users, movies, ratings, args.factors, args.iterations, args.regularization)
+    save(model, args.output)
+    print(f"{len(model['user_ids'])} utilisateurs, {len(model['movie_ids'])} films, ecrit dans {args.output} en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Classes de reponse de l'API"""
+import csv
+import io
+import json
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+except ImportError: # orjson est optionnel, on retombe sur le module json standard
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    # chemin rapide pour les listes: le contenu (dicts construits depuis les tuples SQL) est encode directement,
+    # sans validation pydantic objet par objet
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+# -- Export en flux (NDJSON / CSV) --
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def ndjson_chunks(columns, batches):
+    # un objet json par ligne, un morceau de reponse par paquet de lignes
+    dumps = orjson.dumps if orjson is not None else lambda obj: json.dumps(obj).encode()
+    for batch in batches:
+        yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+def csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def export_response(name, columns, batches, format="ndjson"):
+    chunks = csv_chunks(columns, batches) if format == "csv" else ndjson_chunks(columns, batches)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
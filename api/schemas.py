@@ -8,8 +8,7 @@ class RatingBase(BaseModel):
     movieId: int 
     rating: float 
     timestamp: int 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
 
 
 class TagBase(BaseModel): 
@@ -17,15 +16,13 @@ class TagBase(BaseModel):
     movieId: int 
     tag: str 
     timestamp: int 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
 
 
 class LinkBase(BaseModel): 
     imdbId: Optional[str] 
     tmdbId: Optional[int] 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
 
 
 # --- Schéma principal pour Movie --
@@ -33,42 +30,157 @@ class MovieBase(BaseModel):
     movieId: int 
     title: str 
     genres: Optional[str] = None 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
+
+
+class MovieStatsBase(BaseModel): 
+    rating_count: int 
+    rating_mean: float 
+    weighted_score: float 
+    histogram: List[int] # nombre d'evaluations pour chaque note de 0.5 a 5.0 
+    model_config = ConfigDict(from_attributes=True)
 
 
 class MovieDetailed(MovieBase): 
     ratings: List[RatingBase] = [] 
     tags: List[TagBase] = [] 
     link: Optional[LinkBase] = None
+    stats: Optional[MovieStatsBase] = None
+
+class TagCount(BaseModel): 
+    tag: str 
+    count: int 
+
+
+# --- Projection d'un film (fields= / include=): seuls les champs demandes sont renvoyes --
+class MovieView(BaseModel): 
+    movieId: int 
+    title: Optional[str] = None 
+    genres: Optional[str] = None 
+    link: Optional[LinkBase] = None 
+    stats: Optional[MovieStatsBase] = None 
+    ratings: Optional[List[RatingBase]] = None 
+    tags: Optional[List[TagBase]] = None 
+    top_tags: Optional[List[TagCount]] = None 
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Schéma pour liste de films (sans détails imbriqués) --
 class MovieSimple(BaseModel): 
     movieId: int 
     title: str 
     genres: Optional[str] 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
 # --- Pour les endpoints de /ratings et /tags si appelés seuls --
 class RatingSimple(BaseModel): 
     userId: int 
     movieId: int 
     rating: float 
     timestamp: int 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
 
 class TagSimple(BaseModel): 
     userId: int 
     movieId: int 
     tag: str 
     timestamp: int 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True)
         
 class LinkSimple(BaseModel): 
     movieId: int 
     imdbId: Optional[str] 
     tmdbId: Optional[int] 
-    class MovieSchema(BaseModel):
-        model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Pages de resultats (pagination par curseur) --
+class MoviePage(BaseModel):
+    items: List[MovieSimple]
+    next_cursor: Optional[str] = None
+
+class RatingPage(BaseModel):
+    items: List[RatingSimple]
+    next_cursor: Optional[str] = None
+
+class TagPage(BaseModel):
+    items: List[TagSimple]
+    next_cursor: Optional[str] = None
+
+class LinkPage(BaseModel):
+    items: List[LinkSimple]
+    next_cursor: Optional[str] = None
+
+
+# --- Classements (lus dans movie_stats) --
+class MovieRanking(BaseModel):
+    movieId: int
+    title: str
+    genres: Optional[str] = None
+    year: Optional[int] = None
+    rating_count: int
+    rating_mean: float
+    weighted_score: float
+
+
+# --- Films similaires (index item-item) --
+class SimilarMovie(BaseModel):
+    movieId: int
+    title: str
+    genres: Optional[str] = None
+    score: float # similarite cosinus (ajustee) avec le film demande
+
+
+# --- Recommandations (factorisation de matrice) --
+class RecommendedMovie(BaseModel):
+    movieId: int
+    title: str
+    genres: Optional[str] = None
+    predicted_rating: float
+
+
+# --- Statistiques globales (/stats, colonnes en memoire) --
+class RatingSummary(BaseModel):
+    rating_count: int
+    user_count: int
+    rated_movie_count: int
+    rating_mean: Optional[float] = None
+    first_timestamp: Optional[int] = None
+    last_timestamp: Optional[int] = None
+
+class HistogramBucket(BaseModel):
+    rating: float
+    count: int
+
+class GenreStats(BaseModel):
+    genre: str
+    rating_count: int
+    rating_mean: float
+
+class YearStats(BaseModel):
+    year: int
+    rating_count: int
+    rating_mean: float
+
+class UserActivity(BaseModel):
+    userId: int
+    rating_count: int
+    rating_mean: float
+
+
+# --- Series temporelles (agregats par periode) --
+class ActivityPoint(BaseModel):
+    bucket: int # debut de la periode (timestamp UTC)
+    count: int
+    rating_mean: Optional[float] = None # absent pour les tags
+
+
+# --- Vocabulaire des tags --
+class TagSuggestion(BaseModel):
+    term: str
+    usage_count: int
+    movie_count: int
+    model_config = ConfigDict(from_attributes=True)
+
+class TaggedMovie(BaseModel):
+    movieId: int
+    title: str
+    genres: Optional[str] = None
+    count: int # nombre d'utilisateurs ayant pose le tag sur le film
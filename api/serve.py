@@ -0,0 +1,316 @@
+"""Mode production: pre-chauffage dans le processus parent puis fork de N workers uvicorn
+
+    python serve.py --workers 8 --port 8000
+
+Le parent importe l'API, ouvre la base, charge les colonnes de /stats et leurs agregats, mappe l'index des films
+similaires, le modele de recommandation et l'instantane Arrow (MOVIELENS_BACKEND=snapshot), puis fork les workers:
+ceux-ci partagent ces pages en copie sur ecriture (gc.freeze evite que le ramasse-miettes ne les recopie) et
+demarrent sans rien recharger. Les workers ecoutent sur une socket ouverte par le parent, qui relance un worker
+arrete sur une erreur, avec un delai croissant; au-dela de --max-restarts plantages en RESTART_WINDOW secondes,
+le serveur s'arrete en erreur. Un rapport donne le temps de chaque etape et la memoire partagee / privee des workers.
+"""
+import argparse
+import collections
+import contextlib
+import gc
+import importlib
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+# les workers ne font que lire: base ouverte en lecture seule sauf configuration contraire
+os.environ.setdefault("MOVIELENS_READ_ONLY", "1")
+
+READY_TIMEOUT = 60 # secondes d'attente des workers au demarrage
+STOP_TIMEOUT = 10 # secondes laissees aux workers pour s'arreter apres SIGTERM, avant SIGKILL
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+MAX_RESTARTS = 5 # plantages de workers toleres sur RESTART_WINDOW secondes
+RESTART_WINDOW = 60
+RESTART_DELAY = 0.1 # delai avant la relance d'un worker, double a chaque plantage de la fenetre
+MAX_RESTART_DELAY = 5
+
+
+def touch(buffer):
+    # lire un octet par page d'un tableau ou d'un buffer Arrow mappe en memoire, pour le charger dans le cache
+    # du systeme avant le fork
+    if buffer is not None and len(memoryview(buffer).cast("B")):
+        np.frombuffer(buffer, dtype=np.uint8)[::4096].sum()
+
+
+def warm_up() -> list:
+    """Charger tout ce que les workers partagent; renvoie [(etape, secondes)]"""
+    steps = []
+
+    def step(name, function):
+        start = time.perf_counter()
+        function()
+        steps.append((name, time.perf_counter() - start))
+
+    step("import de l'API", lambda: importlib.import_module("main"))
+    import analytics
+    import database
+    import http_cache
+    import recommender
+    import similarity
+
+    def open_database():
+        # lire les tables une fois (cache de pages du systeme partage par les workers), puis fermer:
+        # une connexion SQLite ne doit pas traverser un fork
+        http_cache.dataset_version()
+        database.warm_pool(1)
+        database.engine.dispose()
+
+    def load_similarity():
+        index = similarity.get_index()
+        touch(index.table if index is not None else None)
+
+    def load_recommender():
+        model = recommender.get_recommender()
+        if model is not None:
+            for array in (model.user_ids, model.movie_ids, model.user_factors, model.item_factors,
+                          model.user_biases, model.item_biases, model.item_counts):
+                touch(array)
+
+    def load_analytics():
+        # colonnes et agregats de /stats, calcules une fois pour tous les workers
+        columns = analytics.get_analytics()
+        columns.summary(), columns.histogram(), columns.by_genre(), columns.by_year(), columns.per_user()
+
+    step("base de donnees", open_database)
+    if database.BACKEND == "snapshot":
+        import snapshot
+        step("instantane Arrow", lambda: [touch(buffer) for table in snapshot.get_snapshot().tables.values()
+                                          for column in table.columns for chunk in column.chunks for buffer in chunk.buffers()])
+    step("films similaires", load_similarity)
+    step("modele de recommandation", load_recommender)
+    step("colonnes de /stats", load_analytics)
+    database.engine.dispose()
+
+    # objets deja crees: hors du ramasse-miettes, pour que ses passages ne touchent pas les pages partagees
+    gc.collect()
+    gc.freeze()
+    return steps
+
+
+def memory(pid: int) -> dict:
+    # memoire d'un processus en Mo (Linux: /proc/<pid>/smaps_rollup), {} si indisponible
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            values = {line.split(":")[0]: int(line.split()[1]) / 1024 for line in f if line.split()[-1] == "kB"}
+    except OSError:
+        return {}
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def print_report(steps, parent_pid: int, ready: dict, forked_at: float):
+    print("\n--- demarrage ---")
+    for name, seconds in steps:
+        print(f"{name:<28} {seconds * 1000:8.1f} ms")
+    print(f"{'total pre-chauffage':<28} {sum(seconds for _, seconds in steps) * 1000:8.1f} ms")
+    for pid, ready_at in sorted(ready.items(), key=lambda item: item[1]):
+        print(f"worker {pid:<21} pret en {(ready_at - forked_at) * 1000:6.1f} ms apres le fork")
+    rows = [("parent", memory(parent_pid))] + [(f"worker {pid}", memory(pid)) for pid in sorted(ready)]
+    if rows[0][1]:
+        print(f"{'memoire (Mo)':<28} {'rss':>8} {'pss':>8} {'partagee':>9} {'privee':>8}")
+        for name, values in rows:
+            if values:
+                print(f"{name:<28} {values['rss']:8.1f} {values['pss']:8.1f} {values['shared']:9.1f} {values['private']:8.1f}")
+        total_pss = sum(values.get("pss", 0) for _, values in rows)
+        print(f"{'total (pss)':<28} {total_pss:8.1f}")
+    print()
+    sys.stdout.flush()
+
+
+def run_worker(app, sock, args, ready_fd: int):
+    import uvicorn
+    import database
+
+    class Worker(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            os.write(ready_fd, f"{os.getpid()}\n".encode())
+
+        @contextlib.contextmanager
+        def capture_signals(self):
+            # arret propre sur SIGTERM / SIGINT: sortir avec le code 0 (le parent ne relance pas le worker)
+            # plutot que de relever le signal apres l'arret, comme le fait uvicorn
+            with super().capture_signals():
+                yield
+                getattr(self, "_captured_signals", []).clear()
+
+    # connexions du parent (aucune normalement): les oublier sans les fermer, elles lui appartiennent
+    database.engine.dispose(close=False)
+    if database.async_engine is not None:
+        database.async_engine.sync_engine.dispose(close=False)
+    config = uvicorn.Config(app, log_level=args.log_level, lifespan="on", access_log=args.access_log)
+    Worker(config).run(sockets=[sock])
+
+
+class CrashBudget:
+    """Plantages de workers des `window` dernieres secondes: delai avant la prochaine relance, ou fin du budget"""
+
+    def __init__(self, max_restarts: int = MAX_RESTARTS, window: float = RESTART_WINDOW):
+        self.max_restarts = max_restarts
+        self.window = window
+        self.crashes = collections.deque()
+
+    def delay(self, now=None):
+        # secondes a attendre avant de relancer le worker qui vient de planter, None si le budget est epuise
+        now = time.monotonic() if now is None else now
+        while self.crashes and now - self.crashes[0] > self.window:
+            self.crashes.popleft()
+        self.crashes.append(now)
+        if len(self.crashes) > self.max_restarts:
+            return None
+        return min(RESTART_DELAY * 2 ** (len(self.crashes) - 1), MAX_RESTART_DELAY)
+
+
+def send_signal(workers, signum):
+    for pid in workers:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def terminate(workers: set, timeout: float = STOP_TIMEOUT):
+    # SIGTERM aux workers encore vivants et attente de chacun (pas de zombie), SIGKILL apres `timeout` secondes
+    send_signal(workers, signal.SIGTERM)
+    deadline, killed = time.monotonic() + timeout, False
+    while workers:
+        for pid in list(workers):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == 0:
+                    continue
+            except ChildProcessError:
+                pass
+            workers.discard(pid)
+        if workers and not killed and time.monotonic() > deadline:
+            send_signal(workers, signal.SIGKILL)
+            killed = True
+        if workers:
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servir l'API avec N workers forkes apres pre-chauffage")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--max-restarts", type=int, default=MAX_RESTARTS,
+                        help=f"plantages de workers toleres sur {RESTART_WINDOW} s avant l'arret du serveur")
+    args = parser.parse_args()
+
+    # metriques Prometheus agregees entre workers (a definir avant l'import de prometheus_client)
+    metrics_dir = None
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="movielens-metrics-")
+    workers = set()
+
+    def stop(signum, frame):
+        # interrompre l'etape en cours (fork, attente des workers, os.wait): le bloc finally arrete les workers
+        raise SystemExit(0)
+
+    sock = None
+    try:
+        steps = warm_up()
+        from main import app
+        from prometheus_client import multiprocess
+
+        sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        ready_read, ready_write = os.pipe()
+
+        def spawn():
+            # signaux bloques pendant le fork: le worker remet les actions par defaut avant de les recevoir,
+            # et le parent enregistre son pid avant que stop() ne s'execute
+            signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+            pid = os.fork()
+            if pid == 0:
+                for signum in STOP_SIGNALS:
+                    signal.signal(signum, signal.SIG_DFL)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+                os.close(ready_read)
+                code = 1
+                try:
+                    run_worker(app, sock, args, ready_write)
+                    code = 0
+                except BaseException:
+                    traceback.print_exc()
+                finally:
+                    os._exit(code)
+            workers.add(pid)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+        # installes avant le premier fork: un Ctrl-C pendant le demarrage des workers les arrete aussi
+        # (pendant le pre-chauffage, KeyboardInterrupt suffit: aucun worker n'existe encore)
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, stop)
+        forked_at = time.perf_counter()
+        for _ in range(args.workers):
+            spawn()
+
+        # attendre que chaque worker ait execute le lifespan de l'API, puis afficher le rapport
+        ready, buffer = {}, b""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while len(ready) < len(workers) and time.monotonic() < deadline:
+            if select.select([ready_read], [], [], max(0, deadline - time.monotonic()))[0]:
+                buffer += os.read(ready_read, 4096)
+                *lines, buffer = buffer.split(b"\n")
+                ready.update((int(line), time.perf_counter()) for line in lines if line)
+        print_report(steps, os.getpid(), ready, forked_at)
+        print(f"{len(workers)} workers sur http://{args.host}:{args.port}")
+        sys.stdout.flush()
+
+        # relancer les workers arretes sur une erreur (code non nul ou signal); un worker sorti avec 0 s'est arrete
+        # normalement (SIGTERM recu directement, par exemple) et n'est pas remplace
+        budget = CrashBudget(args.max_restarts)
+        while workers:
+            pid, status = os.wait()
+            workers.discard(pid)
+            multiprocess.mark_process_dead(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code == 0:
+                print(f"worker {pid} arrete normalement, non relance")
+                sys.stdout.flush()
+                continue
+            delay = budget.delay()
+            if delay is None:
+                print(f"worker {pid} arrete (code {code}): plus de {args.max_restarts} plantages en {RESTART_WINDOW} s, "
+                      f"arret du serveur", file=sys.stderr)
+                raise SystemExit(1)
+            print(f"worker {pid} arrete (code {code}), relance dans {delay:.1f} s")
+            sys.stdout.flush()
+            time.sleep(delay)
+            spawn()
+    finally:
+        # toute sortie (signal, exception): aucun worker ne survit au parent; un second Ctrl-C n'interrompt pas l'arret
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, signal.SIG_IGN)
+        terminate(workers)
+        if sock is not None:
+            sock.close()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
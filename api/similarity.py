@@ -0,0 +1,166 @@
+"""Films similaires (item-item) calcules a partir de la matrice utilisateurs x films des evaluations
+
+Construction hors ligne (scipy):   python similarity.py build --k 20
+Mesure du temps et de la memoire:  python similarity.py bench
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import create_engine
+
+from arrays import read_columns
+from database import SQLALCHEMY_DATABASE_URL
+
+SIMILARITY_PATH = os.getenv("MOVIELENS_SIMILARITY_PATH", "./similar_movies.npy")
+DEFAULT_K = 20
+BLOCK_SIZE = 256 # films traites par bloc: le bloc de similarites dense fait BLOCK_SIZE x nombre de films
+METHODS = ("cosine", "adjusted_cosine")
+
+# taille du jeu MovieLens 25M, pour la projection du benchmark
+FULL_DATASET = {"ratings": 25_000_095, "movies": 62_423, "users": 162_541}
+
+
+def record_dtype(k: int):
+    # une ligne par film: ses k voisins (movieId, -1 si absent) et leurs similarites, tries par similarite decroissante
+    return np.dtype([("movieId", np.int32), ("neighbors", np.int32, (k,)), ("scores", np.float32, (k,))])
+
+
+def read_ratings(engine):
+    return read_columns(engine, "SELECT userId, movieId, rating FROM ratings", [np.int32, np.int32, np.float32])
+
+
+def build_similarity(users, movies, ratings, k: int = DEFAULT_K, method: str = "adjusted_cosine", block_size: int = BLOCK_SIZE):
+    """Calcule les k plus proches voisins de chaque film (similarite cosinus entre lignes de la matrice CSR films x utilisateurs)"""
+    from scipy import sparse
+
+    if method not in METHODS:
+        raise ValueError(f"method doit valoir {' ou '.join(METHODS)}")
+    movie_ids, item_index = np.unique(movies, return_inverse=True)
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    values = ratings.astype(np.float32)
+    if method == "adjusted_cosine":
+        # cosinus ajuste: retirer la note moyenne de chaque utilisateur
+        user_means = np.bincount(user_index, weights=values) / np.bincount(user_index)
+        values = values - user_means[user_index].astype(np.float32)
+
+    matrix = sparse.csr_matrix((values, (item_index, user_index)), shape=(len(movie_ids), len(user_ids)), dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.csr_matrix(sparse.diags((1 / norms).astype(np.float32)) @ matrix)
+    transposed = matrix.T.tocsr()
+
+    n = len(movie_ids)
+    k_found = min(k, n - 1)
+    result = np.zeros(n, dtype=record_dtype(k))
+    result["movieId"] = movie_ids
+    result["neighbors"] = -1
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = (matrix[start:stop] @ transposed).toarray()
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf # un film n'est pas son propre voisin
+        # argpartition: les k meilleurs sans trier toute la ligne, puis tri de ces k seulement
+        top = np.argpartition(-block, k_found - 1, axis=1)[:, :k_found]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        keep = top_scores > 0
+        result["neighbors"][start:stop, :k_found] = np.where(keep, movie_ids[top], -1)
+        result["scores"][start:stop, :k_found] = np.where(keep, top_scores, 0)
+    return result
+
+
+def save(result, path: str = SIMILARITY_PATH):
+    # ecriture atomique: les workers qui ont deja mappe l'ancien fichier le gardent
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, result)
+    os.replace(tmp_path, path)
+
+
+class SimilarityIndex:
+    """Voisins pre-calcules, mappes en memoire (partages entre workers via le cache du systeme)"""
+
+    def __init__(self, path: str = SIMILARITY_PATH):
+        self.path = path
+        self.table = np.load(path, mmap_mode="r")
+        self.movie_ids = self.table["movieId"]
+        # nombre de voisins par film avec lequel l'index a ete construit (--k), lu dans le type des lignes
+        self.k = self.table.dtype["neighbors"].shape[0]
+        # date du fichier charge: entre dans l'ETag de /movies/{id}/similar (index reconstruit sans recharger la base)
+        self.built_at = os.stat(path).st_mtime
+
+    def neighbors(self, movie_id: int, k: Optional[int] = None):
+        # recherche dichotomique du film puis lecture de sa ligne: O(log n + k); k=None: tous les voisins
+        row = np.searchsorted(self.movie_ids, movie_id)
+        if row >= len(self.movie_ids) or self.movie_ids[row] != movie_id:
+            return None
+        record = self.table[row]
+        return [
+            (int(neighbor), float(score))
+            for neighbor, score in zip(record["neighbors"][:k], record["scores"][:k])
+            if neighbor >= 0
+        ]
+
+
+_index = None
+
+def get_index():
+    # index charge au premier appel (ou au demarrage de l'API), None s'il n'a pas encore ete construit
+    global _index
+    if _index is None and os.path.exists(SIMILARITY_PATH):
+        _index = SimilarityIndex(SIMILARITY_PATH)
+    return _index
+
+
+def benchmark(engine, k: int = DEFAULT_K, method: str = "adjusted_cosine"):
+    """Temps et memoire de chaque etape sur la base courante, et projection grossiere sur MovieLens 25M"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    users, movies, ratings = read_ratings(engine)
+    read_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = build_similarity(users, movies, ratings, k, method)
+    build_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_ratings, n_movies = len(ratings), len(result)
+    ratio_ratings = FULL_DATASET["ratings"] / n_ratings
+    ratio_movies = FULL_DATASET["movies"] / n_movies
+    print(f"evaluations: {n_ratings}, films: {n_movies}, utilisateurs: {len(np.unique(users))}")
+    print(f"lecture: {read_time:.2f}s, construction: {build_time:.2f}s, pic memoire: {peak / 2**20:.1f} Mo")
+    print(f"fichier: {result.nbytes / 2**20:.2f} Mo ({result.dtype.itemsize} octets par film)")
+    # lecture et matrice CSR ~ nombre d'evaluations; produit par blocs ~ evaluations x films (borne haute grossiere)
+    print("projection MovieLens 25M (ordre de grandeur):")
+    print(f"  lecture: {read_time * ratio_ratings:.0f}s, construction: {build_time * ratio_ratings * ratio_movies:.0f}s")
+    csr_bytes = FULL_DATASET["ratings"] * 8 * 2 # valeurs float32 + indices int32, matrice et transposee
+    block_bytes = BLOCK_SIZE * FULL_DATASET["movies"] * 4 * 3 # bloc dense + argpartition
+    print(f"  memoire: ~{(csr_bytes + block_bytes) / 2**20:.0f} Mo, fichier: {FULL_DATASET['movies'] * result.dtype.itemsize / 2**20:.1f} Mo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construire l'index des films similaires")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="nombre de voisins par film")
+    parser.add_argument("--method", choices=METHODS, default="adjusted_cosine")
+    parser.add_argument("--output", default=SIMILARITY_PATH)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if args.command == "bench":
+        benchmark(engine, args.k, args.method)
+        return
+    start = time.perf_counter()
+    result = build_similarity(*read_ratings(engine), k=args.k, method=args.method)
+    save(result, args.output)
+    print(f"{len(result)} films, {args.k} voisins, ecrit dans {args.output} en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Journal des requetes SQL lentes, avec le plan d'execution de SQLite
+
+Mode diagnostic de l'API:   MOVIELENS_SLOW_QUERY_MS=20 uvicorn main:app
+Rapport hors ligne:         python slow_queries.py report
+
+Chaque requete emise par une fonction de query_helpers et plus lente que le seuil est ajoutee au journal
+(une ligne json: fonction, duree, base, requete, parametres et sortie de EXPLAIN QUERY PLAN, execute sur cette base). Le rapport regroupe
+les entrees par forme de requete (litteraux et listes IN remplaces par ?) et signale les parcours complets de table.
+La duree mesuree est celle de l'execution: pour un export en flux (yield_per), jusqu'a la premiere ligne seulement.
+EXPLAIN et l'ecriture du journal se font dans un thread a part: une requete lente ne bloque pas la boucle d'evenements.
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+
+import database
+import models
+
+# seuil en millisecondes (journal desactive si la variable n'est pas definie)
+THRESHOLD_MS = float(os.environ["MOVIELENS_SLOW_QUERY_MS"]) if os.getenv("MOVIELENS_SLOW_QUERY_MS") else None
+LOG_PATH = os.getenv("MOVIELENS_SLOW_QUERY_LOG", "./slow_queries.jsonl")
+HELPERS_MODULE = "query_helpers"
+MAX_PENDING = 1000 # entrees en attente d'EXPLAIN au-dela desquelles les suivantes sont ignorees
+
+_write_lock = threading.Lock()
+_writer = {"pid": None, "queue": None}
+_explain_engines = {} # URL de la base -> moteur synchrone pour EXPLAIN (thread d'ecriture seulement)
+
+
+def calling_helpers():
+    # fonctions de query_helpers de la pile d'appels, de la plus externe a celle qui a construit la requete
+    # ("get_movies_page > paginate"), ou None si la requete ne vient pas de query_helpers
+    names = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == HELPERS_MODULE:
+            names.append(frame.f_code.co_name)
+        frame = frame.f_back
+    return " > ".join(reversed(names)) or None
+
+
+def explain_engine(engine):
+    # moteur synchrone sur la base du moteur qui a execute la requete: celui d'aiosqlite ne sert que dans sa boucle,
+    # sa base est rouverte avec pysqlite (meme URL, read-only compris)
+    if not engine.dialect.is_async:
+        return engine
+    url = engine.url.set(drivername="sqlite")
+    if url == database.engine.url:
+        return database.engine
+    key = url.render_as_string(hide_password=False)
+    if key not in _explain_engines:
+        _explain_engines[key] = create_engine(url)
+    return _explain_engines[key]
+
+
+def explain(statement: str, parameters, engine=None) -> list:
+    # plan de SQLite, une ligne par etape, indentee selon l'etape parente
+    # (connexion separee: la connexion en cours est encore utilisee par la requete)
+    with explain_engine(engine or database.engine).connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+    return plan
+
+
+def is_full_scan(plan: list) -> bool:
+    # "SCAN ratings": une table parcourue en entier (pas via un index, ni une sous-requete ou la table FTS)
+    for step in plan:
+        match = re.match(r"SCAN (\w+)", step.strip())
+        if match and match.group(1) in models.Base.metadata.tables and " INDEX" not in step:
+            return True
+    return False
+
+
+def record(entry: dict, path: str = LOG_PATH):
+    with _write_lock, open(path, "a") as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+
+
+def write_entries(pending: queue.Queue):
+    # thread d'ecriture: plan de SQLite puis ajout au journal, hors du thread (ou de la boucle) qui a execute la requete
+    while True:
+        entry, engine, path = pending.get()
+        try:
+            entry["plan"] = explain(entry["statement"], tuple(entry["parameters"]), engine)
+        except Exception as error: # le journal ne doit jamais faire echouer la requete
+            entry["plan"] = [f"EXPLAIN impossible: {error}"]
+        entry["full_scan"] = is_full_scan(entry["plan"])
+        try:
+            record(entry, path)
+        finally:
+            pending.task_done()
+
+
+def pending_entries() -> queue.Queue:
+    # file du thread d'ecriture, recree apres un fork (serve.py): le thread du parent n'existe pas dans un worker
+    if _writer["pid"] != os.getpid():
+        pending = queue.Queue(maxsize=MAX_PENDING)
+        threading.Thread(target=write_entries, args=(pending,), name="slow-queries", daemon=True).start()
+        _writer.update(pid=os.getpid(), queue=pending)
+    return _writer["queue"]
+
+
+def flush():
+    # attendre l'ecriture des entrees en attente
+    if _writer["pid"] == os.getpid():
+        _writer["queue"].join()
+
+
+def log_slow_queries(engine, threshold_ms: float = THRESHOLD_MS, path: str = LOG_PATH):
+    # chronometrer les requetes du moteur (pour un moteur async: engine.sync_engine) et journaliser les lentes
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["slow_query_start"].pop()) * 1000
+        if duration_ms < threshold_ms or executemany or statement.startswith("EXPLAIN"):
+            return
+        helper = calling_helpers()
+        if helper is None:
+            return
+        entry = {
+            "time": time.time(),
+            "helper": helper,
+            "duration_ms": round(duration_ms, 3),
+            "database": conn.engine.url.render_as_string(hide_password=True),
+            "statement": statement,
+            "parameters": list(parameters) if parameters else [],
+        }
+        try:
+            pending_entries().put_nowait((entry, conn.engine, path))
+        except queue.Full: # ecriture en retard: perdre l'entree plutot que bloquer la requete
+            pass
+    return engine
+
+
+# --- Rapport ---
+def statement_shape(statement: str) -> str:
+    # meme forme pour des requetes qui ne different que par leurs valeurs
+    shape = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    shape = re.sub(r"\b\d+(?:\.\d+)?\b", "?", shape)
+    shape = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", shape)
+    return re.sub(r"\s+", " ", shape).strip()
+
+
+def read_log(path: str = LOG_PATH) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def group_entries(entries: list) -> list:
+    # un groupe par (fonction, forme de requete), tries par temps total decroissant
+    groups = {}
+    for entry in entries:
+        key = (entry["helper"], statement_shape(entry["statement"]))
+        group = groups.setdefault(key, {"helper": key[0], "shape": key[1], "count": 0, "total_ms": 0.0, "slowest": entry})
+        group["count"] += 1
+        group["total_ms"] += entry["duration_ms"]
+        if entry["duration_ms"] > group["slowest"]["duration_ms"]:
+            group["slowest"] = entry
+    return sorted(groups.values(), key=lambda group: -group["total_ms"])
+
+
+def print_report(groups: list, top: int = 20):
+    for group in groups[:top]:
+        slowest = group["slowest"]
+        flag = "  PARCOURS COMPLET" if slowest["full_scan"] else ""
+        print(f"{group['helper']}: {group['count']} fois, total {group['total_ms']:.1f} ms, "
+              f"moyenne {group['total_ms'] / group['count']:.1f} ms, max {slowest['duration_ms']:.1f} ms{flag}")
+        print(f"  {group['shape']}")
+        print(f"  parametres (max): {slowest['parameters']}")
+        for step in slowest["plan"]:
+            print(f"    {step}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport du journal des requetes SQL lentes")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--log", default=LOG_PATH)
+    parser.add_argument("--top", type=int, default=20, help="nombre de formes de requete affichees")
+    args = parser.parse_args()
+
+    entries = read_log(args.log)
+    groups = group_entries(entries)
+    print(f"{len(entries)} requetes lentes, {len(groups)} formes distinctes\n")
+    print_report(groups, args.top)
+
+
+if __name__ == "__main__":
+    main()
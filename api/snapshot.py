@@ -0,0 +1,382 @@
+"""Instantane colonne (Arrow IPC) des tables movies, ratings, tags et links
+
+Export depuis movies.db:           python snapshot.py export
+Comparaison avec SQLite:           python snapshot.py bench
+
+Chaque table (et le pont movie_genres utilise par /stats et le filtre de genre) est ecrite dans un fichier
+Arrow IPC non compresse, triee par cle primaire. Avec MOVIELENS_BACKEND=snapshot, les fichiers sont mappes en memoire au demarrage
+(lecture sans copie) et query_helpers lit les tables de base ici: les filtres et la projection sont appliques
+colonne par colonne (pyarrow.compute) avant de construire les lignes renvoyees. Les tables derivees
+(movie_stats, movies_fts, index des tags, agregats) restent lues dans SQLite.
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+from sqlalchemy import Float, Integer, create_engine, select
+
+import http_cache
+import models
+from arrays import READ_CHUNK_SIZE
+from database import SQLALCHEMY_DATABASE_URL
+from query_params import EXPORT_BATCH_SIZE, decode_cursor, encode_cursor, genre_list, parse_fields
+
+SNAPSHOT_DIR = os.getenv("MOVIELENS_SNAPSHOT_DIR", "./snapshot")
+SNAPSHOT_MODELS = {
+    "movies": models.Movie,
+    "ratings": models.Rating,
+    "tags": models.Tag,
+    "links": models.Link,
+    "movie_genres": models.MovieGenre,
+}
+# lignes renvoyees par les equivalents de query_helpers: memes attributs que les objets ORM (movie.title),
+# sans les relations
+ROW_TYPES = {name: namedtuple(f"{model.__name__}Row", [column.key for column in model.__table__.columns])
+             for name, model in SNAPSHOT_MODELS.items()}
+SCAN_WINDOW = 65536 # lignes filtrees par fenetre quand le nombre de resultats est borne
+
+# filtres (colonne, operateur, valeur) traduits en expressions pyarrow.compute
+OPERATORS = {
+    "==": lambda column, value: column == value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+    "contains": lambda column, value: pc.match_substring(column, value, ignore_case=True),
+}
+
+
+# --- Export ---
+def arrow_type(column):
+    # les identifiants et timestamps MovieLens tiennent sur 32 bits, les notes (pas de 0.5) en float32
+    if isinstance(column.type, Integer):
+        return pa.int32()
+    if isinstance(column.type, Float):
+        return pa.float32()
+    return pa.string()
+
+def dataset_version(engine) -> str:
+    with engine.connect() as conn:
+        return conn.execute(select(models.DatasetInfo.value).where(models.DatasetInfo.key == "version")).scalar() or ""
+
+def export_table(engine, model, path: str, version: str, chunk_size: int = READ_CHUNK_SIZE) -> int:
+    # ecrire la table triee par cle primaire, un record batch par paquet de chunk_size lignes
+    # (un seul batch, donc des colonnes contigues lisibles sans copie, tant que la table tient dans un paquet)
+    table = model.__table__
+    schema = pa.schema([(column.key, arrow_type(column)) for column in table.columns], metadata={"version": version})
+    count = 0
+    with engine.connect() as conn, pa.OSFile(path + ".tmp", "wb") as sink, ipc.new_file(sink, schema) as writer:
+        result = conn.execute(select(*table.columns).order_by(*table.primary_key.columns))
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            count += len(rows)
+    # remplacement atomique: une API qui mappe l'ancien fichier continue de le lire
+    os.replace(path + ".tmp", path)
+    return count
+
+def export_snapshot(engine, directory: str = SNAPSHOT_DIR, chunk_size: int = READ_CHUNK_SIZE) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    version = dataset_version(engine)
+    return {
+        name: export_table(engine, model, os.path.join(directory, f"{name}.arrow"), version, chunk_size)
+        for name, model in SNAPSHOT_MODELS.items()
+    }
+
+
+# --- Lecture ---
+class Snapshot:
+    """Tables Arrow mappees en memoire, avec une couche de requete (filtres, projection, cle primaire)"""
+
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.tables = {}
+        for name in SNAPSHOT_MODELS:
+            with ipc.open_file(pa.memory_map(os.path.join(directory, f"{name}.arrow"))) as reader:
+                self.tables[name] = reader.read_all()
+        # version du jeu de donnees exporte (None si les fichiers viennent d'exports differents)
+        versions = {(table.schema.metadata or {}).get(b"version", b"").decode() for table in self.tables.values()}
+        self.version = versions.pop() if len(versions) == 1 else None
+        self.primary_keys = {name: [column.key for column in model.__table__.primary_key.columns]
+                             for name, model in SNAPSHOT_MODELS.items()}
+        self._keys = {}
+
+    def key_array(self, name: str, column: str):
+        # colonne entiere de la cle primaire en numpy (sans copie si la table tient dans un batch), None pour du texte
+        if (name, column) not in self._keys:
+            values = self.tables[name].column(column)
+            self._keys[name, column] = values.to_numpy() if pa.types.is_integer(values.type) else None
+        return self._keys[name, column]
+
+    def key_range(self, name: str, values: list):
+        # plage [lo, hi) des lignes dont la cle primaire commence par `values`: recherche dichotomique
+        # sur chaque colonne entiere de la cle (les lignes sont triees par cle primaire)
+        lo, hi = 0, self.tables[name].num_rows
+        for column, value in zip(self.primary_keys[name], values):
+            keys = self.key_array(name, column)
+            if keys is None:
+                break
+            lo, hi = lo + np.searchsorted(keys[lo:hi], value, "left"), lo + np.searchsorted(keys[lo:hi], value, "right")
+        return int(lo), int(hi)
+
+    def scan(self, name: str, columns=None, filters=(), start: int = 0, stop: Optional[int] = None,
+             limit: Optional[int] = None, where=None) -> pa.Table:
+        # lignes [start, stop) de `name` verifiant tous les filtres (et l'expression `where`), reduites aux colonnes
+        # demandees; seules ces colonnes et celles des filtres sont lues. Avec `limit`, la table est filtree par
+        # fenetres croissantes et le parcours s'arrete des que `limit` lignes sont trouvees
+        table = self.tables[name]
+        columns = list(columns or table.column_names)
+        keys = self.primary_keys[name] if where is not None else [] # l'expression du curseur porte sur la cle
+        needed = list(dict.fromkeys([*columns, *keys, *(column for column, _, _ in filters)]))
+        table = table.select(needed).slice(start, (stop if stop is not None else table.num_rows) - start)
+        expressions = [OPERATORS[op](pc.field(column), value) for column, op, value in filters]
+        if where is not None:
+            expressions.append(where)
+        condition = None
+        for expression in expressions:
+            condition = expression if condition is None else condition & expression
+        if limit is None:
+            result = table.filter(condition) if condition is not None else table
+            return result.select(columns)
+        parts, found, position, window = [], 0, 0, SCAN_WINDOW
+        while position < table.num_rows and found < limit:
+            part = table.slice(position, window)
+            if condition is not None:
+                part = part.filter(condition)
+            part = part.slice(0, limit - found)
+            parts.append(part)
+            found += part.num_rows
+            position += window
+            window *= 2
+        return pa.concat_tables(parts).select(columns) if parts else table.slice(0, 0).select(columns)
+
+    def page(self, name: str, cursor: Optional[str] = None, limit: int = 100, columns=None, filters=()):
+        # pagination par curseur comme query_helpers.paginate: les lignes qui suivent la cle du curseur
+        keys = self.primary_keys[name]
+        start, where = 0, None
+        if cursor:
+            schema = self.tables[name].schema
+            values = decode_cursor(cursor, [str if pa.types.is_string(schema.field(key).type) else int for key in keys])
+            start = self.key_range(name, values[:1])[0]
+            # (k1, k2, ...) > (v1, v2, ...) en ordre lexicographique
+            for column, value in reversed(list(zip(keys, values))):
+                after = pc.field(column) > value
+                where = after if where is None else after | ((pc.field(column) == value) & where)
+        rows = self.scan(name, columns, filters, start, limit=limit + 1, where=where).to_pylist()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][key] for key in keys])
+        return rows, next_cursor
+
+    def first(self, name: str, values: list, filters=()):
+        # ligne dont la cle primaire vaut `values`, ou None
+        lo, hi = self.key_range(name, values)
+        rows = self.scan(name, filters=filters, start=lo, stop=hi, limit=1).to_pylist()
+        return rows[0] if rows else None
+
+
+_snapshot = None
+
+def get_snapshot() -> Snapshot:
+    # tables mappees au premier appel (ou au demarrage de l'API), remappees apres un nouvel export; un instantane
+    # d'une autre version que movies.db est refuse: il melangerait d'anciennes tables de base avec les tables derivees
+    # (movie_stats, index des tags, agregats) et l'ETag de la nouvelle version
+    global _snapshot
+    version, _ = http_cache.dataset_version()
+    if _snapshot is None or (version is not None and _snapshot.version != version):
+        snapshot = Snapshot(SNAPSHOT_DIR)
+        if version is not None and snapshot.version != version:
+            raise RuntimeError(f"instantane {SNAPSHOT_DIR} en version {snapshot.version}, movies.db en version {version}: "
+                               "relancer python snapshot.py export")
+        _snapshot = snapshot
+    return _snapshot
+
+
+# --- Equivalents de query_helpers ---
+# les lignes sont des tuples nommes (ROW_TYPES), ou des dicts pour les pages as_dicts=True des endpoints
+def as_rows(name: str, rows, as_dicts: bool = False):
+    # dicts de to_pylist() -> tuples nommes de la table
+    if as_dicts:
+        return rows
+    row_type = ROW_TYPES[name]
+    if isinstance(rows, dict):
+        return row_type(**rows)
+    return [row_type(**row) for row in rows] if rows is not None else None
+
+def as_page(name: str, page, as_dicts: bool):
+    rows, next_cursor = page
+    return as_rows(name, rows, as_dicts), next_cursor
+
+def genre_movie_ids(snapshot: Snapshot, genre, genre_match: str = "all"):
+    # films retenus par le filtre de genre, lus dans le pont movie_genres comme query_helpers.filter_genres:
+    # comparaison sans casse (NOCASE), "(no genres listed)" absent du pont, ET: tous les genres distincts, OU: au moins un
+    genres = genre_list(genre)
+    if not genres:
+        return None
+    if genre_match not in ("all", "any"):
+        raise ValueError("genre_match doit valoir 'all' ou 'any'")
+    wanted = pa.array(sorted({g.lower() for g in genres}))
+    bridge = snapshot.tables["movie_genres"]
+    bridge = pa.table({"movieId": bridge.column("movieId"), "genre": pc.ascii_lower(bridge.column("genre"))})
+    matched = bridge.filter(pc.is_in(bridge.column("genre"), value_set=wanted))
+    if genre_match == "all" and len(wanted) > 1:
+        counts = matched.group_by("movieId").aggregate([("genre", "count_distinct")])
+        return counts.filter(pc.equal(counts.column("genre_count_distinct"), len(wanted))).column("movieId")
+    return pc.unique(matched.column("movieId"))
+
+def movie_filters(snapshot: Snapshot, title: str = None, genre=None, genre_match: str = "all") -> list:
+    filters = [("title", "contains", title)] if title else []
+    movie_ids = genre_movie_ids(snapshot, genre, genre_match)
+    return filters + ([("movieId", "in", movie_ids)] if movie_ids is not None else [])
+
+def batches(table: pa.Table, batch_size: int):
+    # paquets de tuples, comme query_helpers.stream_rows
+    for offset in range(0, table.num_rows, batch_size):
+        part = table.slice(offset, batch_size)
+        yield list(zip(*(column.to_pylist() for column in part.columns)))
+
+
+def get_movie(db, movie_id: int):
+    return as_rows("movies", get_snapshot().first("movies", [movie_id]))
+
+def get_movies(db, skip: int = 0, limit: int = 100, title: str = None, genre=None, genre_match: str = "all"):
+    snapshot = get_snapshot()
+    filters = movie_filters(snapshot, title, genre, genre_match)
+    if not filters:
+        return as_rows("movies", snapshot.scan("movies", start=skip, limit=limit).to_pylist())
+    return as_rows("movies", snapshot.scan("movies", filters=filters, limit=skip + limit).slice(skip).to_pylist())
+
+def get_movies_page(db, cursor: Optional[str] = None, limit: int = 100, title: str = None, genre=None, genre_match: str = "all",
+                    as_dicts: bool = False, fields=None):
+    # fields ne s'applique qu'aux dicts, comme query_helpers.columns_or_model
+    fields = parse_fields(fields) if as_dicts else None
+    columns = ["movieId", *(field for field in fields if field != "movieId")] if fields else None
+    snapshot = get_snapshot()
+    return as_page("movies", snapshot.page("movies", cursor, limit, columns, movie_filters(snapshot, title, genre, genre_match)), as_dicts)
+
+def get_rating(db, user_id: int, movie_id: int):
+    return as_rows("ratings", get_snapshot().first("ratings", [user_id, movie_id]))
+
+def get_user_rated_movie_ids(db, user_id: int) -> list:
+    lo, hi = get_snapshot().key_range("ratings", [user_id])
+    return get_snapshot().tables["ratings"].column("movieId").slice(lo, hi - lo).to_pylist()
+
+def get_ratings(db, skip: int = 0, limit: int = 100, min_rating: Optional[float] = None):
+    if min_rating is None:
+        return as_rows("ratings", get_snapshot().scan("ratings", start=skip, limit=limit).to_pylist())
+    return as_rows("ratings", get_snapshot().scan("ratings", filters=[("rating", ">=", min_rating)], limit=skip + limit).slice(skip).to_pylist())
+
+def get_ratings_page(db, cursor: Optional[str] = None, limit: int = 100, min_rating: Optional[float] = None,
+                     as_dicts: bool = False):
+    filters = [("rating", ">=", min_rating)] if min_rating is not None else []
+    return as_page("ratings", get_snapshot().page("ratings", cursor, limit, filters=filters), as_dicts)
+
+def get_tag(db, user_id: int, movie_id: int, tag_text: str):
+    return as_rows("tags", get_snapshot().first("tags", [user_id, movie_id], filters=[("tag", "==", tag_text)]))
+
+def get_tags(db, skip: int = 0, limit: int = 100, movie_id: Optional[int] = None):
+    if movie_id is None:
+        return as_rows("tags", get_snapshot().scan("tags", start=skip, limit=limit).to_pylist())
+    return as_rows("tags", get_snapshot().scan("tags", filters=[("movieId", "==", movie_id)], limit=skip + limit).slice(skip).to_pylist())
+
+def get_tags_page(db, cursor: Optional[str] = None, limit: int = 100, movie_id: Optional[int] = None,
+                  as_dicts: bool = False):
+    filters = [("movieId", "==", movie_id)] if movie_id is not None else []
+    return as_page("tags", get_snapshot().page("tags", cursor, limit, filters=filters), as_dicts)
+
+def get_link(db, movie_id: int):
+    return as_rows("links", get_snapshot().first("links", [movie_id]))
+
+def get_links(db, skip: int = 0, limit: int = 100):
+    return as_rows("links", get_snapshot().scan("links", start=skip, limit=limit).to_pylist())
+
+def get_links_page(db, cursor: Optional[str] = None, limit: int = 100, as_dicts: bool = False):
+    return as_page("links", get_snapshot().page("links", cursor, limit), as_dicts)
+
+def get_movie_count(db):
+    return get_snapshot().tables["movies"].num_rows
+
+def get_rating_count(db):
+    return get_snapshot().tables["ratings"].num_rows
+
+def get_tag_count(db):
+    return get_snapshot().tables["tags"].num_rows
+
+def get_link_count(db):
+    return get_snapshot().tables["links"].num_rows
+
+def iter_ratings(db, movie_id: Optional[int] = None, min_rating: Optional[float] = None,
+                 start: Optional[int] = None, end: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    filters = [
+        ("movieId", "==", movie_id) if movie_id is not None else None,
+        ("rating", ">=", min_rating) if min_rating is not None else None,
+        ("timestamp", ">=", start) if start is not None else None,
+        ("timestamp", "<", end) if end is not None else None,
+    ]
+    return batches(get_snapshot().scan("ratings", filters=[f for f in filters if f]), batch_size)
+
+def iter_tags(db, movie_id: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None,
+              batch_size: int = EXPORT_BATCH_SIZE):
+    filters = [
+        ("movieId", "==", movie_id) if movie_id is not None else None,
+        ("timestamp", ">=", start) if start is not None else None,
+        ("timestamp", "<", end) if end is not None else None,
+    ]
+    return batches(get_snapshot().scan("tags", filters=[f for f in filters if f]), batch_size)
+
+
+def benchmark(engine, directory: str = SNAPSHOT_DIR):
+    """Demarrage (colonnes des evaluations) et parcours filtre: SQLite contre instantane mappe"""
+    import analytics
+
+    start = time.perf_counter()
+    analytics.RatingColumns.from_database(engine)
+    print(f"colonnes depuis SQLite:       {time.perf_counter() - start:.3f}s")
+    start = time.perf_counter()
+    analytics.RatingColumns.from_snapshot(Snapshot(directory))
+    print(f"colonnes depuis l'instantane: {time.perf_counter() - start:.3f}s")
+
+    snapshot = Snapshot(directory)
+    with engine.connect() as conn:
+        sql = "SELECT count(*), avg(rating) FROM ratings WHERE rating >= 4"
+        print(f"agregat filtre SQLite:        {best_time(lambda: conn.exec_driver_sql(sql).one()) * 1000:.2f} ms")
+    scan = lambda: pc.mean(snapshot.scan("ratings", ["rating"], [("rating", ">=", 4.0)]).column("rating"))
+    print(f"agregat filtre instantane:    {best_time(scan) * 1000:.2f} ms")
+
+def best_time(function, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Instantane colonne (Arrow IPC) de movies.db")
+    parser.add_argument("command", choices=["export", "bench"])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--output", default=SNAPSHOT_DIR)
+    parser.add_argument("--chunk-size", type=int, default=READ_CHUNK_SIZE, help="lignes par record batch")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if args.command == "bench":
+        benchmark(engine, args.output)
+        return
+    start = time.perf_counter()
+    counts = export_snapshot(engine, args.output, args.chunk_size)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()), f"-> {args.output} en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
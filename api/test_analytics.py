@@ -0,0 +1,66 @@
+"""Statistiques sur les colonnes NumPy des evaluations (analytics.py) et endpoints /stats
+
+Lancer depuis api/:  python -m pytest test_analytics.py
+"""
+import numpy as np
+import pytest
+
+import analytics
+
+
+@pytest.fixture(scope="module")
+def columns(engine):
+    return analytics.RatingColumns.from_database(engine)
+
+
+def sql(engine, query: str) -> list:
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.exec_driver_sql(query)]
+
+
+def test_summary(engine, columns):
+    count, users, movies, mean, first, last = sql(
+        engine, "SELECT count(*), count(DISTINCT userId), count(DISTINCT movieId), avg(rating), min(timestamp), max(timestamp) FROM ratings"
+    )[0]
+    summary = columns.summary()
+    assert (summary["rating_count"], summary["user_count"], summary["rated_movie_count"]) == (count, users, movies)
+    assert summary["rating_mean"] == pytest.approx(mean) and (summary["first_timestamp"], summary["last_timestamp"]) == (first, last)
+
+
+def test_histogram(engine, columns):
+    expected = dict(sql(engine, "SELECT rating, count(*) FROM ratings GROUP BY rating"))
+    assert {row["rating"]: row["count"] for row in columns.histogram() if row["count"]} == expected
+
+
+def test_by_genre(engine, columns):
+    expected = {genre: (count, mean) for genre, count, mean in sql(
+        engine, "SELECT g.genre, count(*), avg(r.rating) FROM ratings r JOIN movie_genres g ON g.movieId = r.movieId GROUP BY g.genre"
+    )}
+    rows = columns.by_genre()
+    assert {row["genre"] for row in rows} == set(expected)
+    assert all(row["rating_count"] == expected[row["genre"]][0] for row in rows)
+    assert all(row["rating_mean"] == pytest.approx(expected[row["genre"]][1]) for row in rows)
+
+
+def test_by_year(engine, columns):
+    expected = dict(sql(engine, "SELECT CAST(strftime('%Y', timestamp, 'unixepoch') AS INTEGER), count(*) FROM ratings GROUP BY 1"))
+    assert {row["year"]: row["rating_count"] for row in columns.by_year()} == expected
+
+
+def test_top_users(engine, columns):
+    expected = sql(engine, "SELECT userId, count(*) FROM ratings GROUP BY userId ORDER BY count(*) DESC, userId LIMIT 5")
+    assert [(row["userId"], row["rating_count"]) for row in columns.top_users(5)] == expected
+
+
+def test_empty_columns():
+    empty = np.empty(0, dtype=np.int32)
+    columns = analytics.RatingColumns(empty, empty, empty.astype(np.float32), empty, np.empty(0, dtype=object), empty)
+    assert columns.summary()["rating_mean"] is None
+    assert columns.by_genre() == [] and columns.by_year() == [] and columns.top_users(3) == []
+
+
+def test_api_stats(client):
+    assert client.get("/stats/summary").json()["rating_count"] > 0
+    assert len(client.get("/stats/histogram").json()) == analytics.RATING_STEPS
+    assert len(client.get("/stats/users/top", params={"limit": 3}).json()) == 3
+    assert client.get("/stats/users/top", params={"limit": 0}).status_code == 422
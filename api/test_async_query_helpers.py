@@ -0,0 +1,58 @@
+"""Fonctions asynchrones (async_query_helpers.py): memes resultats que query_helpers, via AsyncSession
+
+Lancer depuis api/:  python -m pytest test_async_query_helpers.py
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+import async_query_helpers as async_helpers
+import query_helpers as helpers
+
+CASES = {
+    "get_movies_page": ((), {"limit": 20, "genre": "Comedy", "as_dicts": True}),
+    "search_movies": (("toy story",), {}),
+    "get_movies_batch": (([3, 1, 2],), {"include": "link,stats,top_tags"}),
+    "get_ratings_page": ((), {"limit": 20, "min_rating": 4.5, "as_dicts": True}),
+    "get_user_rated_movie_ids": ((1,), {}),
+    "autocomplete_tags": (("fu",), {}),
+    "get_activity": ((), {"granularity": "year"}),
+}
+
+
+def plain(value):
+    # lignes ORM -> dicts de colonnes, pour comparer des objets de sessions differentes
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if hasattr(value, "__table__"):
+        return {column.key: getattr(value, column.key) for column in value.__table__.columns}
+    return value
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_same_results_as_sync(engine, name):
+    args, kwargs = CASES[name]
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}")
+        try:
+            async with AsyncSession(async_engine) as db:
+                return plain(await getattr(async_helpers, name)(db, *args, **kwargs))
+        finally:
+            await async_engine.dispose()
+
+    with Session(engine) as db:
+        expected = plain(getattr(helpers, name)(db, *args, **kwargs))
+    assert asyncio.run(run()) == expected
+
+
+def test_concurrent_requests(client):
+    # les endpoints async partagent la boucle d'evenements: des requetes en parallele ne se melangent pas
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        movies = list(executor.map(lambda movie_id: client.get(f"/movies/{movie_id}").json(), range(1, 17)))
+    assert [movie["movieId"] for movie in movies] == list(range(1, 17))
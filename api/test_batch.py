@@ -0,0 +1,62 @@
+"""Lecture de films par lot (get_movies_batch): nombre de requetes fixe, enfants tronques
+
+Lancer depuis api/:  python -m pytest test_batch.py
+"""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+
+INCLUDE = "link,stats,ratings,tags,top_tags"
+
+
+def count_queries(engine, function) -> int:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(engine) as db:
+            function(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return len(statements)
+
+
+def test_query_count_does_not_grow_with_the_batch(engine):
+    one = count_queries(engine, lambda db: helpers.get_movies_batch(db, [1], include=INCLUDE))
+    many = count_queries(engine, lambda db: helpers.get_movies_batch(db, list(range(1, 201)), include=INCLUDE))
+    # films (avec lien et stats), evaluations, tags, tags frequents
+    assert one == many == 4
+
+
+def test_capped_children_keep_the_latest(engine):
+    with Session(engine) as db:
+        ratings = helpers.capped_children(db, models.Rating, [1, 2], 5)
+        latest = db.query(models.Rating.timestamp).filter(models.Rating.movieId == 1).order_by(models.Rating.timestamp.desc()).limit(5).all()
+    by_movie = {movie_id: sorted((r.timestamp for r in ratings if r.movieId == movie_id), reverse=True) for movie_id in (1, 2)}
+    assert by_movie[1] == [timestamp for (timestamp,) in latest] and len(by_movie[2]) == 5
+
+
+def test_order_duplicates_and_missing(engine):
+    with Session(engine) as db:
+        movies = helpers.get_movies_batch(db, [3, 1, 3, 10**9, 2], include="link", max_ratings=0)
+    assert [movie["movieId"] for movie in movies] == [3, 1, 2]
+    assert movies[1]["link"].movieId == 1 and "ratings" not in movies[1]
+
+
+def test_batch_size_limit(engine):
+    with Session(engine) as db, pytest.raises(ValueError):
+        helpers.get_movies_batch(db, list(range(helpers.MAX_BATCH_SIZE + 1)))
+
+
+def test_api_batch(client):
+    movies = client.get("/movies/batch", params={"ids": [2, 1], "max_ratings": 3, "max_tags": 0}).json()
+    assert [movie["movieId"] for movie in movies] == [2, 1]
+    assert len(movies[0]["ratings"]) == 3 and movies[0]["tags"] == [] and movies[0]["stats"]["rating_count"]
+    response = client.get("/movies/batch", params={"ids": list(range(helpers.MAX_BATCH_SIZE + 1))})
+    assert response.status_code == 400
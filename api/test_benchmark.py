@@ -0,0 +1,83 @@
+"""Banc de performance (benchmark.py): statistiques, couverture des fonctions et detection des regressions
+
+Lancer depuis api/:  python -m pytest test_benchmark.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.orm import Session
+
+import benchmark
+import database
+import query_helpers as helpers
+
+STATS = {"samples": 100, "errors": 0, "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0, "throughput": 1000.0}
+
+
+def test_summarize():
+    stats = benchmark.summarize([0.001] * 99 + [0.101], elapsed=0.5, errors=2)
+    assert stats["samples"] == 100 and stats["errors"] == 2 and stats["throughput"] == 200.0
+    assert stats["p50_ms"] == pytest.approx(1.0) and stats["p99_ms"] > stats["p95_ms"] >= stats["p50_ms"]
+
+
+def test_every_helper_has_a_case(engine):
+    with Session(engine) as db:
+        cases = benchmark.helper_cases(db)
+        assert set(benchmark.helper_names()) <= set(cases)
+        for name in ("get_movie", "get_movies_page", "iter_ratings", "get_activity"):
+            assert cases[name]()
+
+
+def test_uncached_skips_the_memoization():
+    assert benchmark.uncached("get_movie") is helpers.get_movie.__wrapped__
+    assert benchmark.uncached("search_movies") is helpers.search_movies
+
+
+@pytest.mark.parametrize("changes, regression", [
+    ({}, False),
+    ({"p50_ms": 1.2}, False), # dans la tolerance
+    ({"p50_ms": 1.5}, True),
+    ({"p95_ms": 10.0}, False), # p95 ne fait pas echouer
+    ({"throughput": 600.0}, True),
+    ({"errors": 1}, True),
+])
+def test_regressions(changes, regression):
+    assert benchmark.print_results("t", {"f": {**STATS, **changes}}, {"f": STATS}, 0.3) == (["f"] if regression else [])
+
+
+def test_small_latencies_are_noise():
+    # +100% sur 0.02 ms: sous MIN_DELTA_MS; le debit n'est pas compare pour les appels sequentiels
+    reference = {**STATS, "p50_ms": 0.02}
+    results = {"f": {**reference, "p50_ms": 0.04, "throughput": 10.0}}
+    assert benchmark.print_results("t", results, {"f": reference}, 0.3, check_throughput=False) == []
+    assert benchmark.print_results("t", results, {}, 0.3) == []
+
+
+def test_load_endpoint_counts_errors():
+    class Client:
+        calls = 0
+
+        async def get(self, path):
+            Client.calls += 1
+            return SimpleNamespace(status_code=500 if Client.calls % 2 else 200)
+
+    stats = asyncio.run(benchmark.load_endpoint(Client(), "/", concurrency=4, requests=20, max_seconds=5))
+    # une requete de chauffe (erreur, non comptee) puis 20 requetes dont 10 en erreur
+    assert stats["samples"] == 20 and stats["errors"] == 10
+
+
+@pytest.mark.skipif(database.READ_ONLY, reason="URI relative en lecture seule")
+def test_sessions_use_the_workspace_database(engine):
+    # la base construite par build_workspace, pas ./movies.db du dossier ou database a ete importe
+    engines = database.engine, database.async_engine
+    try:
+        benchmark.bind_database(engine.url.database)
+        with database.SessionLocal() as db:
+            assert db.get_bind().url.database == engine.url.database
+            assert benchmark.helper_cases(db)["get_movie"]()
+    finally:
+        database.engine.dispose()
+        database.engine, database.async_engine = engines
+        database.SessionLocal.configure(bind=database.engine)
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
@@ -0,0 +1,36 @@
+"""Moteur SQLite en lecture seule (MOVIELENS_READ_ONLY=1, database.py)
+
+Lancer depuis api/:  python -m pytest test_database.py
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import database
+
+
+@pytest.fixture
+def read_only_engine(engine, monkeypatch):
+    # moteur construit comme celui de l'API en lecture seule, sur la base de test
+    monkeypatch.setattr(database, "DATABASE_PATH", engine.url.database)
+    read_only = database.apply_read_only_pragmas(create_engine(database.read_only_url()))
+    yield read_only
+    read_only.dispose()
+
+
+def test_pragmas_are_applied(read_only_engine):
+    with read_only_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -65536
+        assert conn.exec_driver_sql("SELECT count(*) FROM movies").scalar() > 0
+
+
+def test_writes_are_refused(read_only_engine):
+    with read_only_engine.connect() as conn, pytest.raises(OperationalError):
+        conn.exec_driver_sql("DELETE FROM movies")
+
+
+def test_warm_pool_opens_every_connection(read_only_engine, monkeypatch):
+    monkeypatch.setattr(database, "engine", read_only_engine)
+    database.warm_pool(3)
+    assert read_only_engine.pool.checkedin() == 3
@@ -0,0 +1,53 @@
+"""Export en flux des evaluations et des tags (NDJSON / CSV)
+
+Lancer depuis api/:  python -m pytest test_export.py
+"""
+import csv
+import io
+import json
+
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+from responses import csv_chunks, ndjson_chunks
+
+COLUMNS = ["userId", "movieId", "tag", "timestamp"]
+BATCHES = [[(1, 2, "funny", 10), (1, 3, 'a "quoted", tag', 11)], [(2, 2, "ok", 12)]]
+
+
+def test_ndjson_chunks():
+    chunks = list(ndjson_chunks(COLUMNS, BATCHES))
+    # un morceau par paquet, une ligne json par tuple
+    assert len(chunks) == 2
+    assert [json.loads(line) for line in b"".join(chunks).splitlines()][1] == dict(zip(COLUMNS, BATCHES[0][1]))
+
+
+def test_csv_chunks():
+    rows = list(csv.reader(io.StringIO(b"".join(csv_chunks(COLUMNS, BATCHES)).decode())))
+    assert rows[0] == COLUMNS and rows[2][2] == 'a "quoted", tag' and len(rows) == 4
+
+
+def test_iter_ratings_batches(engine):
+    with Session(engine) as db:
+        batches = list(helpers.iter_ratings(db, movie_id=1, batch_size=50))
+        expected = db.query(models.Rating).filter(models.Rating.movieId == 1).count()
+    assert all(len(batch) == 50 for batch in batches[:-1]) and sum(map(len, batches)) == expected
+
+
+def test_api_export_ndjson(client):
+    response = client.get("/export/ratings", params={"movie_id": 1, "min_rating": 4.0})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    ratings = [json.loads(line) for line in response.text.splitlines()]
+    assert ratings and all(rating["movieId"] == 1 and rating["rating"] >= 4.0 for rating in ratings)
+
+
+def test_api_export_csv(client):
+    response = client.get("/export/tags", params={"format": "csv", "start": 1_500_000_000, "end": 1_600_000_000})
+    assert response.headers["content-disposition"] == 'attachment; filename="tags.csv"'
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == COLUMNS and rows and all(1_500_000_000 <= int(row[3]) < 1_600_000_000 for row in rows)
+
+
+def test_api_export_format(client):
+    assert client.get("/export/ratings", params={"format": "xml"}).status_code == 422
@@ -0,0 +1,50 @@
+"""Filtre par genre via la table de liaison movie_genres
+
+Lancer depuis api/:  python -m pytest test_genres.py
+"""
+import pytest
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+
+
+def movie_ids(db, genre, genre_match="all") -> set:
+    return {movie.movieId for movie in helpers.get_movies(db, limit=100_000, genre=genre, genre_match=genre_match)}
+
+
+def scanned(db, predicate) -> set:
+    # reference: decoupage de la colonne genres de chaque film
+    return {movie.movieId for movie in db.query(models.Movie) if predicate(set(movie.genres.split("|")))}
+
+
+def test_bridge_matches_the_genres_column(engine):
+    with Session(engine) as db:
+        assert movie_ids(db, "Comedy") == scanned(db, lambda genres: "Comedy" in genres)
+        assert movie_ids(db, ["Comedy", "Romance"]) == scanned(db, lambda genres: {"Comedy", "Romance"} <= genres)
+        assert movie_ids(db, "Comedy|Romance", "any") == scanned(db, lambda genres: genres & {"Comedy", "Romance"})
+
+
+def test_genre_is_case_insensitive(engine):
+    with Session(engine) as db:
+        assert movie_ids(db, ["comedy", "ROMANCE"]) == movie_ids(db, ["Comedy", "Romance"])
+        # le meme genre en deux casses compte une fois
+        assert movie_ids(db, ["Comedy", "comedy"]) == movie_ids(db, "Comedy")
+
+
+def test_no_genres_listed_is_not_a_genre(engine):
+    with Session(engine) as db:
+        assert scanned(db, lambda genres: "(no genres listed)" in genres)
+        assert movie_ids(db, "(no genres listed)") == set()
+
+
+def test_invalid_genre_match(engine):
+    with Session(engine) as db, pytest.raises(ValueError):
+        movie_ids(db, ["Comedy", "Romance"], "some")
+
+
+def test_api_genre_filter(client):
+    response = client.get("/movies", params={"genre": ["Comedy", "Romance"], "genre_match": "all", "limit": 5})
+    assert response.status_code == 200
+    assert all({"Comedy", "Romance"} <= set(movie["genres"].split("|")) for movie in response.json()["items"])
+    assert client.get("/movies", params={"genre": "Comedy", "genre_match": "some"}).status_code == 422
@@ -0,0 +1,147 @@
+"""Cache des lectures ponctuelles de query_helpers (helper_cache.py)
+
+Lancer depuis api/:  python -m pytest test_helper_cache.py
+"""
+import pytest
+import os
+
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import Session
+
+import database
+import helper_cache
+import http_cache
+import models
+import query_helpers as helpers
+from load_data import load_all
+
+pytestmark = pytest.mark.skipif(database.BACKEND != "sqlite" or helper_cache.MAX_ENTRIES <= 0,
+                                reason="cache des fonctions SQLite")
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('cache') / 'movies.db'}")
+    load_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def queries(engine, monkeypatch):
+    # cache vide, version relue a chaque lecture, et liste des requetes SQL des fonctions (hors dataset_info)
+    helper_cache.cache.clear()
+    monkeypatch.setattr(helper_cache.cache, "check_seconds", 0)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "dataset_info" not in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+def copy_database(engine, path):
+    other = create_engine(f"sqlite:///{path}")
+    with engine.connect() as source, other.connect() as target:
+        source.connection.driver_connection.backup(target.connection.driver_connection)
+    return other
+
+
+def set_version(engine, version: str):
+    with engine.begin() as conn:
+        conn.execute(update(models.DatasetInfo).where(models.DatasetInfo.key == "version").values(value=version))
+    # date du fichier changee a coup sur (resolution du systeme de fichiers)
+    stat = os.stat(engine.url.database)
+    os.utime(engine.url.database, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_hit_skips_sql_and_keeps_session_contract(engine, queries):
+    statements = queries
+    with Session(engine) as db:
+        first = helpers.get_movie(db, 1)
+    with Session(engine) as db:
+        second = helpers.get_movie(db, 1)
+        assert helpers.get_movie_count(db) == helpers.get_movie_count(db)
+        # une requete pour le film, une pour le nombre de films
+        assert len(statements) == 2
+        # nouvel objet, rattache a la session de l'appelant: ses relations se chargent
+        assert second is not first and second in db and second.title == first.title
+        assert second.ratings and second.link.movieId == 1
+    assert helper_cache.cache.stats()["helpers"]["get_movie"] == {"hits": 1, "misses": 1}
+
+
+def test_view_hit_is_a_copy(engine, queries):
+    statements = queries
+    with Session(engine) as db:
+        first = helpers.get_movie_view(db, 1, include="link,stats")
+        count = len(statements)
+        second = helpers.get_movie_view(db, 1, include="link,stats")
+    assert len(statements) == count
+    # objets lies en dicts de colonnes, la meme vue a chaque lecture, mais jamais le meme objet
+    assert second == first and second is not first and second["link"]["imdbId"]
+    second["link"]["imdbId"] = "modifie"
+    with Session(engine) as db:
+        assert helpers.get_movie_view(db, 1, include="link,stats") == first
+
+
+def test_other_database_is_not_shared(engine, queries, tmp_path):
+    with Session(engine) as db:
+        helpers.get_movie(db, 1)
+    other = copy_database(engine, tmp_path / "other.db")
+    with Session(other) as db:
+        helpers.get_movie(db, 1)
+    other.dispose()
+    assert helper_cache.cache.stats()["helpers"]["get_movie"] == {"hits": 0, "misses": 2}
+
+
+def test_missing_row_is_cached(engine, queries):
+    statements = queries
+    with Session(engine) as db:
+        assert helpers.get_link(db, -1) is None
+        assert helpers.get_link(db, -1) is None
+    assert len(statements) == 1
+
+
+def test_new_dataset_version_invalidates_its_database(engine, queries, tmp_path):
+    # la version est lue dans la base de la session: un rechargement de `other` ne vide que ses entrees
+    other = copy_database(engine, tmp_path / "other.db")
+    with Session(engine) as db, Session(other) as other_db:
+        helpers.get_link(db, 1)
+        helpers.get_link(other_db, 1)
+        set_version(other, "v2")
+        helpers.get_link(db, 1)
+        helpers.get_link(other_db, 1)
+    other.dispose()
+    assert helper_cache.cache.stats()["helpers"]["get_link"] == {"hits": 1, "misses": 3}
+
+
+def test_version_check_is_throttled(engine, queries, monkeypatch):
+    # un os.stat du fichier au plus par check_seconds, pas un par lecture
+    monkeypatch.setattr(helper_cache.cache, "check_seconds", 60)
+    stats = []
+    stat = os.stat
+    monkeypatch.setattr(helper_cache.os, "stat", lambda path, *args, **kwargs: stats.append(path) or stat(path, *args, **kwargs))
+    with Session(engine) as db:
+        for _ in range(20):
+            helpers.get_link(db, 1)
+    assert stats == [engine.url.database]
+
+
+def test_ttl_and_size_bound(monkeypatch):
+    monkeypatch.setattr(http_cache, "dataset_version", lambda: ("v1", 0))
+    cache = helper_cache.HelperCache(max_entries=2)
+    # cles de memoize: (fonction, url de la base, args, kwargs)
+    key = lambda n: ("f", "sqlite:///movies.db", (n,), ())
+    assert cache.get(key(1)) == (False, None)
+    cache.put(key(1), "a", ttl=60)
+    cache.put(key(2), "b", ttl=-1)
+    assert cache.get(key(2)) == (False, None) # expiree
+    cache.put(key(3), "c", ttl=60)
+    cache.get(key(1))
+    cache.put(key(4), "d", ttl=60)
+    # (3,) est la moins recemment lue: evincee
+    assert cache.get(key(3)) == (False, None)
+    assert cache.get(key(1)) == (True, "a")
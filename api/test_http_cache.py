@@ -0,0 +1,67 @@
+"""Requetes conditionnelles (http_cache.py): ETag, Last-Modified, 304
+
+Lancer depuis api/:  python -m pytest test_http_cache.py
+"""
+import pytest
+from sqlalchemy import event
+
+import database
+
+
+def test_etag_and_304(client):
+    response = client.get("/movies/1")
+    etag = response.headers["etag"]
+    assert response.status_code == 200 and response.headers["cache-control"].startswith("public")
+    assert client.get("/movies/1", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/movies/1", headers={"If-None-Match": 'W/"ancienne"'}).status_code == 200
+    assert client.get("/movies/1", headers={"If-Modified-Since": response.headers["last-modified"]}).status_code == 304
+
+
+def test_wildcard_on_an_existing_resource(client):
+    response = client.get("/movies/1", headers={"If-None-Match": "*"})
+    assert response.status_code == 304 and response.content == b""
+
+
+@pytest.mark.parametrize("path", ["/movies/999999999", "/nope", "/movies/999999999/stats"])
+def test_wildcard_on_a_missing_resource(client, path):
+    # "*" ne vaut que pour une ressource qui existe: une 404 reste une 404, sans validateurs
+    response = client.get(path, headers={"If-None-Match": "*"})
+    assert response.status_code == 404 and "etag" not in response.headers and "cache-control" not in response.headers
+
+
+def test_errors_are_not_validated(client):
+    response = client.get("/movies", params={"cursor": "%%%"}, headers={"If-None-Match": 'W/"ancienne"'})
+    assert response.status_code == 400 and "etag" not in response.headers
+
+
+@pytest.mark.parametrize("path", ["/docs", "/openapi.json", "/", "/metrics"])
+def test_docs_and_monitoring_are_not_cached(client, path):
+    response = client.get(path, headers={"If-None-Match": "*"})
+    assert response.status_code == 200 and "etag" not in response.headers and "cache-control" not in response.headers
+
+
+def test_artifact_routes_include_build_time(client):
+    data_etag = client.get("/movies/1").headers["etag"]
+    similar_etag = client.get("/movies/1/similar").headers["etag"]
+    assert similar_etag.startswith(data_etag[:-1] + "-")
+
+
+def test_matching_etag_skips_the_route(client):
+    # ETag courant: 304 avant l'execution de la route, aucune requete SQL
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "dataset_info" not in statement:
+            statements.append(statement)
+
+    engine = database.AsyncSessionLocal.kw["bind"].sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.get("/movies", params={"limit": 7})
+        assert response.status_code == 200 and statements
+        statements.clear()
+        etag = response.headers["etag"]
+        not_modified = client.get("/movies", params={"limit": 7}, headers={"If-None-Match": f'W/"ancienne", {etag}'})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert not_modified.status_code == 304 and not_modified.headers["etag"] == etag and statements == []
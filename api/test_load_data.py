@@ -0,0 +1,61 @@
+"""Chargement des fichiers CSV (load_data.py)
+
+Lancer depuis api/:  python -m pytest test_load_data.py
+"""
+from sqlalchemy import create_engine, func, select
+
+import models
+from load_data import load_all
+
+MOVIES = [(1, "Toy Story (1995)", "Adventure|Comedy"), (2, "Jumanji (1995)", "(no genres listed)")]
+LINKS = [(1, "0114709", 862), (2, "0113497", "")]
+RATINGS = [(1, 1, 4.0, 1000), (2, 1, 5.0, 2000), (2, 2, 3.0, 3000)]
+TAGS = [(1, 1, "funny", 1500)]
+
+
+def count(engine, model):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model.__table__)).scalar()
+
+
+def test_counts_rows_written(small_engine, dataset):
+    counts = load_all(small_engine, dataset(movies=MOVIES, links=LINKS, ratings=RATINGS, tags=TAGS))
+    assert {name: counts[name] for name in ("movies", "links", "ratings", "tags")} == {
+        "movies": 2, "links": 2, "ratings": 3, "tags": 1,
+    }
+    # les films sans genre ne vont pas dans movie_genres
+    assert counts["movie_genres"] == 2 and counts["movie_stats"] == 2
+    with small_engine.connect() as conn:
+        assert conn.execute(select(models.Link.tmdbId).where(models.Link.movieId == 2)).scalar() is None
+
+
+def test_releases_the_exclusive_lock(small_engine, dataset):
+    # la connexion du chargement reste dans le pool: une autre connexion doit pouvoir lire la base
+    load_all(small_engine, dataset(movies=MOVIES, links=LINKS, ratings=RATINGS, tags=TAGS))
+    reader = create_engine(small_engine.url, connect_args={"timeout": 0.1})
+    try:
+        assert count(reader, models.Movie) == 2
+    finally:
+        reader.dispose()
+
+
+def test_incremental_reload_writes_nothing(small_engine, dataset):
+    directory = dataset(movies=MOVIES, links=LINKS, ratings=RATINGS, tags=TAGS)
+    load_all(small_engine, directory)
+    counts = load_all(small_engine, directory, incremental=True)
+    # les lignes deja presentes sont ignorees et ne sont pas comptees
+    assert {name: counts[name] for name in ("movies", "links", "ratings", "tags")} == {
+        "movies": 0, "links": 0, "ratings": 0, "tags": 0,
+    }
+    assert count(small_engine, models.Rating) == 3
+
+
+def test_incremental_adds_newer_rows(small_engine, dataset):
+    load_all(small_engine, dataset("v1", movies=MOVIES, links=LINKS, ratings=RATINGS, tags=TAGS))
+    counts = load_all(small_engine, dataset("v2", movies=MOVIES, links=LINKS, ratings=RATINGS + [(3, 2, 1.0, 4000)], tags=TAGS),
+                      incremental=True)
+    assert counts["ratings"] == 1 and count(small_engine, models.Rating) == 4
+    with small_engine.connect() as conn:
+        stats = conn.execute(select(models.MovieStats.rating_count, models.MovieStats.rating_mean)
+                             .where(models.MovieStats.movieId == 2)).one()
+    assert tuple(stats) == (2, 2.0)
@@ -0,0 +1,34 @@
+"""Metriques Prometheus par requete (metrics.py) et GET /metrics
+
+Lancer depuis api/:  python -m pytest test_metrics.py
+"""
+from prometheus_client import REGISTRY
+
+
+def sample(name: str, route: str) -> float:
+    return REGISTRY.get_sample_value(name, {"route": route}) or 0.0
+
+
+def test_export_counts_queries_run_while_streaming(client):
+    # les requetes SQL d'un export s'executent pendant l'envoi du corps: elles doivent etre comptees
+    before = sample("movielens_db_queries_per_request_sum", "/export/ratings")
+    count = sample("movielens_db_queries_per_request_count", "/export/ratings")
+    response = client.get("/export/ratings", params={"movie_id": 1})
+    assert response.status_code == 200 and response.text
+    assert sample("movielens_db_queries_per_request_count", "/export/ratings") == count + 1
+    assert sample("movielens_db_queries_per_request_sum", "/export/ratings") > before
+
+
+def test_request_is_counted_once(client):
+    labels = {"method": "GET", "route": "/movies/{movie_id}", "status": "404"}
+    before = REGISTRY.get_sample_value("movielens_http_requests_total", labels) or 0.0
+    assert client.get("/movies/999999999").status_code == 404
+    assert REGISTRY.get_sample_value("movielens_http_requests_total", labels) == before + 1
+    assert sample("movielens_db_queries_per_request_sum", "/movies/{movie_id}") > 0
+
+
+def test_metrics_endpoint(client):
+    client.get("/movies/1")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'movielens_http_request_duration_seconds_count{method="GET",route="/movies/{movie_id}"}' in response.text
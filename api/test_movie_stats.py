@@ -0,0 +1,45 @@
+"""Agregats par film (table movie_stats) et classements /movies/top
+
+Lancer depuis api/:  python -m pytest test_movie_stats.py
+"""
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+
+
+def test_stats_match_the_ratings(engine):
+    with Session(engine) as db:
+        stats = helpers.get_movie_stats(db, 1)
+        count, mean = db.query(func.count(), func.avg(models.Rating.rating)).filter(models.Rating.movieId == 1).one()
+        global_mean = db.query(func.avg(models.Rating.rating)).scalar()
+    assert (stats.rating_count, stats.year) == (count, 1995)
+    assert stats.rating_mean == pytest.approx(mean) and sum(stats.histogram) == count
+    # moyenne bayesienne: entre la moyenne du film et la moyenne globale
+    assert min(mean, global_mean) <= stats.weighted_score <= max(mean, global_mean)
+
+
+@pytest.mark.parametrize("order_by,column", [("weighted", "weighted_score"), ("count", "rating_count"), ("mean", "rating_mean")])
+def test_top_movies_are_sorted(engine, order_by, column):
+    with Session(engine) as db:
+        values = [getattr(stats, column) for _, stats in helpers.get_top_movies(db, limit=20, order_by=order_by)]
+    assert values == sorted(values, reverse=True)
+
+
+def test_top_movies_filters(engine):
+    with Session(engine) as db:
+        rows = helpers.get_top_movies(db, limit=20, genre="Drama", year=1995, min_count=10)
+        assert rows and all(
+            stats.year == 1995 and stats.rating_count >= 10 and "Drama" in movie.genres.split("|") for movie, stats in rows
+        )
+        with pytest.raises(ValueError):
+            helpers.get_top_movies(db, order_by="title")
+
+
+def test_api_stats(client):
+    assert client.get("/movies/1/stats").json()["rating_count"] > 0
+    assert client.get("/movies/999999999/stats").status_code == 404
+    assert client.get("/movies/top", params={"order_by": "title"}).status_code == 422
+    assert len(client.get("/movies/top", params={"limit": 3}).json()) == 3
@@ -0,0 +1,67 @@
+"""Pagination par curseur (keyset) de query_helpers et des endpoints de liste
+
+Lancer depuis api/:  python -m pytest test_pagination.py
+"""
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+
+INVALID_CURSORS = {
+    "pas du base64": "%%%",
+    "pas du json": helpers.encode_cursor([1])[:-2] + "xx",
+    "pas une liste": "eyJhIjogMX0=", # {"a": 1}
+    "trop de valeurs": helpers.encode_cursor([1, 2]),
+    "mauvais type": helpers.encode_cursor(["1"]),
+    "booleen": helpers.encode_cursor([True]),
+}
+
+
+def walk(page, **kwargs) -> list:
+    # toutes les lignes, page par page
+    rows, cursor = page(cursor=None, **kwargs)
+    while cursor:
+        more, cursor = page(cursor=cursor, **kwargs)
+        rows += more
+    return rows
+
+
+def test_pages_cover_the_table_once(engine):
+    with Session(engine) as db:
+        movie_ids = [row["movieId"] for row in walk(lambda **kw: helpers.get_movies_page(db, as_dicts=True, **kw), limit=1000)]
+        total = db.execute(select(func.count()).select_from(models.Movie)).scalar()
+    assert movie_ids == sorted(set(movie_ids)) and len(movie_ids) == total
+
+
+def test_composite_key_cursor(engine):
+    with Session(engine) as db:
+        rows = walk(lambda **kw: helpers.get_ratings_page(db, **kw), limit=500, min_rating=5.0)
+        expected = db.query(models.Rating).filter(models.Rating.rating >= 5.0).order_by(models.Rating.userId, models.Rating.movieId).all()
+    assert [(row.userId, row.movieId) for row in rows] == [(row.userId, row.movieId) for row in expected]
+
+
+def test_last_page_has_no_cursor(engine):
+    with Session(engine) as db:
+        rows, cursor = helpers.get_links_page(db, cursor=helpers.encode_cursor([10**9]), limit=10)
+    assert rows == [] and cursor is None
+
+
+@pytest.mark.parametrize("cursor", INVALID_CURSORS.values(), ids=INVALID_CURSORS.keys())
+def test_invalid_cursor(engine, cursor):
+    with Session(engine) as db, pytest.raises(ValueError, match="curseur invalide"):
+        helpers.get_movies_page(db, cursor=cursor)
+
+
+@pytest.mark.parametrize("path", ["/movies", "/ratings", "/tags", "/links"])
+def test_invalid_cursor_is_a_400(client, path):
+    response = client.get(path, params={"cursor": helpers.encode_cursor(["x", "y", "z", "w"])})
+    assert response.status_code == 400 and response.json()["detail"] == "curseur invalide"
+
+
+def test_api_pages_follow_next_cursor(client):
+    first = client.get("/tags", params={"limit": 5}).json()
+    second = client.get("/tags", params={"limit": 5, "cursor": first["next_cursor"]}).json()
+    both = client.get("/tags", params={"limit": 10}).json()
+    assert first["items"] + second["items"] == both["items"]
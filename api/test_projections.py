@@ -0,0 +1,36 @@
+"""Projections des films: fields= (colonnes) et include= (objets lies)
+
+Lancer depuis api/:  python -m pytest test_projections.py
+"""
+import pytest
+from sqlalchemy.orm import Session
+
+import query_helpers as helpers
+
+
+def test_parse_list():
+    assert helpers.parse_fields(" title, genres,") == ["title", "genres"]
+    assert helpers.parse_fields(None) is None
+    with pytest.raises(ValueError, match="budget"):
+        helpers.parse_fields("title,budget")
+
+
+def test_movie_view_projection(engine):
+    with Session(engine) as db:
+        view = helpers.get_movie_view(db, 1, fields="title", include="top_tags")
+        default = helpers.get_movie_view(db, 1)
+    assert set(view) == {"movieId", "title", "top_tags"}
+    assert set(default) == {"movieId", "title", "genres", "link", "stats"}
+
+
+def test_api_movie_projection(client):
+    body = client.get("/movies/1", params={"fields": "title", "include": "stats"}).json()
+    assert set(body) == {"movieId", "title", "stats"} and body["stats"]["rating_count"] > 0
+    assert client.get("/movies/1", params={"include": "reviews"}).status_code == 400
+    assert client.get("/movies/999999999").status_code == 404
+
+
+def test_api_list_projection(client):
+    items = client.get("/movies", params={"limit": 3, "fields": "title"}).json()["items"]
+    assert [set(item) for item in items] == [{"movieId", "title"}] * 3
+    assert client.get("/movies", params={"fields": "budget"}).status_code == 400
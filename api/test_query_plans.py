@@ -0,0 +1,132 @@
+"""Plans d'execution des requetes de query_helpers: chaque requete doit passer par un index
+
+Une base neuve est construite depuis data/ dans un dossier temporaire; chaque cas appelle une fonction de
+query_helpers, capture les requetes SQL emises et verifie leur plan (EXPLAIN QUERY PLAN).
+Lancer depuis api/:  python -m pytest test_query_plans.py
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+import database
+import helper_cache
+import models
+import query_helpers as helpers
+from load_data import load_all
+from slow_queries import explain, is_full_scan
+
+pytestmark = pytest.mark.skipif(database.BACKEND != "sqlite", reason="plans SQLite seulement")
+
+consume = lambda batches: [row for batch in batches for row in batch]
+
+# un appel par requete (et par variante de filtre) de query_helpers
+INDEXED_CASES = {
+    "get_movie": lambda db: helpers.get_movie(db, 1),
+    "get_movies/genre": lambda db: helpers.get_movies(db, limit=10, genre="Comedy"),
+    "get_movies_page/genres": lambda db: helpers.get_movies_page(db, limit=10, genre=["Comedy", "Romance"]),
+    "get_movies_page/cursor": lambda db: helpers.get_movies_page(db, cursor=helpers.encode_cursor([100]), limit=10),
+    "search_movies": lambda db: helpers.search_movies(db, "toy story"),
+    "capped_children/ratings": lambda db: helpers.capped_children(db, models.Rating, [1, 2, 3], 5),
+    "capped_children/tags": lambda db: helpers.capped_children(db, models.Tag, [1, 2, 3], 5),
+    "top_tags": lambda db: helpers.top_tags(db, [1, 2, 3], 5),
+    "get_movies_batch": lambda db: helpers.get_movies_batch(db, [1, 2, 3], include="link,stats,ratings,tags,top_tags"),
+    "get_movie_view": lambda db: helpers.get_movie_view(db, 1),
+    "get_movie_stats": lambda db: helpers.get_movie_stats(db, 1),
+    "get_top_movies": lambda db: helpers.get_top_movies(db, limit=10),
+    "get_top_movies/genre": lambda db: helpers.get_top_movies(db, limit=10, genre="Drama"),
+    "get_top_movies/year": lambda db: helpers.get_top_movies(db, limit=10, year=1995),
+    "get_rating": lambda db: helpers.get_rating(db, 1, 1),
+    "get_user_rated_movie_ids": lambda db: helpers.get_user_rated_movie_ids(db, 1),
+    "get_ratings/min_rating": lambda db: helpers.get_ratings(db, limit=10, min_rating=4.5),
+    "get_ratings_page": lambda db: helpers.get_ratings_page(db, limit=10),
+    "get_ratings_page/cursor": lambda db: helpers.get_ratings_page(db, cursor=helpers.encode_cursor([5, 10]), limit=10),
+    "get_tag": lambda db: helpers.get_tag(db, 2, 60756, "funny"),
+    "get_tags/movie_id": lambda db: helpers.get_tags(db, limit=10, movie_id=296),
+    "get_tags_page": lambda db: helpers.get_tags_page(db, limit=10),
+    "get_tags_page/movie_id": lambda db: helpers.get_tags_page(db, limit=10, movie_id=296),
+    "autocomplete_tags": lambda db: helpers.autocomplete_tags(db, "fu"),
+    "get_movies_with_tag": lambda db: helpers.get_movies_with_tag(db, "funny"),
+    "get_movie_top_tags": lambda db: helpers.get_movie_top_tags(db, 296),
+    "get_link": lambda db: helpers.get_link(db, 1),
+    "get_links_page/cursor": lambda db: helpers.get_links_page(db, cursor=helpers.encode_cursor([100]), limit=10),
+    "get_movie_count": lambda db: helpers.get_movie_count(db),
+    "get_rating_count": lambda db: helpers.get_rating_count(db),
+    "get_tag_count": lambda db: helpers.get_tag_count(db),
+    "iter_ratings/movie_id": lambda db: consume(helpers.iter_ratings(db, movie_id=1, min_rating=4.0)),
+    "iter_ratings/min_rating": lambda db: consume(helpers.iter_ratings(db, min_rating=4.5)),
+    "iter_ratings/period": lambda db: consume(helpers.iter_ratings(db, start=1_000_000_000, end=1_100_000_000)),
+    "iter_tags/movie_id": lambda db: consume(helpers.iter_tags(db, movie_id=296)),
+    "iter_tags/period": lambda db: consume(helpers.iter_tags(db, start=1_500_000_000)),
+    "get_activity": lambda db: helpers.get_activity(db, granularity="month"),
+    "get_activity/genre": lambda db: helpers.get_activity(db, granularity="year", genre="comedy"),
+    "get_activity/movie_id": lambda db: helpers.get_activity(db, granularity="year", movie_id=1),
+}
+
+# requetes qui lisent la table dans l'ordre de sa cle par construction: listes et exports sans filtre (bornes par
+# LIMIT ou lus en flux), count(*) de links (pas d'index secondaire), et la recherche de sous-chaine dans le titre
+# (la recherche indexee est search_movies)
+SCAN_CASES = {
+    "get_movies/title": lambda db: helpers.get_movies(db, limit=10, title="star"),
+    "get_ratings": lambda db: helpers.get_ratings(db, limit=10),
+    "get_tags": lambda db: helpers.get_tags(db, limit=10),
+    "get_links": lambda db: helpers.get_links(db, limit=10),
+    "get_links_page": lambda db: helpers.get_links_page(db, limit=10),
+    "get_link_count": lambda db: helpers.get_link_count(db),
+    "iter_tags": lambda db: consume(helpers.iter_tags(db)),
+}
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'movies.db'}")
+    load_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def empty_helper_cache():
+    # un resultat deja en cache n'emet aucune requete
+    helper_cache.cache.clear()
+
+
+def query_plans(engine, case) -> list:
+    # plans des requetes emises par `case`
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # la lecture de dataset_info (quelques lignes) est la verification de version de helper_cache, pas la fonction
+        if "dataset_info" not in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(engine) as db:
+            case(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert statements, "aucune requete SQL capturee"
+    return [explain(statement, parameters, engine) for statement, parameters in statements]
+
+
+@pytest.mark.parametrize("name", INDEXED_CASES)
+def test_query_uses_index(engine, name):
+    for plan in query_plans(engine, INDEXED_CASES[name]):
+        assert not is_full_scan(plan), f"{name}: parcours complet\n" + "\n".join(plan)
+
+
+@pytest.mark.parametrize("name", SCAN_CASES)
+def test_expected_scan(engine, name):
+    # si une de ces requetes passe par un index, la deplacer dans INDEXED_CASES
+    plans = query_plans(engine, SCAN_CASES[name])
+    assert any(is_full_scan(plan) for plan in plans)
+
+
+def test_every_helper_has_a_case():
+    covered = {name.split("/")[0] for name in (*INDEXED_CASES, *SCAN_CASES)}
+    helpers_with_db = {
+        name for name, function in vars(helpers).items()
+        if callable(function) and getattr(function, "__module__", None) == "query_helpers"
+        and function.__code__.co_varnames[:1] == ("db",)
+    }
+    assert helpers_with_db - covered <= {"stream_rows"} # parcours generique, couvert par iter_ratings / iter_tags
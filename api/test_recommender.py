@@ -0,0 +1,63 @@
+"""Modele de recommandation (recommender.py) et GET /users/{id}/recommendations
+
+Lancer depuis api/:  python -m pytest test_recommender.py
+"""
+import numpy as np
+import pytest
+
+import recommender
+import similarity
+
+
+@pytest.fixture(scope="module")
+def split(engine):
+    # 90% des evaluations pour l'entrainement, 10% mises de cote
+    users, movies, ratings = similarity.read_ratings(engine)
+    held_out = np.random.default_rng(0).random(len(ratings)) < 0.1
+    model = recommender.train(users[~held_out], movies[~held_out], ratings[~held_out])
+    return model, (users[held_out], movies[held_out], ratings[held_out])
+
+
+@pytest.fixture(scope="module")
+def model(split, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("recommender"))
+    recommender.save(split[0], directory)
+    return recommender.Recommender(directory)
+
+
+def test_held_out_rmse(split, model):
+    # mieux que predire la moyenne globale pour les evaluations jamais vues
+    _, (users, movies, ratings) = split
+    rows, columns = np.searchsorted(model.user_ids, users), np.searchsorted(model.movie_ids, movies)
+    known = (rows < len(model.user_ids)) & (columns < len(model.movie_ids))
+    known[known] &= (model.user_ids[rows[known]] == users[known]) & (model.movie_ids[columns[known]] == movies[known])
+    predictions = np.array([model.predict(row)[column] for row, column in zip(rows[known], columns[known])])
+    rmse = np.sqrt(np.mean((predictions.clip(recommender.MIN_RATING, recommender.MAX_RATING) - ratings[known]) ** 2))
+    baseline = np.sqrt(np.mean((model.global_mean - ratings[known]) ** 2))
+    assert rmse < 0.9 < baseline
+
+
+def test_top_n_is_not_all_clipped(model):
+    # le classement se fait sur la prediction avec biais: pour la plupart des utilisateurs,
+    # les meilleurs films ne sont pas tous ramenes a 5.0
+    clipped = [all(rating >= recommender.MAX_RATING for _, rating in model.recommend(int(user_id), limit=10))
+               for user_id in model.user_ids]
+    assert np.mean(clipped) < 0.1
+
+
+def test_recommendations_are_supported_and_new(model):
+    rated = [1, 3, 6]
+    recommendations = model.recommend(1, rated, limit=20)
+    movie_ids = [movie_id for movie_id, _ in recommendations]
+    counts = model.item_counts[np.searchsorted(model.movie_ids, movie_ids)]
+    ratings = [rating for _, rating in recommendations]
+    assert len(movie_ids) == 20 and not set(rated) & set(movie_ids)
+    assert (counts >= model.min_support).all() and ratings == sorted(ratings, reverse=True)
+    assert model.recommend(10**9) is None
+
+
+def test_api_recommendations(client):
+    recommendations = client.get("/users/1/recommendations", params={"limit": 5}).json()
+    assert len(recommendations) == 5
+    assert all(recommender.MIN_RATING <= movie["predicted_rating"] <= recommender.MAX_RATING for movie in recommendations)
+    assert client.get("/users/999999999/recommendations").status_code == 404
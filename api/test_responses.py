@@ -0,0 +1,31 @@
+"""Listes serialisees directement depuis les tuples SQL (FastJSONResponse)
+
+Lancer depuis api/:  python -m pytest test_responses.py
+"""
+import json
+
+import pytest
+
+import schemas
+from responses import FastJSONResponse
+
+PAGES = {
+    "/movies": schemas.MoviePage,
+    "/ratings": schemas.RatingPage,
+    "/tags": schemas.TagPage,
+    "/links": schemas.LinkPage,
+}
+
+
+def test_fast_json_matches_json():
+    content = {"items": [{"movieId": 1, "title": "Amélie", "rating": 4.5, "tmdbId": None}], "next_cursor": None}
+    assert json.loads(FastJSONResponse(content).body) == content
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_pages_match_their_response_model(client, path):
+    # response_model ne sert qu'a la documentation: le contenu encode directement doit la respecter
+    body = client.get(path, params={"limit": 50}).json()
+    assert PAGES[path].model_validate(body).model_dump(exclude_unset=True) == body
+    assert len(body["items"]) == 50 and body["next_cursor"]
+
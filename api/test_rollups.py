@@ -0,0 +1,69 @@
+"""Agregats par periode (activity_rollups) et GET /timeseries
+
+Lancer depuis api/:  python -m pytest test_rollups.py
+"""
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+from load_data import load_all
+
+DAY, YEAR_2000, YEAR_2005 = 86400, 946684800, 1104537600
+MOVIES = [(1, "Toy Story (1995)", "Adventure|Comedy"), (2, "Heat (1995)", "Action")]
+RATINGS = [(1, 1, 4.0, YEAR_2000), (2, 1, 3.0, YEAR_2000 + 40 * DAY), (2, 2, 5.0, YEAR_2000 + 400 * DAY)]
+TAGS = [(1, 1, "pixar", YEAR_2000 + DAY)]
+# chargement suivant: l'utilisateur 1 note de nouveau le film 1 (et retague), l'utilisateur 3 note le film 2
+NEW_RATINGS = [(1, 1, 2.0, YEAR_2005), (3, 2, 4.0, YEAR_2005 + DAY)]
+NEW_TAGS = [(1, 1, "pixar", YEAR_2005 + 2 * DAY)]
+
+
+def rollups(engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(select(models.ActivityRollup.__table__)).all())
+
+
+def test_incremental_matches_a_full_rebuild(small_engine, dataset, tmp_path):
+    load_all(small_engine, dataset("v1", movies=MOVIES, ratings=RATINGS, tags=TAGS))
+    # nouvel export complet: la note (1, 1) de 2000 y est remplacee par celle de 2005
+    v2 = dataset("v2", movies=MOVIES, ratings=RATINGS[1:] + NEW_RATINGS, tags=NEW_TAGS)
+    load_all(small_engine, v2, incremental=True)
+
+    full = create_engine(f"sqlite:///{tmp_path / 'full.db'}")
+    load_all(full, v2)
+    expected = rollups(full)
+    full.dispose()
+    # la note remplacee de 2000 ne compte plus dans janvier 2000, ni le tag remplace
+    assert rollups(small_engine) == expected
+    with Session(small_engine) as db:
+        assert helpers.get_activity(db, granularity="year")[0] == {"bucket": YEAR_2000, "count": 1, "rating_mean": 3.0}
+        assert helpers.get_activity(db, source="tags", granularity="year") == [{"bucket": YEAR_2005, "count": 1, "rating_mean": None}]
+
+
+def test_series_match_the_ratings(engine):
+    with Session(engine) as db:
+        points = helpers.get_activity(db, granularity="year", movie_id=1)
+        total = db.query(models.Rating).filter(models.Rating.movieId == 1).count()
+        # le genre est compare sans tenir compte de la casse
+        assert helpers.get_activity(db, granularity="month", genre="comedy") == helpers.get_activity(db, granularity="month", genre="Comedy")
+        window = helpers.get_activity(db, granularity="day", start=YEAR_2005, end=YEAR_2005 + 30 * DAY)
+    assert sum(point["count"] for point in points) == total
+    assert window and all(YEAR_2005 <= point["bucket"] < YEAR_2005 + 30 * DAY for point in window)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"granularity": "week"},
+    {"source": "links"},
+    {"granularity": "day", "movie_id": 1},
+    {"movie_id": 1, "genre": "Comedy"},
+])
+def test_invalid_series(engine, kwargs):
+    with Session(engine) as db, pytest.raises(ValueError):
+        helpers.get_activity(db, **kwargs)
+
+
+def test_api_timeseries(client):
+    assert client.get("/timeseries", params={"granularity": "year"}).json()
+    assert client.get("/timeseries", params={"granularity": "day", "movie_id": 1}).status_code == 400
+    assert client.get("/timeseries", params={"granularity": "week"}).status_code == 422
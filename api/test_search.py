@@ -0,0 +1,39 @@
+"""Recherche plein texte des titres (index FTS5 movies_fts)
+
+Lancer depuis api/:  python -m pytest test_search.py
+"""
+import pytest
+from sqlalchemy.orm import Session
+
+import query_helpers as helpers
+
+
+def titles(engine, search: str) -> list:
+    with Session(engine) as db:
+        return [movie.title for movie in helpers.search_movies(db, search, limit=5)]
+
+
+def test_fts_query_quotes_every_word():
+    assert helpers.fts_query('toy sto') == '"toy"* "sto"*'
+    # la syntaxe FTS5 (guillemets, operateurs, colonnes) n'est jamais transmise telle quelle
+    assert helpers.fts_query('title:"toy" OR -story*') == '"title"* "toy"* "OR"* "story"*'
+
+
+def test_prefix_search(engine):
+    assert titles(engine, "toy sto")[0].startswith("Toy Story")
+
+
+def test_diacritics_are_ignored(engine):
+    assert any("Amélie" in title for title in titles(engine, "amelie poulain"))
+
+
+@pytest.mark.parametrize("search", ['"', 'NEAR(', "toy AND", "*", "^toy", "title:toy", "   ", "--"])
+def test_fts_syntax_does_not_reach_sqlite(engine, search):
+    # aucune erreur de syntaxe FTS5, quelle que soit la saisie
+    assert isinstance(titles(engine, search), list)
+
+
+def test_api_search(client):
+    assert client.get("/movies/search", params={"q": '"'}).json() == []
+    assert client.get("/movies/search", params={"q": ""}).status_code == 422
+    assert client.get("/movies/search", params={"q": "jumanji"}).json()[0]["movieId"] == 2
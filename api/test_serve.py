@@ -0,0 +1,150 @@
+"""Serveur pre-forke (serve.py): arret des workers
+
+Lancer depuis api/:  python -m pytest test_serve.py
+"""
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import serve
+
+SERVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_terminate_kills_and_reaps(monkeypatch):
+    # un worker qui ignore SIGTERM est tue apres le delai, et attendu: plus de zombie
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        time.sleep(60)
+        os._exit(0)
+    time.sleep(0.1)
+    workers = {pid}
+    serve.terminate(workers, timeout=0.2)
+    assert not workers and not alive(pid)
+
+
+def test_crash_budget():
+    budget = serve.CrashBudget(max_restarts=3, window=60)
+    assert [budget.delay(now) for now in (0, 1, 2)] == [serve.RESTART_DELAY, serve.RESTART_DELAY * 2, serve.RESTART_DELAY * 4]
+    assert budget.delay(3) is None
+    # plantages sortis de la fenetre: le budget se reconstitue
+    assert budget.delay(100) == serve.RESTART_DELAY
+
+
+def children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def start_server(engine, tmp_path, *options) -> subprocess.Popen:
+    os.symlink(engine.url.database, tmp_path / "movies.db")
+    env = dict(os.environ)
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return subprocess.Popen([sys.executable, SERVE_PATH, "--workers", "2", "--port", "0", "--log-level", "warning", *options],
+                            cwd=tmp_path, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+@pytest.mark.skipif(not os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children"), reason="Linux seulement")
+@pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM])
+def test_signal_during_startup_stops_the_workers(engine, tmp_path, signum):
+    # signal des le premier fork, avant que les workers ne soient prets
+    process = start_server(engine, tmp_path)
+    try:
+        deadline = time.monotonic() + 60
+        while not children(process.pid) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        workers = children(process.pid)
+        assert workers
+        process.send_signal(signum)
+        assert process.wait(timeout=30) == 0
+    finally:
+        process.kill()
+        process.stdout.close()
+    assert not any(alive(pid) for pid in workers)
+
+
+@pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM])
+def test_signal_stops_every_worker(engine, tmp_path, signum):
+    process = start_server(engine, tmp_path)
+    output = ""
+    try:
+        for line in process.stdout:
+            output += line
+            if "workers sur" in line:
+                break
+        workers = [int(pid) for pid in re.findall(r"^worker (\d+) +pret", output, re.MULTILINE)]
+        assert len(workers) == 2, output
+        process.send_signal(signum)
+        assert process.wait(timeout=30) == 0
+    finally:
+        process.kill()
+        process.stdout.close()
+    assert not any(alive(pid) for pid in workers)
+
+
+def wait_ready(process) -> list:
+    output = ""
+    for line in process.stdout:
+        output += line
+        if "workers sur" in line:
+            break
+    workers = [int(pid) for pid in re.findall(r"^worker (\d+) +pret", output, re.MULTILINE)]
+    assert len(workers) == 2, output
+    return workers
+
+
+@pytest.mark.skipif(not os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children"), reason="Linux seulement")
+def test_crash_loop_stops_the_server(engine, tmp_path):
+    # workers tues en boucle: relances jusqu'a la fin du budget, puis arret du serveur en erreur
+    process = start_server(engine, tmp_path, "--max-restarts", "2")
+    seen = set()
+    try:
+        wait_ready(process)
+        deadline = time.monotonic() + 30
+        while process.poll() is None and time.monotonic() < deadline:
+            workers = children(process.pid)
+            seen.update(workers)
+            serve.send_signal(workers, signal.SIGKILL)
+            time.sleep(0.05)
+        output = process.stdout.read()
+        assert process.wait(timeout=30) == 1, output
+    finally:
+        process.kill()
+        process.stdout.close()
+    assert "plus de 2 plantages" in output
+    assert not any(alive(pid) for pid in seen)
+
+
+@pytest.mark.skipif(not os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children"), reason="Linux seulement")
+def test_clean_exit_is_not_restarted(engine, tmp_path):
+    # SIGTERM envoye a un worker: arret normal (code 0), pas de relance
+    process = start_server(engine, tmp_path)
+    try:
+        first, second = wait_ready(process)
+        os.kill(first, signal.SIGTERM)
+        line = process.stdout.readline()
+        assert line.startswith(f"worker {first} arrete normalement"), line
+        assert children(process.pid) == [second]
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        process.kill()
+        process.stdout.close()
+    assert not alive(second)
@@ -0,0 +1,56 @@
+"""Index des films similaires (similarity.py) et GET /movies/{id}/similar
+
+Lancer depuis api/:  python -m pytest test_similarity.py
+"""
+import numpy as np
+import pytest
+
+import similarity
+
+
+@pytest.fixture(scope="module")
+def columns(engine):
+    return similarity.read_ratings(engine)
+
+
+def load_index(columns, tmp_path, k: int, **kwargs) -> similarity.SimilarityIndex:
+    path = str(tmp_path / f"similar_{k}.npy")
+    similarity.save(similarity.build_similarity(*columns, k=k, **kwargs), path)
+    return similarity.SimilarityIndex(path)
+
+
+def test_neighbors_are_ranked(columns, tmp_path):
+    index = load_index(columns, tmp_path, 10)
+    neighbors = index.neighbors(1)
+    scores = [score for _, score in neighbors]
+    assert index.k == 10 and len(neighbors) == 10
+    assert scores == sorted(scores, reverse=True) and all(0 < score <= 1 + 1e-5 for score in scores)
+    assert 1 not in [movie_id for movie_id, _ in neighbors]
+    assert index.neighbors(10**9) is None
+
+
+def test_cosine_of_identical_columns():
+    # deux films notes de la meme facon par les memes utilisateurs: similarite 1
+    users = np.array([1, 2, 1, 2, 3], dtype=np.int32)
+    movies = np.array([10, 10, 20, 20, 30], dtype=np.int32)
+    ratings = np.array([5, 1, 5, 1, 3], dtype=np.float32)
+    table = similarity.build_similarity(users, movies, ratings, k=2, method="cosine")
+    assert table["neighbors"][0][0] == 20 and table["scores"][0][0] == pytest.approx(1)
+    with pytest.raises(ValueError):
+        similarity.build_similarity(users, movies, ratings, method="pearson")
+
+
+@pytest.mark.parametrize("k", [5, 30])
+def test_api_limit_follows_the_index_k(client, columns, tmp_path, monkeypatch, k):
+    # la borne de `limit` est le k de l'index charge, pas similarity.DEFAULT_K
+    monkeypatch.setattr(similarity, "_index", load_index(columns, tmp_path, k))
+    assert len(client.get("/movies/1/similar", params={"limit": k}).json()) == k
+    response = client.get("/movies/1/similar", params={"limit": k + 1})
+    assert response.status_code == 400 and str(k) in response.json()["detail"]
+
+
+def test_api_errors(client, monkeypatch):
+    assert client.get("/movies/999999999/similar").status_code == 404
+    monkeypatch.setattr(similarity, "_index", None)
+    monkeypatch.setattr(similarity, "SIMILARITY_PATH", "/nonexistent/similar_movies.npy")
+    assert client.get("/movies/1/similar").status_code == 503
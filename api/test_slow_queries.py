@@ -0,0 +1,98 @@
+"""Journal des requetes SQL lentes (slow_queries.py): seuil, fonction appelante, plan et rapport
+
+Lancer depuis api/:  python -m pytest test_slow_queries.py
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+
+import database
+import query_helpers as helpers
+import slow_queries
+
+
+@pytest.fixture
+def logged(engine, tmp_path):
+    # moteur a part (les ecouteurs ne s'enlevent pas) sur la base de test, seuil nul: tout est journalise
+    slow_engine = create_engine(engine.url)
+    path = str(tmp_path / "slow.jsonl")
+    slow_queries.log_slow_queries(slow_engine, threshold_ms=0, path=path)
+    yield slow_engine, path
+    slow_engine.dispose()
+
+
+def test_only_helper_queries_are_logged(logged):
+    slow_engine, path = logged
+    with Session(slow_engine) as db:
+        helpers.get_movies_page(db, limit=5, genre="Comedy")
+        helpers.get_ratings(db, limit=5, min_rating=4.5)
+        db.execute(text("SELECT count(*) FROM ratings")) # hors de query_helpers: ignoree
+    slow_queries.flush()
+    entries = slow_queries.read_log(path)
+    assert [entry["helper"] for entry in entries] == ["get_movies_page > paginate", "get_ratings"]
+    assert all(entry["plan"] and not entry["plan"][0].startswith("EXPLAIN impossible") for entry in entries)
+    assert entries[0]["parameters"] and entries[0]["full_scan"] is False
+
+
+def test_plan_comes_from_the_logged_database(logged, tmp_path, monkeypatch):
+    # database.engine sur une base vide: EXPLAIN s'execute sur la base qui a execute la requete
+    empty = create_engine(f"sqlite:///{tmp_path / 'vide.db'}")
+    monkeypatch.setattr(database, "engine", empty)
+    slow_engine, path = logged
+    with Session(slow_engine) as db:
+        helpers.get_ratings(db, limit=5, min_rating=4.5)
+    slow_queries.flush()
+    empty.dispose()
+    [entry] = slow_queries.read_log(path)
+    assert entry["database"] == str(slow_engine.url) and not entry["plan"][0].startswith("EXPLAIN impossible")
+
+
+def test_async_engine_is_explained_with_pysqlite(engine):
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}")
+    explain_engine = slow_queries.explain_engine(async_engine.sync_engine)
+    assert not explain_engine.dialect.is_async and explain_engine.url.database == engine.url.database
+    assert slow_queries.explain("SELECT * FROM ratings WHERE movieId = ?", (1,), async_engine.sync_engine)
+    async_engine.sync_engine.dispose()
+
+
+def test_threshold(engine, tmp_path):
+    slow_engine = create_engine(engine.url)
+    path = tmp_path / "slow.jsonl"
+    slow_queries.log_slow_queries(slow_engine, threshold_ms=60_000, path=str(path))
+    with Session(slow_engine) as db:
+        helpers.get_movie_stats(db, 1)
+    slow_queries.flush()
+    slow_engine.dispose()
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("plan, full_scan", [
+    (["SCAN ratings"], True),
+    (["SEARCH ratings USING INDEX ix_ratings_movieId (movieId=?)"], False),
+    (["SCAN movies USING COVERING INDEX sqlite_autoindex_movies_1"], False),
+    (["SCAN movies_fts VIRTUAL TABLE INDEX 0:M1"], False),
+    (["CO-ROUTINE ranked", "  SCAN ranked"], False),
+])
+def test_is_full_scan(plan, full_scan):
+    assert slow_queries.is_full_scan(plan) is full_scan
+
+
+def test_statement_shape():
+    assert slow_queries.statement_shape("SELECT * FROM tags WHERE tag = 'it''s' AND movieId IN (1, 2,3)\n  LIMIT 10") == \
+        "SELECT * FROM tags WHERE tag = ? AND movieId IN (?, ...) LIMIT ?"
+
+
+def test_report_groups_by_shape(capsys):
+    entry = lambda helper, statement, duration: {"helper": helper, "statement": statement, "duration_ms": duration,
+                                                  "parameters": [], "plan": ["SCAN ratings"], "full_scan": True}
+    groups = slow_queries.group_entries([
+        entry("get_ratings", "SELECT * FROM ratings LIMIT 10", 5.0),
+        entry("get_ratings", "SELECT * FROM ratings LIMIT 20", 30.0),
+        entry("get_tags", "SELECT * FROM tags LIMIT 10", 20.0),
+    ])
+    assert [(group["helper"], group["count"], group["total_ms"]) for group in groups] == [("get_ratings", 2, 35.0), ("get_tags", 1, 20.0)]
+    assert groups[0]["slowest"]["duration_ms"] == 30.0
+    slow_queries.print_report(groups, top=1)
+    output = capsys.readouterr().out
+    assert "get_ratings: 2 fois" in output and "PARCOURS COMPLET" in output and "get_tags" not in output
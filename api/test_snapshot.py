@@ -0,0 +1,84 @@
+"""Backend colonne (snapshot.py): memes resultats que les fonctions SQLite de query_helpers
+
+Lancer depuis api/:  python -m pytest test_snapshot.py
+"""
+import pytest
+from sqlalchemy.orm import Session
+
+import query_helpers as helpers
+import snapshot
+
+
+@pytest.fixture(scope="module")
+def exported(engine, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    snapshot.export_snapshot(engine, directory)
+    return snapshot.Snapshot(directory)
+
+
+@pytest.fixture
+def db(engine, exported, monkeypatch):
+    monkeypatch.setattr(snapshot, "get_snapshot", lambda: exported)
+    with Session(engine) as db:
+        yield db
+
+
+def plain(result):
+    # objets ORM, tuples nommes de l'instantane et Row SQLAlchemy -> tuples comparables (les dicts restent des dicts)
+    if result is None or isinstance(result, (int, str, dict)):
+        return result
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], list):
+        return plain(result[0]), result[1] # page (lignes, curseur)
+    if isinstance(result, list):
+        return [plain(item) for item in result]
+    if hasattr(result, "__table__"):
+        return tuple(getattr(result, column.key) for column in result.__table__.columns)
+    return tuple(result)
+
+
+CALLS = {
+    "get_movie": lambda h, db: h.get_movie(db, 1),
+    "get_movie/absent": lambda h, db: h.get_movie(db, 10**9),
+    "get_movies/title": lambda h, db: h.get_movies(db, skip=2, limit=5, title="toy"),
+    "get_movies/genre casse": lambda h, db: h.get_movies(db, limit=50, genre="comedy|ROMANCE"),
+    "get_movies/genre any": lambda h, db: h.get_movies(db, limit=50, genre=["Film-Noir", "imax"], genre_match="any"),
+    "get_movies/genre repete": lambda h, db: h.get_movies(db, limit=50, genre="Drama|drama"),
+    "get_movies/sans genre": lambda h, db: h.get_movies(db, genre="(no genres listed)"),
+    "get_movies/genre inconnu": lambda h, db: h.get_movies(db, genre="Western|Nope"),
+    "get_movies_page": lambda h, db: h.get_movies_page(db, limit=20, genre="action|Sci-Fi"),
+    "get_movies_page/cursor": lambda h, db: h.get_movies_page(db, cursor=h.encode_cursor([500]), limit=20, genre="Horror",
+                                                              as_dicts=True, fields="title"),
+    "get_rating": lambda h, db: h.get_rating(db, 1, 1),
+    "get_user_rated_movie_ids": lambda h, db: h.get_user_rated_movie_ids(db, 1),
+    "get_ratings": lambda h, db: h.get_ratings(db, limit=10**6, min_rating=4.5),
+    "get_ratings_page": lambda h, db: h.get_ratings_page(db, cursor=h.encode_cursor([5, 10]), limit=10, as_dicts=True),
+    "get_tags": lambda h, db: h.get_tags(db, limit=10**6, movie_id=296),
+    "get_tags_page": lambda h, db: h.get_tags_page(db, limit=10, as_dicts=True),
+    "get_links_page": lambda h, db: h.get_links_page(db, cursor=h.encode_cursor([100]), limit=10),
+    "counts": lambda h, db: [h.get_movie_count(db), h.get_rating_count(db), h.get_tag_count(db), h.get_link_count(db)],
+    "iter_ratings": lambda h, db: [row for batch in h.iter_ratings(db, movie_id=1, min_rating=4, batch_size=7) for row in batch],
+    "iter_tags": lambda h, db: [row for batch in h.iter_tags(db, start=1500000000, batch_size=100) for row in batch],
+}
+# sans ORDER BY, SQLite renvoie les lignes dans l'ordre de l'index choisi: comparer l'ensemble des lignes
+UNORDERED = {"get_ratings", "get_tags", "iter_ratings", "iter_tags"}
+
+
+@pytest.mark.parametrize("name", CALLS)
+def test_same_results_as_sqlite(db, name):
+    expected, result = plain(CALLS[name](helpers, db)), plain(CALLS[name](snapshot, db))
+    if name in UNORDERED:
+        expected, result = sorted(expected), sorted(result)
+    assert result == expected
+
+
+def test_invalid_arguments(db):
+    with pytest.raises(ValueError):
+        snapshot.get_movies_page(db, cursor=helpers.encode_cursor(["1"]))
+    with pytest.raises(ValueError):
+        snapshot.get_movies(db, genre="Drama", genre_match="some")
+
+
+def test_no_import_cycle():
+    # snapshot.py ne depend pas de query_helpers: le remplacement des fonctions se fait depuis query_helpers seulement
+    assert "query_helpers" not in {getattr(value, "__name__", None) for value in vars(snapshot).values()}
+    assert snapshot.decode_cursor.__module__ == "query_params"
@@ -0,0 +1,56 @@
+"""Vocabulaire normalise des tags et index inverse terme -> films
+
+Lancer depuis api/:  python -m pytest test_tag_index.py
+"""
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+import models
+import query_helpers as helpers
+
+
+def test_normalize_tag():
+    assert models.normalize_tag("  Highly   Quotable ") == "highly quotable"
+    assert models.normalize_tag(None) == ""
+
+
+def test_index_matches_the_tags(engine):
+    with Session(engine) as db:
+        postings = Counter((models.normalize_tag(tag.tag), tag.movieId) for tag in db.query(models.Tag))
+        indexed = {(term, movie_id): count for term, movie_id, count in
+                   db.query(models.TagTerm.term, models.TagPosting.movieId, models.TagPosting.count)
+                   .join(models.TagPosting, models.TagPosting.term_id == models.TagTerm.id)}
+        usage = dict(db.query(models.TagTerm.term, models.TagTerm.usage_count))
+    assert indexed == dict(postings)
+    assert usage["funny"] == sum(count for (term, _), count in postings.items() if term == "funny")
+
+
+def test_autocomplete(engine):
+    with Session(engine) as db:
+        terms = helpers.autocomplete_tags(db, "  FU", limit=5)
+    assert terms and all(term.term.startswith("fu") for term in terms)
+    assert [term.usage_count for term in terms] == sorted((term.usage_count for term in terms), reverse=True)
+
+
+def test_movies_with_tag(engine):
+    with Session(engine) as db:
+        rows = helpers.get_movies_with_tag(db, "Funny", limit=100)
+        assert [count for _, count in rows] == sorted((count for _, count in rows), reverse=True)
+        assert rows == helpers.get_movies_with_tag(db, " funny ", limit=100)
+        assert helpers.get_movies_with_tag(db, "pas un tag connu") == []
+
+
+def test_movie_top_tags(engine):
+    with Session(engine) as db:
+        tags = helpers.get_movie_top_tags(db, 296, limit=3)
+        expected = Counter(models.normalize_tag(tag.tag) for tag in db.query(models.Tag).filter(models.Tag.movieId == 296))
+    assert len(tags) == 3 and tags[0]["count"] == max(expected.values())
+
+
+def test_api_tags(client):
+    assert client.get("/tags/autocomplete", params={"prefix": "fu"}).json()
+    movies = client.get("/tags/highly%20quotable/movies").json()
+    assert movies and {"movieId", "title", "genres", "count"} == set(movies[0])
+    assert client.get("/tags/autocomplete", params={"prefix": ""}).status_code == 422
+    assert len(client.get("/movies/296/tags/top", params={"limit": 2}).json()) == 2
@@ -2,9 +2,12 @@ import os
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
+from backend.metrics import command_listener
+
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGO_URI"))
+# command_listener: chaque commande est comptee et chronometree pour /metrics
+client = MongoClient(os.getenv("MONGO_URI"), event_listeners=[command_listener])
 db = client[os.getenv("DB_NAME")]
 collection = db[os.getenv("COLLECTION_NAME")]
 
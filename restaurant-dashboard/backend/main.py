@@ -1,10 +1,13 @@
 from fastapi import FastAPI, HTTPException
 from backend.database import get_collection
 from backend.ml_model import ml_model
+from backend.metrics import track_requests, metrics_response
 from bson import ObjectId
 import math
 
 app = FastAPI(title="Resto API By Irch Defluviaire", description="API pour le Dashboard Restaurant")
+# latence par route et commandes MongoDB par requete, exposees sur /metrics
+app.middleware("http")(track_requests)
 collection = get_collection()
 
 # Variable pour tracker l'état d'entraînement du modèle
@@ -19,6 +22,11 @@ def serialize_doc(doc):
 def read_root():
     return {"message": "API Resto en ligne"}
 
+# Metriques Prometheus
+@app.get("/metrics")
+def get_metrics():
+    return metrics_response()
+
 # 1. KPI Globaux
 @app.get("/api/stats/global")
 def get_global_stats():
@@ -0,0 +1,83 @@
+"""Metriques Prometheus du backend: latence par route et commandes MongoDB par requete HTTP"""
+import time
+from contextvars import ContextVar
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from pymongo import monitoring
+
+COMMAND_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REQUESTS = Counter("resto_http_requests_total", "Requetes HTTP par route et code de statut", ["method", "route", "status"])
+REQUEST_DURATION = Histogram("resto_http_request_duration_seconds", "Duree des requetes HTTP par route", ["method", "route"])
+COMMANDS_PER_REQUEST = Histogram("resto_mongo_commands_per_request", "Commandes MongoDB envoyees par requete HTTP", ["route"],
+                                 buckets=COMMAND_BUCKETS)
+MONGO_TIME_PER_REQUEST = Histogram("resto_mongo_time_per_request_seconds", "Temps passe dans MongoDB par requete HTTP", ["route"])
+COMMANDS = Counter("resto_mongo_commands_total", "Commandes MongoDB par nom et resultat", ["command", "outcome"])
+COMMAND_DURATION = Histogram("resto_mongo_command_duration_seconds", "Duree des commandes MongoDB", ["command"])
+
+
+class RequestStats:
+    """Compteurs MongoDB de la requete HTTP en cours"""
+    __slots__ = ("commands", "mongo_time")
+
+    def __init__(self):
+        self.commands = 0
+        self.mongo_time = 0.0
+
+# un objet par requete HTTP: les endpoints sync tournent dans un thread qui recoit une copie du contexte
+_request_stats = ContextVar("request_stats", default=None)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Ecouteur PyMongo: chaque commande (find, getMore, aggregate, count...) est comptee et chronometree"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "erreur")
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        COMMANDS.labels(event.command_name, outcome).inc()
+        COMMAND_DURATION.labels(event.command_name).observe(seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.mongo_time += seconds
+
+command_listener = CommandMetrics()
+
+
+def route_name(request: Request) -> str:
+    # le chemin declare (/api/ml/predict/{restaurant_id}) plutot que l'URL
+    route = request.scope.get("route")
+    return getattr(route, "path", "inconnue")
+
+
+async def track_requests(request: Request, call_next):
+    # middleware: duree, code de statut et commandes MongoDB de chaque requete
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _request_stats.reset(token)
+        route = route_name(request)
+        REQUESTS.labels(request.method, route, str(status)).inc()
+        REQUEST_DURATION.labels(request.method, route).observe(elapsed)
+        COMMANDS_PER_REQUEST.labels(route).observe(stats.commands)
+        MONGO_TIME_PER_REQUEST.labels(route).observe(stats.mongo_time)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
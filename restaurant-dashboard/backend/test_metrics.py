@@ -0,0 +1,63 @@
+"""Metriques Prometheus du backend (metrics.py): commandes MongoDB et middleware HTTP
+
+Lancer depuis restaurant-dashboard/:  python -m pytest backend/test_metrics.py
+"""
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from backend import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def command_event(name, micros):
+    # seuls command_name et duration_micros sont lus par l'ecouteur
+    return SimpleNamespace(command_name=name, duration_micros=micros)
+
+
+def test_succeeded_and_failed_commands():
+    before = {
+        "ok": sample("resto_mongo_commands_total", command="find", outcome="ok"),
+        "erreur": sample("resto_mongo_commands_total", command="find", outcome="erreur"),
+        "count": sample("resto_mongo_command_duration_seconds_count", command="find"),
+        "sum": sample("resto_mongo_command_duration_seconds_sum", command="find"),
+    }
+    metrics.command_listener.succeeded(command_event("find", 2000))
+    metrics.command_listener.failed(command_event("find", 500))
+    assert sample("resto_mongo_commands_total", command="find", outcome="ok") == before["ok"] + 1
+    assert sample("resto_mongo_commands_total", command="find", outcome="erreur") == before["erreur"] + 1
+    assert sample("resto_mongo_command_duration_seconds_count", command="find") == before["count"] + 2
+    assert abs(sample("resto_mongo_command_duration_seconds_sum", command="find") - before["sum"] - 0.0025) < 1e-9
+
+
+def test_middleware_counts_the_request_commands():
+    app = FastAPI()
+    app.middleware("http")(metrics.track_requests)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        # endpoint sync (thread du pool): les commandes arrivent sur les compteurs de la requete en cours
+        metrics.command_listener.succeeded(command_event("find", 1000))
+        metrics.command_listener.succeeded(command_event("getMore", 3000))
+        return {"id": item_id}
+
+    route = "/items/{item_id}"
+    requests = sample("resto_http_requests_total", method="GET", route=route, status="200")
+    durations = sample("resto_http_request_duration_seconds_count", method="GET", route=route)
+    commands = sample("resto_mongo_commands_per_request_sum", route=route)
+    mongo_time = sample("resto_mongo_time_per_request_seconds_sum", route=route)
+
+    with TestClient(app) as client:
+        assert client.get("/items/7").json() == {"id": 7}
+
+    # route declaree, pas l'URL
+    assert sample("resto_http_requests_total", method="GET", route=route, status="200") == requests + 1
+    assert sample("resto_http_request_duration_seconds_count", method="GET", route=route) == durations + 1
+    assert sample("resto_mongo_commands_per_request_sum", route=route) == commands + 2
+    assert abs(sample("resto_mongo_time_per_request_seconds_sum", route=route) - mongo_time - 0.004) < 1e-9
+    assert sample("resto_http_requests_total", method="GET", route="/items/7", status="200") == 0
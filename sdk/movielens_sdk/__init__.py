@@ -0,0 +1,5 @@
+"""SDK Python pour l'API MovieLens"""
+from .cache import ResponseCache
+from .client import AsyncMovieLensClient, MovieLensClient, MovieLensError
+
+__all__ = ["AsyncMovieLensClient", "MovieLensClient", "MovieLensError", "ResponseCache"]
@@ -0,0 +1,37 @@
+"""Cache disque des reponses de l'API MovieLens (revalidation par ETag)"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+class ResponseCache:
+    """Stocke le corps JSON et les validateurs (ETag, Last-Modified) de chaque reponse, un fichier par URL"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str):
+        # une entree illisible est traitee comme absente
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, body, etag=None, last_modified=None):
+        entry = {"key": key, "etag": etag, "last_modified": last_modified, "body": body}
+        # ecriture atomique: un lecteur concurrent ne voit jamais un fichier a moitie ecrit
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,365 @@
+"""Clients synchrone et asynchrone de l'API MovieLens"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import quote, urlencode
+
+import httpx
+
+from .cache import ResponseCache
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+DEFAULT_TIMEOUT = 10.0
+MAX_CONNECTIONS = 10
+
+
+class MovieLensError(Exception):
+    """Erreur renvoyee par l'API (statut HTTP >= 400)"""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _clean(params: Optional[dict]) -> dict:
+    # retirer les parametres non renseignes
+    return {name: value for name, value in (params or {}).items() if value is not None}
+
+
+def _join(values) -> Optional[str]:
+    # ["title", "genres"] -> "title,genres" (parametres fields / include)
+    if values is None or isinstance(values, str):
+        return values
+    return ",".join(values)
+
+
+class _BaseClient:
+    # logique commune aux deux clients: cle de cache, en-tetes conditionnels, lecture des reponses
+
+    def __init__(self, base_url: str, cache_dir: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+
+    def _cache_key(self, path: str, params: dict) -> str:
+        # un meme cache_dir peut servir a plusieurs serveurs: la cle porte l'URL de base
+        return f"{self.base_url}{path}?{urlencode(sorted(params.items()), doseq=True)}"
+
+    def _cached(self, key: str):
+        return self.cache.get(key) if self.cache else None
+
+    def _conditional_headers(self, entry) -> dict:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _read(self, response: httpx.Response, key: str, entry):
+        # 304: la copie locale est toujours valide
+        if response.status_code == 304 and entry:
+            return entry["body"]
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise MovieLensError(response.status_code, detail)
+        body = response.json()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.cache and (etag or last_modified):
+            self.cache.set(key, body, etag, last_modified)
+        return body
+
+    @staticmethod
+    def _movie_params(fields, include, max_ratings, max_tags) -> dict:
+        return {"fields": _join(fields), "include": _join(include), "max_ratings": max_ratings, "max_tags": max_tags}
+
+
+class MovieLensClient(_BaseClient):
+    """Client synchrone: une seule connexion HTTP persistante (pool httpx) pour toutes les requetes
+
+    >>> with MovieLensClient("http://127.0.0.1:8000", cache_dir=".movielens_cache") as client:
+    ...     for rating in client.iter_ratings(min_rating=4.5):
+    ...         ...
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = DEFAULT_TIMEOUT,
+                 max_connections: int = MAX_CONNECTIONS, cache_dir: Optional[str] = None, transport=None):
+        super().__init__(base_url, cache_dir)
+        self._http = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    def close(self):
+        self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, path: str, params: Optional[dict] = None):
+        """GET sur l'API, revalide avec l'ETag de la copie locale si le cache est active"""
+        params = _clean(params)
+        key = self._cache_key(path, params)
+        entry = self._cached(key)
+        response = self._http.get(path, params=params, headers=self._conditional_headers(entry))
+        return self._read(response, key, entry)
+
+    def paginate(self, path: str, params: Optional[dict] = None):
+        """Parcourir toutes les pages d'une liste: la page suivante est telechargee pendant que la page courante est lue"""
+        params = _clean(params)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = self.get(path, params)
+            while True:
+                next_cursor = page.get("next_cursor")
+                future = executor.submit(self.get, path, {**params, "cursor": next_cursor}) if next_cursor else None
+                try:
+                    yield from page["items"]
+                except GeneratorExit:
+                    if future is not None:
+                        future.cancel()
+                    raise
+                if future is None:
+                    return
+                page = future.result()
+
+    def stream_lines(self, path: str, params: Optional[dict] = None):
+        """Lire un export NDJSON ligne par ligne, sans le charger entierement en memoire"""
+        with self._http.stream("GET", path, params=_clean({**(params or {}), "format": "ndjson"})) as response:
+            if response.status_code >= 400:
+                response.read()
+                raise MovieLensError(response.status_code, response.text)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    # -- Films --
+    def health(self):
+        return self.get("/")
+
+    def get_movie(self, movie_id: int, fields=None, include=None, max_ratings: Optional[int] = None, max_tags: Optional[int] = None):
+        return self.get(f"/movies/{movie_id}", self._movie_params(fields, include, max_ratings, max_tags))
+
+    def get_movies(self, movie_ids: List[int], fields=None, include=None, max_ratings: Optional[int] = None, max_tags: Optional[int] = None):
+        return self.get("/movies/batch", {"ids": list(movie_ids), **self._movie_params(fields, include, max_ratings, max_tags)})
+
+    def search_movies(self, q: str, limit: int = 20):
+        return self.get("/movies/search", {"q": q, "limit": limit})
+
+    def top_movies(self, order_by: str = "weighted", genre: Optional[str] = None, year: Optional[int] = None,
+                   min_count: int = 0, limit: int = 10):
+        return self.get("/movies/top", {"order_by": order_by, "genre": genre, "year": year, "min_count": min_count, "limit": limit})
+
+    def get_movie_stats(self, movie_id: int):
+        return self.get(f"/movies/{movie_id}/stats")
+
+    def similar_movies(self, movie_id: int, limit: int = 10):
+        return self.get(f"/movies/{movie_id}/similar", {"limit": limit})
+
+    def iter_movies(self, title: Optional[str] = None, genre=None, genre_match: str = "all", fields=None, page_size: int = 1000):
+        return self.paginate("/movies", {"title": title, "genre": genre, "genre_match": genre_match, "fields": _join(fields), "limit": page_size})
+
+    # -- Evaluations, tags, liens --
+    def iter_ratings(self, min_rating: Optional[float] = None, page_size: int = 1000):
+        return self.paginate("/ratings", {"min_rating": min_rating, "limit": page_size})
+
+    def iter_tags(self, movie_id: Optional[int] = None, page_size: int = 1000):
+        return self.paginate("/tags", {"movie_id": movie_id, "limit": page_size})
+
+    def iter_links(self, page_size: int = 1000):
+        return self.paginate("/links", {"limit": page_size})
+
+    def autocomplete_tags(self, prefix: str, limit: int = 10):
+        return self.get("/tags/autocomplete", {"prefix": prefix, "limit": limit})
+
+    def movies_with_tag(self, tag: str, limit: int = 20):
+        return self.get(f"/tags/{quote(tag, safe='')}/movies", {"limit": limit})
+
+    def movie_top_tags(self, movie_id: int, limit: int = 10):
+        return self.get(f"/movies/{movie_id}/tags/top", {"limit": limit})
+
+    # -- Statistiques globales --
+    def stats_summary(self):
+        return self.get("/stats/summary")
+
+    def stats_histogram(self):
+        return self.get("/stats/histogram")
+
+    def stats_genres(self):
+        return self.get("/stats/genres")
+
+    def stats_years(self):
+        return self.get("/stats/years")
+
+    def stats_top_users(self, limit: int = 10):
+        return self.get("/stats/users/top", {"limit": limit})
+
+    # -- Recommandations --
+    def recommendations(self, user_id: int, limit: int = 10):
+        return self.get(f"/users/{user_id}/recommendations", {"limit": limit})
+
+    # -- Series temporelles --
+    def timeseries(self, source: str = "ratings", granularity: str = "month", start: Optional[int] = None,
+                   end: Optional[int] = None, movie_id: Optional[int] = None, genre: Optional[str] = None):
+        return self.get("/timeseries", {"source": source, "granularity": granularity, "start": start, "end": end,
+                                        "movie_id": movie_id, "genre": genre})
+
+    def export_ratings(self, movie_id: Optional[int] = None, min_rating: Optional[float] = None,
+                       start: Optional[int] = None, end: Optional[int] = None):
+        return self.stream_lines("/export/ratings", {"movie_id": movie_id, "min_rating": min_rating, "start": start, "end": end})
+
+    def export_tags(self, movie_id: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None):
+        return self.stream_lines("/export/tags", {"movie_id": movie_id, "start": start, "end": end})
+
+
+class AsyncMovieLensClient(_BaseClient):
+    """Client asyncio: memes methodes que MovieLensClient, a attendre avec await (iter_* sont des iterateurs async)
+
+    >>> async with AsyncMovieLensClient(cache_dir=".movielens_cache") as client:
+    ...     movies = await asyncio.gather(*(client.get_movie(i) for i in range(1, 50)))
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = DEFAULT_TIMEOUT,
+                 max_connections: int = MAX_CONNECTIONS, cache_dir: Optional[str] = None, transport=None):
+        super().__init__(base_url, cache_dir)
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get(self, path: str, params: Optional[dict] = None):
+        params = _clean(params)
+        key = self._cache_key(path, params)
+        if self.cache is None:
+            response = await self._http.get(path, params=params)
+            return self._read(response, key, None)
+        # lecture et ecriture du cache disque dans un thread: ne pas bloquer la boucle d'evenements
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, self._cached, key)
+        response = await self._http.get(path, params=params, headers=self._conditional_headers(entry))
+        return await loop.run_in_executor(None, self._read, response, key, entry)
+
+    async def paginate(self, path: str, params: Optional[dict] = None):
+        params = _clean(params)
+        page = await self.get(path, params)
+        while True:
+            next_cursor = page.get("next_cursor")
+            task = asyncio.ensure_future(self.get(path, {**params, "cursor": next_cursor})) if next_cursor else None
+            try:
+                for item in page["items"]:
+                    yield item
+            except BaseException:
+                # iteration interrompue (aclose, annulation): ne pas laisser la requete de prefetch orpheline
+                if task is not None:
+                    task.cancel()
+                raise
+            if task is None:
+                return
+            page = await task
+
+    async def stream_lines(self, path: str, params: Optional[dict] = None):
+        async with self._http.stream("GET", path, params=_clean({**(params or {}), "format": "ndjson"})) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise MovieLensError(response.status_code, response.text)
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    # -- Films --
+    async def health(self):
+        return await self.get("/")
+
+    async def get_movie(self, movie_id: int, fields=None, include=None, max_ratings: Optional[int] = None, max_tags: Optional[int] = None):
+        return await self.get(f"/movies/{movie_id}", self._movie_params(fields, include, max_ratings, max_tags))
+
+    async def get_movies(self, movie_ids: List[int], fields=None, include=None, max_ratings: Optional[int] = None, max_tags: Optional[int] = None):
+        return await self.get("/movies/batch", {"ids": list(movie_ids), **self._movie_params(fields, include, max_ratings, max_tags)})
+
+    async def search_movies(self, q: str, limit: int = 20):
+        return await self.get("/movies/search", {"q": q, "limit": limit})
+
+    async def top_movies(self, order_by: str = "weighted", genre: Optional[str] = None, year: Optional[int] = None,
+                         min_count: int = 0, limit: int = 10):
+        return await self.get("/movies/top", {"order_by": order_by, "genre": genre, "year": year, "min_count": min_count, "limit": limit})
+
+    async def get_movie_stats(self, movie_id: int):
+        return await self.get(f"/movies/{movie_id}/stats")
+
+    async def similar_movies(self, movie_id: int, limit: int = 10):
+        return await self.get(f"/movies/{movie_id}/similar", {"limit": limit})
+
+    def iter_movies(self, title: Optional[str] = None, genre=None, genre_match: str = "all", fields=None, page_size: int = 1000):
+        return self.paginate("/movies", {"title": title, "genre": genre, "genre_match": genre_match, "fields": _join(fields), "limit": page_size})
+
+    # -- Evaluations, tags, liens --
+    def iter_ratings(self, min_rating: Optional[float] = None, page_size: int = 1000):
+        return self.paginate("/ratings", {"min_rating": min_rating, "limit": page_size})
+
+    def iter_tags(self, movie_id: Optional[int] = None, page_size: int = 1000):
+        return self.paginate("/tags", {"movie_id": movie_id, "limit": page_size})
+
+    def iter_links(self, page_size: int = 1000):
+        return self.paginate("/links", {"limit": page_size})
+
+    async def autocomplete_tags(self, prefix: str, limit: int = 10):
+        return await self.get("/tags/autocomplete", {"prefix": prefix, "limit": limit})
+
+    async def movies_with_tag(self, tag: str, limit: int = 20):
+        return await self.get(f"/tags/{quote(tag, safe='')}/movies", {"limit": limit})
+
+    async def movie_top_tags(self, movie_id: int, limit: int = 10):
+        return await self.get(f"/movies/{movie_id}/tags/top", {"limit": limit})
+
+    # -- Statistiques globales --
+    async def stats_summary(self):
+        return await self.get("/stats/summary")
+
+    async def stats_histogram(self):
+        return await self.get("/stats/histogram")
+
+    async def stats_genres(self):
+        return await self.get("/stats/genres")
+
+    async def stats_years(self):
+        return await self.get("/stats/years")
+
+    async def stats_top_users(self, limit: int = 10):
+        return await self.get("/stats/users/top", {"limit": limit})
+
+    # -- Recommandations --
+    async def recommendations(self, user_id: int, limit: int = 10):
+        return await self.get(f"/users/{user_id}/recommendations", {"limit": limit})
+
+    # -- Series temporelles --
+    async def timeseries(self, source: str = "ratings", granularity: str = "month", start: Optional[int] = None,
+                         end: Optional[int] = None, movie_id: Optional[int] = None, genre: Optional[str] = None):
+        return await self.get("/timeseries", {"source": source, "granularity": granularity, "start": start, "end": end,
+                                              "movie_id": movie_id, "genre": genre})
+
+    def export_ratings(self, movie_id: Optional[int] = None, min_rating: Optional[float] = None,
+                       start: Optional[int] = None, end: Optional[int] = None):
+        return self.stream_lines("/export/ratings", {"movie_id": movie_id, "min_rating": min_rating, "start": start, "end": end})
+
+    def export_tags(self, movie_id: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None):
+        return self.stream_lines("/export/tags", {"movie_id": movie_id, "start": start, "end": end})
@@ -0,0 +1,84 @@
+"""Clients du SDK contre une API simulee (httpx.MockTransport)
+
+Lancer depuis sdk/:  python -m pytest test_client.py
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from movielens_sdk import AsyncMovieLensClient, MovieLensClient, MovieLensError
+
+ETAG = 'W/"v1"'
+ITEMS = [{"movieId": movie_id} for movie_id in range(1, 8)]
+
+
+class FakeAPI:
+    """Liste /movies paginee par 3, /movies/{id} avec ETag, erreurs 404"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/movies":
+            start = int(request.url.params.get("cursor", 0))
+            limit = int(request.url.params["limit"])
+            next_cursor = str(start + limit) if start + limit < len(ITEMS) else None
+            return httpx.Response(200, json={"items": ITEMS[start:start + limit], "next_cursor": next_cursor})
+        if request.url.path == "/movies/1":
+            if request.headers.get("if-none-match") == ETAG:
+                return httpx.Response(304, headers={"ETag": ETAG})
+            return httpx.Response(200, json={"movieId": 1}, headers={"ETag": ETAG})
+        return httpx.Response(404, json={"detail": "introuvable"})
+
+
+@pytest.fixture
+def api():
+    return FakeAPI()
+
+
+def test_paginate_follows_cursors(api):
+    with MovieLensClient(transport=httpx.MockTransport(api)) as client:
+        assert list(client.iter_movies(page_size=3)) == ITEMS
+    assert [request.url.params.get("cursor") for request in api.requests] == [None, "3", "6"]
+
+
+def test_cache_revalidates_with_etag(api, tmp_path):
+    with MovieLensClient(transport=httpx.MockTransport(api), cache_dir=str(tmp_path)) as client:
+        assert client.get_movie(1) == {"movieId": 1}
+        # deuxieme lecture: requete conditionnelle, 304 et corps lu dans le cache
+        assert client.get_movie(1) == {"movieId": 1}
+    assert [request.headers.get("if-none-match") for request in api.requests] == [None, ETAG]
+
+
+def test_error(api):
+    with MovieLensClient(transport=httpx.MockTransport(api)) as client, pytest.raises(MovieLensError) as error:
+        client.get_movie(2)
+    assert error.value.status_code == 404 and error.value.detail == "introuvable"
+
+
+def test_async_client(api, tmp_path):
+    async def run():
+        async with AsyncMovieLensClient(transport=httpx.MockTransport(api), cache_dir=str(tmp_path)) as client:
+            items = [item async for item in client.iter_movies(page_size=3)]
+            movies = await asyncio.gather(client.get_movie(1), client.get_movie(1))
+            return items, movies
+
+    items, movies = asyncio.run(run())
+    assert items == ITEMS and movies == [{"movieId": 1}] * 2
+
+
+def test_cache_key_includes_base_url(tmp_path):
+    # deux serveurs, un seul cache_dir: pas de corps servi d'un serveur a l'autre
+    def server(movie_id):
+        def handler(request):
+            if request.headers.get("if-none-match") == ETAG:
+                return httpx.Response(304, headers={"ETag": ETAG})
+            return httpx.Response(200, json={"movieId": movie_id}, headers={"ETag": ETAG})
+        return httpx.MockTransport(handler)
+
+    with MovieLensClient("http://a", transport=server(1), cache_dir=str(tmp_path)) as client:
+        assert client.get_movie(1) == {"movieId": 1}
+    with MovieLensClient("http://b", transport=server(2), cache_dir=str(tmp_path)) as client:
+        assert client.get_movie(1) == {"movieId": 2}